@@ -2,56 +2,112 @@
 Конвертация аудио файлов для распознавания
 """
 
+import hashlib
 import os
-from pydub import AudioSegment
+import subprocess
+import uuid
+import wave
+import metrics
+import tracing
 from config import Config
 
-def convert_to_wav(input_file, output_file=None):
+
+# Формат, который уходит в Shazam: mono 16-bit 44.1kHz
+TARGET_RATE = 44100
+TARGET_CHANNELS = 1
+
+
+def convert_to_wav(input_file, output_file=None, content_hash=None):
     """
     Конвертирует аудио файл в WAV формат для распознавания
-    
-    Поддерживаемые форматы: webm, mp3, m4a, ogg, flac
+
+    Поддерживаемые форматы: webm, mp3, m4a, ogg, flac (всё, что читает ffmpeg).
+    Без output_file результат кладётся в кеш CONVERSIONS_DIR по хешу
+    содержимого: повторная конвертация того же файла - просто чтение кеша.
     """
-    try:
-        # Определяем формат по расширению
-        ext = os.path.splitext(input_file)[1].lower().lstrip('.')
-        
-        if ext == 'wav':
-            # Уже WAV, возвращаем как есть
-            return input_file
-        
-        # Если выходной файл не указан, создаем рядом
-        if output_file is None:
-            output_file = os.path.splitext(input_file)[0] + '.wav'
-        
-        print(f"Конвертация {ext} -> wav: {input_file}")
-        
-        # Загружаем аудио
-        if ext == 'webm':
-            audio = AudioSegment.from_file(input_file, format="webm")
-        elif ext == 'mp3':
-            audio = AudioSegment.from_mp3(input_file)
-        elif ext == 'm4a':
-            audio = AudioSegment.from_file(input_file, format="m4a")
-        elif ext == 'ogg':
-            audio = AudioSegment.from_ogg(input_file)
-        elif ext == 'flac':
-            audio = AudioSegment.from_file(input_file, format="flac")
-        else:
-            # Пробуем автоматически определить
-            audio = AudioSegment.from_file(input_file)
-        
-        # Конвертируем в моно, 44.1kHz для лучшей совместимости с Shazam
-        audio = audio.set_channels(1)
-        audio = audio.set_frame_rate(44100)
-        
-        # Экспортируем в WAV
-        audio.export(output_file, format="wav")
-        
-        print(f"Конвертация завершена: {output_file}")
+    with metrics.timed('convert'), tracing.span('convert_to_wav', source=input_file) as span:
+        if os.path.exists(input_file):
+            span.set(bytes=os.path.getsize(input_file))
+        output_file = _convert_to_wav(input_file, output_file, content_hash, span)
+        span.set(output=output_file)
         return output_file
-        
-    except Exception as e:
+
+
+def _convert_to_wav(input_file, output_file, content_hash, span):
+    # Определяем формат по расширению
+    ext = os.path.splitext(input_file)[1].lower().lstrip('.')
+
+    if ext == 'wav':
+        # Уже WAV, возвращаем как есть
+        return input_file
+
+    if not os.path.exists(input_file):
+        raise Exception(f"Не удалось конвертировать файл: {input_file} не найден")
+
+    if output_file is not None:
+        _ffmpeg_to_wav(input_file, output_file)
+        return output_file
+
+    content_hash = content_hash or _file_sha256(input_file)
+    cached = conversion_cache_path(content_hash)
+    if os.path.exists(cached):
+        # Обновляем время доступа - кеш вытесняется по LRU
+        os.utime(cached)
+        span.set(cache='hit')
+        print(f"Конвертация из кеша: {cached}")
+        return cached
+
+    span.set(cache='miss')
+    print(f"Конвертация {ext} -> wav: {input_file}")
+    _ffmpeg_to_wav(input_file, cached)
+    print(f"Конвертация завершена: {cached}")
+    return cached
+
+
+def conversion_cache_path(content_hash, rate=TARGET_RATE, channels=TARGET_CHANNELS):
+    """Путь в кеше: хеш исходника + параметры целевого формата"""
+    return os.path.join(Config.CONVERSIONS_DIR, f"{content_hash}_{rate}_{channels}ch.wav")
+
+
+def _ffmpeg_to_wav(input_file, output_file, rate=TARGET_RATE, channels=TARGET_CHANNELS):
+    """
+    Один проход ffmpeg: декодирование, даунмикс и ресемплинг потоком,
+    без загрузки всего файла в память. Пишем во временный файл и
+    атомарно переименовываем, чтобы в кеше не было недописанных WAV.
+    """
+    tmp_path = f"{output_file}.{uuid.uuid4().hex[:8]}.part"
+    try:
+        result = subprocess.run(
+            ['ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error', '-y',
+             '-i', input_file, '-vn', '-ac', str(channels), '-ar', str(rate),
+             '-sample_fmt', 's16', '-f', 'wav', tmp_path],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+    except OSError as e:
         print(f"Ошибка конвертации: {e}")
         raise Exception(f"Не удалось конвертировать файл: {e}")
 
+    if result.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        message = result.stderr.decode(errors='replace').strip()[-300:]
+        print(f"Ошибка конвертации: {message}")
+        raise Exception(f"Не удалось конвертировать файл: {message}")
+    os.replace(tmp_path, output_file)
+
+
+def _file_sha256(path, chunk_size=65536):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def wav_duration(path):
+    """Длительность WAV в секундах по заголовку (None, если это не WAV)"""
+    try:
+        with wave.open(path, 'rb') as wf:
+            return wf.getnframes() / float(wf.getframerate())
+    except (wave.Error, EOFError, OSError):
+        return None
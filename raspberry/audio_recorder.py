@@ -1,73 +1,132 @@
 import pyaudio
 import wave
 import os
-import struct
+import time
+import uuid
 from datetime import datetime
+import numpy as np
 from config import Config
+from device_registry import DeviceRegistry
+from resample import PolyphaseResampler, int32_frames, live_channel, to_float, to_int16, to_recognition_format
+import metrics
+import tracing
 
 class AudioRecorder:
-    def __init__(self, input_device_index=None):
+    def __init__(self, input_device_index=None, registry=None, native=None):
         self.chunk = 1024
+        # Формат результата (WAV и блоки listen) - то, что ждёт Shazam
         self.sample_format = pyaudio.paInt16
         self.channels = 1
         self.rate = 44100
+        # Формат захвата: нативный у I2S-микрофона или сразу результат (plug-слой ALSA)
+        self.native = Config.CAPTURE_NATIVE if native is None else native
+        if self.native:
+            self.capture_format = pyaudio.paInt32
+            self.capture_channels = Config.CAPTURE_CHANNELS
+            self.capture_rate = Config.CAPTURE_RATE
+        else:
+            self.capture_format = self.sample_format
+            self.capture_channels = self.channels
+            self.capture_rate = self.rate
         self.input_device_index = input_device_index
+        self.registry = registry or DeviceRegistry()
         
-    def list_input_devices(self):
-        """Список доступных входных устройств"""
-        audio = pyaudio.PyAudio()
-        devices = []
+    def list_input_devices(self, refresh=False):
+        """Список доступных входных устройств (из кеша реестра)"""
+        if refresh:
+            self.registry.refresh()
+        devices = self.registry.devices()
         
         print("\nДоступные аудио устройства:")
-        for i in range(audio.get_device_count()):
-            info = audio.get_device_info_by_index(i)
-            if info['maxInputChannels'] > 0:
-                devices.append({
-                    'index': i,
-                    'name': info['name'],
-                    'channels': info['maxInputChannels'],
-                    'rate': info['defaultSampleRate']
-                })
-                print(f"  [{i}] {info['name']} - {info['maxInputChannels']} каналов")
+        for device in devices:
+            print(f"  [{device['index']}] {device['name']} - {device['channels']} каналов")
         
-        audio.terminate()
         return devices
     
     def find_default_input_device(self):
-        """Находит устройство по умолчанию"""
-        audio = pyaudio.PyAudio()
-        try:
-            default_device = audio.get_default_input_device_info()
-            device_index = default_device['index']
-            print(f"Используется устройство по умолчанию: [{device_index}] {default_device['name']}")
-            return device_index
-        except Exception as e:
-            print(f"Ошибка получения устройства по умолчанию: {e}")
-            # Пробуем найти любое устройство с входом
-            for i in range(audio.get_device_count()):
-                info = audio.get_device_info_by_index(i)
-                if info['maxInputChannels'] > 0:
-                    print(f"Используется устройство: [{i}] {info['name']}")
-                    return i
-            return None
-        finally:
-            audio.terminate()
+        """Находит устройство по умолчанию (из кеша реестра)"""
+        device_index = self.registry.default_index()
+        if device_index is None:
+            print("Ошибка получения устройства по умолчанию: нет устройств ввода")
+        return device_index
     
     def check_audio_level(self, audio_data_bytes):
-        """Проверяет уровень звука в записанных данных"""
+        """Проверяет уровень звука в записанных данных (формат захвата)"""
         try:
-            chunk_size = len(audio_data_bytes) // 2  # 2 bytes per sample (16-bit)
-            audio_data = struct.unpack(f'{chunk_size}h', audio_data_bytes)
-            max_level = max(abs(sample) for sample in audio_data)
-            # Максимальное значение для 16-bit: 32768
-            level_percent = (max_level / 32768.0) * 100
-            return level_percent
+            if self.native:
+                samples, full_scale = np.frombuffer(audio_data_bytes, dtype='<i4'), 2.0 ** 31
+            else:
+                samples, full_scale = np.frombuffer(audio_data_bytes, dtype='<i2'), 32768.0
+            if not len(samples):
+                return 0.0
+            max_level = float(np.abs(samples.astype(np.float32)).max())
+            return (max_level / full_scale) * 100
         except Exception as e:
             print(f"Ошибка проверки уровня: {e}")
             return 0.0
+
+    def _open_stream(self, audio, device_index):
+        return audio.open(
+            format=self.capture_format,
+            channels=self.capture_channels,
+            rate=self.capture_rate,
+            frames_per_buffer=self.chunk,
+            input=True,
+            input_device_index=device_index
+        )
+
+    def convert(self, raw):
+        """Весь захваченный клип -> mono int16 на self.rate одним батчем"""
+        if not self.native:
+            return np.frombuffer(raw, dtype=np.int16)
+        samples, _ = to_recognition_format(raw, self.capture_channels, self.capture_rate, self.rate)
+        return samples
         
+    def listen(self, block_seconds=1.0, should_continue=None):
+        """
+        Непрерывный захват без сохранения: генератор блоков int16 (numpy)
+        по block_seconds. Поток открывается один раз и закрывается при выходе.
+        """
+        device_index = self.input_device_index
+        if device_index is None:
+            device_index = self.find_default_input_device()
+            if device_index is None:
+                raise Exception("Не найдено устройство ввода")
+
+        audio = pyaudio.PyAudio()
+        resampler = None
+        if self.native and self.capture_rate != self.rate:
+            # Один ресемплер на весь поток: хвост фильтра переходит между блоками
+            resampler = PolyphaseResampler(self.capture_rate, self.rate)
+        try:
+            stream = self._open_stream(audio, device_index)
+            try:
+                frames_per_block = int(self.capture_rate * block_seconds)
+                while should_continue is None or should_continue():
+                    data = stream.read(frames_per_block, exception_on_overflow=False)
+                    if not self.native:
+                        yield np.frombuffer(data, dtype=np.int16)
+                        continue
+                    frames = int32_frames(data, self.capture_channels)
+                    x = to_float(frames[:, live_channel(frames)])
+                    if resampler is not None:
+                        x = resampler.process(x)
+                    yield to_int16(x)
+            finally:
+                stream.stop_stream()
+                stream.close()
+        finally:
+            audio.terminate()
+
     def record(self, duration=Config.RECORDING_DURATION, should_continue=None):
-        """Записывает аудио с микрофона"""
+        """Записывает аудио с микрофона; None - запись отменена"""
+        with tracing.span('record', duration=duration, native=self.native,
+                          capture_rate=self.capture_rate) as span:
+            filename = self._record(duration, should_continue)
+            span.set(cancelled=filename is None, path=filename)
+            return filename
+
+    def _record(self, duration, should_continue):
         audio = pyaudio.PyAudio()
         
         # Определяем устройство
@@ -81,22 +140,16 @@ class AudioRecorder:
         print(f"Запись {duration} секунд с устройства [{device_index}]...")
         
         try:
-            stream = audio.open(
-                format=self.sample_format,
-                channels=self.channels,
-                rate=self.rate,
-                frames_per_buffer=self.chunk,
-                input=True,
-                input_device_index=device_index
-            )
+            stream = self._open_stream(audio, device_index)
             
             frames = []
-            total_chunks = int(self.rate / self.chunk * duration)
+            total_chunks = int(self.capture_rate / self.chunk * duration)
             max_level_found = 0.0
             
             print("Начало записи...")
             
             cancelled = False
+            capture_start = time.perf_counter()
             for i in range(total_chunks):
                 try:
                     data = stream.read(self.chunk, exception_on_overflow=False)
@@ -106,8 +159,8 @@ class AudioRecorder:
                     if level > max_level_found:
                         max_level_found = level
 
-                    if i % (int(self.rate / self.chunk * 3)) == 0:
-                        elapsed = i * self.chunk / self.rate
+                    if i % (int(self.capture_rate / self.chunk * 3)) == 0:
+                        elapsed = i * self.chunk / self.capture_rate
                         print(f"  Запись... {elapsed:.1f}с (текущий уровень: {level:.1f}%, макс: {max_level_found:.1f}%)")
 
                     if should_continue is not None and not should_continue():
@@ -117,6 +170,7 @@ class AudioRecorder:
                 except Exception as e:
                     print(f"Ошибка чтения данных: {e}")
                     break
+            metrics.stage_seconds.observe(time.perf_counter() - capture_start, stage='capture')
             
             print(f"\nМаксимальный уровень звука за запись: {max_level_found:.1f}%")
             
@@ -142,22 +196,27 @@ class AudioRecorder:
                 raise Exception("Запись пустая - проверьте микрофон и уровень звука")
 
             print(f"Записано {total_bytes} байт данных")
+
+            with metrics.timed('resample'), tracing.span('resample', bytes=total_bytes):
+                samples = self.convert(b''.join(frames))
             
         except Exception as e:
             audio.terminate()
             raise Exception(f"Ошибка записи: {e}")
         
         # Сохраняем файл
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = os.path.join(Config.RECORDINGS_DIR, f"recording_{timestamp}.wav")
+        # Микросекунды и случайный суффикс: две записи за секунду не затирают друг друга
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        filename = os.path.join(Config.RECORDINGS_DIR, f"recording_{timestamp}_{uuid.uuid4().hex[:8]}.wav")
         
         try:
-            wf = wave.open(filename, 'wb')
-            wf.setnchannels(self.channels)
-            wf.setsampwidth(audio.get_sample_size(self.sample_format))
-            wf.setframerate(self.rate)
-            wf.writeframes(b''.join(frames))
-            wf.close()
+            with metrics.timed('save'), tracing.span('save_wav', bytes=samples.nbytes):
+                wf = wave.open(filename, 'wb')
+                wf.setnchannels(self.channels)
+                wf.setsampwidth(audio.get_sample_size(self.sample_format))
+                wf.setframerate(self.rate)
+                wf.writeframes(samples.tobytes())
+                wf.close()
             
             print(f"Запись сохранена: {filename}")
             return filename
@@ -0,0 +1,373 @@
+"""
+Выбор самого узнаваемого фрагмента записи: окна оцениваются по
+насыщенности спектра и стабильности атак (NumPy FFT), в Shazam уходит
+только лучшее окно вместо всей записи
+"""
+
+import collections
+import contextvars
+import io
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import metrics
+import tracing
+from config import Config
+
+
+FRAME = 2048  # отсчётов на кадр FFT
+HOP = 1024
+BAND_EDGES_HZ = np.geomspace(100, 8000, 25)  # 24 логарифмические полосы
+RICHNESS_DB = 30  # полоса «звучит», если она не тише самой громкой на столько dB
+ACTIVE_RMS = 0.003  # кадры тише считаются паузой (как в PcmStats)
+BEAT_LAGS_SECONDS = (0.25, 1.5)  # период атак, который ищем в автокорреляции
+
+# Ответы обоих распознавателей, означающие «звук разобран, трек не найден»
+MISS_ERRORS = ('Трек не найден', 'Данные трека отсутствуют', 'Трек не распознан')
+
+
+def load_wav(source):
+    """
+    WAV (путь или файловый объект) -> (mono int16 отсчёты, частота).
+    Многоканальный звук усредняется, 32-bit приводится к 16-bit.
+    """
+    with wave.open(source, 'rb') as wf:
+        rate = wf.getframerate()
+        channels = wf.getnchannels()
+        width = wf.getsampwidth()
+        raw = wf.readframes(wf.getnframes())
+
+    if width == 2:
+        samples = np.frombuffer(raw, dtype=np.int16)
+    elif width == 4:
+        samples = (np.frombuffer(raw, dtype=np.int32) >> 16).astype(np.int16)
+    else:
+        raise ValueError(f"Неподдерживаемая разрядность WAV: {width * 8} bit")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, rate
+
+
+def frame_features(samples, rate):
+    """
+    Покадровые признаки:
+    - richness: доля полос 100 Гц - 8 кГц в пределах RICHNESS_DB от самой громкой
+      (музыка заполняет спектр, речь и стук - узкие или короткие);
+    - flux: положительный спектральный поток, огибающая атак;
+    - active: кадр громче ACTIVE_RMS.
+    """
+    x = samples.astype(np.float32) / 32768.0
+    if len(x) < FRAME:
+        x = np.pad(x, (0, FRAME - len(x)))
+    n_frames = 1 + (len(x) - FRAME) // HOP
+    frames = np.lib.stride_tricks.as_strided(
+        x, shape=(n_frames, FRAME), strides=(x.strides[0] * HOP, x.strides[0])
+    )
+
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FRAME).astype(np.float32), axis=1))
+    freqs = np.fft.rfftfreq(FRAME, 1.0 / rate)
+    edges = np.searchsorted(freqs, BAND_EDGES_HZ)
+    power = spectrum[:, :edges[-1]] ** 2
+    bands = np.add.reduceat(power, edges[:-1], axis=1)
+    bands_db = 10 * np.log10(bands + 1e-12)
+    richness = np.mean(bands_db > bands_db.max(axis=1, keepdims=True) - RICHNESS_DB, axis=1)
+
+    log_spectrum = np.log1p(100 * spectrum)
+    flux = np.zeros(n_frames, dtype=np.float32)
+    flux[1:] = np.maximum(np.diff(log_spectrum, axis=0), 0).sum(axis=1)
+
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    active = rms > ACTIVE_RMS
+    return richness * active, flux, active
+
+
+def _onset_stability(flux, fps):
+    """Насколько регулярны атаки: пик нормированной автокорреляции на периодах 0.25-1.5 с"""
+    envelope = flux - flux.mean()
+    energy = float(np.dot(envelope, envelope))
+    if energy <= 0:
+        return 0.0
+    size = 1 << int(np.ceil(np.log2(2 * len(envelope))))
+    spectrum = np.fft.rfft(envelope, size)
+    autocorr = np.fft.irfft(spectrum * np.conj(spectrum), size)[:len(envelope)] / energy
+    lo = int(BEAT_LAGS_SECONDS[0] * fps)
+    hi = min(int(BEAT_LAGS_SECONDS[1] * fps), len(envelope) - 1)
+    if hi <= lo:
+        return 0.0
+    return float(np.clip(autocorr[lo:hi].max(), 0.0, 1.0))
+
+
+def score_windows(samples, rate, window_seconds, hop_seconds=None, features=None):
+    """Оценки всех окон длины window_seconds с шагом hop_seconds: [(начало, оценка)]"""
+    hop_seconds = hop_seconds or Config.BEST_WINDOW_HOP
+    richness, flux, active = features or frame_features(samples, rate)
+    fps = rate / HOP
+    size = max(1, min(len(richness), int(window_seconds * fps)))
+    step = max(1, int(hop_seconds * fps))
+
+    # Средние по окнам через накопленные суммы - без цикла по кадрам
+    rich_sum = np.concatenate(([0.0], np.cumsum(richness)))
+    active_sum = np.concatenate(([0.0], np.cumsum(active)))
+    starts = np.arange(0, len(richness) - size + 1, step)
+    rich_mean = (rich_sum[starts + size] - rich_sum[starts]) / size
+    active_ratio = (active_sum[starts + size] - active_sum[starts]) / size
+
+    scores = []
+    for start, rich, ratio in zip(starts, rich_mean, active_ratio):
+        stability = _onset_stability(flux[start:start + size], fps)
+        scores.append((float(start * HOP / rate), float(rich * ratio * (0.5 + 0.5 * stability))))
+    return scores
+
+
+def best_windows(samples, rate, count=None, min_seconds=None, max_seconds=None):
+    """
+    Лучшие непересекающиеся окна длиной от min_seconds до max_seconds.
+    Возвращает [{'start', 'end', 'score'}] от лучшего к худшему;
+    короткая запись возвращается целиком одним окном.
+    """
+    count = count or Config.BEST_WINDOW_CANDIDATES
+    min_seconds = min_seconds or Config.BEST_WINDOW_MIN_SECONDS
+    max_seconds = max_seconds or Config.BEST_WINDOW_MAX_SECONDS
+    duration = len(samples) / rate
+    if duration <= min_seconds + Config.BEST_WINDOW_HOP:
+        return [{'start': 0.0, 'end': round(duration, 2), 'score': None}]
+
+    features = frame_features(samples, rate)
+    candidates = []
+    length = min_seconds
+    while length <= min(max_seconds, duration):
+        # Небольшой бонус за длину: при равном качестве Shazam больше данных полезно
+        bonus = (length / max_seconds) ** 0.25
+        for start, score in score_windows(samples, rate, length, features=features):
+            candidates.append((score * bonus, start, start + length))
+        length += 2
+
+    picked = []
+    for score, start, end in sorted(candidates, reverse=True):
+        overlaps = any(min(end, p['end']) - max(start, p['start']) > 0.5 * (end - start) for p in picked)
+        if not overlaps:
+            picked.append({'start': round(start, 2), 'end': round(end, 2), 'score': round(score, 4)})
+        if len(picked) == count:
+            break
+    return picked
+
+
+def window_wav_bytes(samples, rate, window):
+    """WAV в памяти с отсчётами окна"""
+    return segment_wav_bytes(samples[int(window['start'] * rate):int(window['end'] * rate)], rate)
+
+
+def segment_wav_bytes(segment, rate):
+    """16-bit mono отсчёты -> WAV в памяти"""
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(segment.astype(np.int16).tobytes())
+    return buf.getvalue()
+
+
+def is_miss(result):
+    """API разобрал звук, но трек не нашёл (в отличие от ошибок сети и API)"""
+    return not result.get('success') and result.get('error') in MISS_ERRORS
+
+
+class RateBudget:
+    """Не больше limit запросов к API за period секунд (скользящее окно)"""
+
+    def __init__(self, limit, period=60):
+        self.limit = limit
+        self.period = period
+        self._calls = collections.deque()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._calls and now - self._calls[0] > self.period:
+            self._calls.popleft()
+
+    def note(self):
+        """Учитывает обязательный запрос (первая попытка всегда идёт)"""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self._calls.append(now)
+
+    def available(self):
+        """Есть ли свободный слот (без учёта запроса)"""
+        with self._lock:
+            self._expire(time.monotonic())
+            return len(self._calls) < self.limit
+
+    def try_acquire(self):
+        """Берёт слот для необязательного запроса; False - бюджет исчерпан"""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            if len(self._calls) >= self.limit:
+                return False
+            self._calls.append(now)
+            return True
+
+
+budget = RateBudget(Config.RECOGNIZE_BUDGET_PER_MINUTE)
+
+
+def _first_success(attempts, workers):
+    """
+    Запускает попытки параллельно и возвращает первый успех.
+    Без успеха - результат первой попытки (самой перспективной).
+    """
+    if len(attempts) == 1:
+        return attempts[0]()
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='window')
+    # Копия контекста на каждую попытку: спаны из потоков пула - часть текущей трассы
+    futures = {pool.submit(contextvars.copy_context().run, attempt): i
+               for i, attempt in enumerate(attempts)}
+    results = {}
+    try:
+        for future in as_completed(futures):
+            result = future.result()
+            if result.get('success'):
+                return result
+            results[futures[future]] = result
+        return results[min(results)]
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _normalize(segment):
+    """Пиковая нормализация до RETRY_NORMALIZE_PEAK"""
+    x = segment.astype(np.float32)
+    peak = np.abs(x).max() if len(x) else 0
+    if peak == 0:
+        return None
+    return np.clip(x * (Config.RETRY_NORMALIZE_PEAK * 32767 / peak), -32768, 32767).astype(np.int16)
+
+
+def _highpass(segment, rate):
+    """ФВЧ через FFT с плавным скатом: убирает гул, удары и шум вентиляции"""
+    x = segment.astype(np.float32)
+    spectrum = np.fft.rfft(x)
+    freqs = np.fft.rfftfreq(len(x), 1.0 / rate)
+    cutoff = Config.RETRY_HIGHPASS_HZ
+    spectrum *= np.clip((freqs - cutoff / 2) / (cutoff / 2), 0.0, 1.0)
+    return np.clip(np.fft.irfft(spectrum, len(x)), -32768, 32767).astype(np.int16)
+
+
+def _shifted_window(samples, rate, tried):
+    """Следующее лучшее окно, не пересекающееся с уже отправленными"""
+    for window in best_windows(samples, rate, count=len(tried) + 2):
+        if all(min(window['end'], t['end']) - max(window['start'], t['start'])
+               <= 0.5 * (window['end'] - window['start']) for t in tried):
+            return window
+    # Запись короткая - сдвигаем лучшее окно на половину длины
+    best = tried[0]
+    length = best['end'] - best['start']
+    duration = len(samples) / rate
+    start = best['start'] + length / 2 if best['end'] + length / 2 <= duration else max(0.0, best['start'] - length / 2)
+    if abs(start - best['start']) < 1.0:
+        return None
+    return {'start': round(start, 2), 'end': round(min(duration, start + length), 2), 'score': None}
+
+
+def _variant(name, samples, rate, tried):
+    """Возвращает (окно, отсчёты) варианта или None, если он не применим"""
+    best = tried[0]
+    if name == 'shifted':
+        window = _shifted_window(samples, rate, tried)
+        if window is None:
+            return None
+        return window, samples[int(window['start'] * rate):int(window['end'] * rate)]
+
+    segment = samples[int(best['start'] * rate):int(best['end'] * rate)]
+    if name == 'normalized':
+        processed = _normalize(segment)
+    elif name == 'highpass':
+        processed = _highpass(segment, rate)
+    else:
+        raise ValueError(f"Неизвестный вариант: {name}")
+    return (best, processed) if processed is not None else None
+
+
+def recognize_best_window(recognizer, samples, rate, count=None, retry=None, optional=False):
+    """
+    Распознаёт лучшее окно записи; при count > 1 отправляет несколько
+    лучших окон параллельно и берёт первое совпадение.
+    При промахе (retry, по умолчанию RETRY_ON_MISS) пробует варианты той же
+    записи - сдвинутое окно, нормализованную громкость, ФВЧ - параллельно
+    и в пределах бюджета запросов к API.
+    optional - запись уже отправлялась целиком и не распознана: окна тоже
+    идут только в пределах бюджета; None - на них бюджета не осталось.
+    К результату добавляются 'window' и 'variant'.
+    """
+    retry = Config.RETRY_ON_MISS if retry is None else retry
+    with tracing.span('select_window', seconds=round(len(samples) / rate, 1)) as span:
+        windows = best_windows(samples, rate, count)
+        span.set(windows=windows)
+
+    def attempt(variant, window, segment):
+        def run():
+            result = recognizer.recognize_bytes(
+                segment_wav_bytes(segment, rate),
+                filename=f"{variant}_{window['start']:.1f}-{window['end']:.1f}.wav"
+            )
+            result['window'] = window
+            result['variant'] = variant
+            return result
+        return run
+
+    print(f"🎯 Окна для распознавания: "
+          + ', '.join(f"{w['start']:.1f}-{w['end']:.1f}с" for w in windows))
+    first = []
+    for window in windows:
+        if not optional:
+            budget.note()
+        elif not budget.try_acquire():
+            metrics.retry_variants.inc(variant='window', result='skipped')
+            continue
+        first.append(attempt('window', window,
+                             samples[int(window['start'] * rate):int(window['end'] * rate)]))
+    if not first:
+        print("🔁 Повторные попытки пропущены: бюджет запросов исчерпан")
+        return None
+    result = _first_success(first, len(first))
+    metrics.retry_variants.inc(variant='window', result=_retry_outcome(result))
+    if not retry or not is_miss(result):
+        return result
+
+    with tracing.span('second_chance') as span:
+        retries = []
+        for name in Config.RETRY_VARIANTS:
+            variant = _variant(name, samples, rate, windows)
+            if variant is None:
+                continue
+            if not budget.try_acquire():
+                metrics.retry_variants.inc(variant=name, result='skipped')
+                continue
+            retries.append((name, attempt(name, *variant)))
+        span.set(variants=[name for name, _ in retries])
+        if not retries:
+            print("🔁 Повторные попытки пропущены: бюджет запросов исчерпан")
+            return result
+
+        print(f"🔁 Не распознано, пробуем варианты: {', '.join(name for name, _ in retries)}")
+        second = _first_success([run for _, run in retries], Config.RETRY_MAX_PARALLEL)
+        span.set(winner=second.get('variant') if second.get('success') else None)
+
+    for name, _ in retries:
+        won = second.get('success') and second.get('variant') == name
+        metrics.retry_variants.inc(variant=name, result='hit' if won else 'tried')
+    if second.get('success'):
+        print(f"✅ Распознано со второй попытки: {second['variant']}")
+        return second
+    return result
+
+
+def _retry_outcome(result):
+    if result.get('success'):
+        return 'hit'
+    return 'miss' if is_miss(result) else 'error'
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк захвата звука: 44.1 кГц mono int16 через plug-слой ALSA
+(поотсчётная конвертация частоты, формата и каналов) против нативных
+48 кГц S32_LE стерео с выбором канала и полифазным ресемплингом в NumPy.
+
+CPU считается по process_time: plug-слой ALSA работает в нашем процессе,
+так что его стоимость попадает в замер.
+
+Останови flashshazam перед запуском: sudo systemctl stop flashshazam
+
+Использование:
+    python3 bench_capture.py               # запись с микрофона обоими путями
+    python3 bench_capture.py --seconds 10
+    python3 bench_capture.py --dry         # без микрофона: только конвертация в NumPy
+"""
+
+import argparse
+import os
+import struct
+import time
+import numpy as np
+from config import Config
+from resample import to_recognition_format
+
+
+def legacy_level(data):
+    """Прежний check_audio_level - для сравнения"""
+    count = len(data) // 2
+    samples = struct.unpack(f'{count}h', data)
+    return max(abs(s) for s in samples) / 32768.0 * 100
+
+
+def synthetic_capture(seconds, rate=Config.CAPTURE_RATE, channels=Config.CAPTURE_CHANNELS):
+    """Как отдаёт INMP441: звук в левом канале, правый - нули, 24 бита в старших разрядах"""
+    t = np.arange(int(seconds * rate)) / rate
+    x = 0.3 * np.sin(2 * np.pi * 440 * t) + 0.05 * np.random.default_rng(0).standard_normal(len(t))
+    frames = np.zeros((len(t), channels), dtype='<i4')
+    frames[:, 0] = (x * 2 ** 23).astype(np.int32) << 8
+    return frames.tobytes()
+
+
+def measure(fn):
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    result = fn()
+    return result, time.perf_counter() - start, time.process_time() - cpu_start
+
+
+def dry(seconds):
+    raw = synthetic_capture(seconds)
+    (samples, channel), wall, cpu = measure(
+        lambda: to_recognition_format(raw, Config.CAPTURE_CHANNELS, Config.CAPTURE_RATE, 44100))
+    print(f"Ресемплинг {Config.CAPTURE_RATE}->44100, {seconds}с клип: {wall * 1000:.1f} мс, "
+          f"CPU {cpu / seconds * 100:.2f}% от реального времени (канал {channel}, {len(samples)} отсчётов)")
+
+    chunk = samples[:1024].tobytes()
+    repeats = 200
+    _, _, old = measure(lambda: [legacy_level(chunk) for _ in range(repeats)])
+    _, _, new = measure(lambda: [float(np.abs(np.frombuffer(chunk, '<i2').astype(np.float32)).max())
+                                 for _ in range(repeats)])
+    print(f"Уровень на чанк 1024: struct {old / repeats * 1e6:.0f} мкс, NumPy {new / repeats * 1e6:.0f} мкс")
+    print("Стоимость plug-слоя ALSA меряется только с микрофоном (без --dry)")
+
+
+def device(seconds):
+    from audio_recorder import AudioRecorder
+
+    results = {}
+    for name, native in (('plug', False), ('native', True)):
+        recorder = AudioRecorder(input_device_index=0, native=native)
+        print(f"\n▶ {name}: {recorder.capture_rate} Гц, {recorder.capture_channels} кан.")
+        path, wall, cpu = measure(lambda: recorder.record(duration=seconds))
+        results[name] = cpu
+        print(f"  {name}: {wall:.1f}с, CPU {cpu:.2f}с = {cpu / seconds * 100:.1f}% от реального времени")
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    print(f"\n📊 CPU на секунду звука: plug {results['plug'] / seconds * 1000:.1f} мс, "
+          f"нативный {results['native'] / seconds * 1000:.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк захвата звука')
+    parser.add_argument('--dry', action='store_true', help='без микрофона (синтетический сигнал)')
+    parser.add_argument('--seconds', type=int, default=5, help='секунд звука на замер')
+    args = parser.parse_args()
+
+    if args.dry:
+        dry(args.seconds)
+    else:
+        device(args.seconds)
+
+
+if __name__ == '__main__':
+    main()
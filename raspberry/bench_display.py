@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк вывода кадров на OLED: старый путь (цикл по битам + байт на транзакцию)
+против упаковки NumPy и блочных I2C записей - целым кадром и только изменений,
+и неблокирующий вывод через поток-компоновщик.
+
+Останови flashshazam перед запуском: sudo systemctl stop flashshazam
+
+Использование:
+    python3 bench_display.py            # на реальном дисплее
+    python3 bench_display.py --dry      # без дисплея: только CPU и число транзакций
+    python3 bench_display.py --frames 200
+"""
+
+import argparse
+import time
+from PIL import Image, ImageDraw
+from display import Display, pack_pages
+
+
+class CountingBus:
+    """Шина-заглушка для --dry: считает транзакции и байты, ничего не отправляет"""
+
+    def __init__(self):
+        self.transactions = 0
+        self.bytes = 0
+
+    def write_byte_data(self, addr, register, value):
+        self.transactions += 1
+        self.bytes += 2
+
+    def write_i2c_block_data(self, addr, register, data):
+        self.transactions += 1
+        self.bytes += 1 + len(data)
+
+    def i2c_rdwr(self, *msgs):
+        self.transactions += 1
+        self.bytes += sum(len(m) for m in msgs)
+
+    def close(self):
+        pass
+
+
+def legacy_display_image(display, image):
+    """Прежняя реализация display_image - для сравнения"""
+    image = image.convert('1')
+    pixels = list(image.getdata())
+    for page in range(8):
+        display._write_cmd(0xB0 + page)
+        display._write_cmd(0x02)
+        display._write_cmd(0x10)
+        for x in range(128):
+            byte = 0
+            for bit in range(8):
+                y = page * 8 + bit
+                if y < 64:
+                    if pixels[y * 128 + x]:
+                        byte |= (1 << bit)
+            try:
+                display.bus.write_byte_data(display.addr, 0x40, byte)
+            except Exception:
+                pass
+
+
+def make_frames(display, count=8):
+    """Кадры, похожие на анимацию «Analyzing»"""
+    frames = []
+    for i in range(count):
+        img = Image.new('1', (display.width, display.height), 0)
+        draw = ImageDraw.Draw(img)
+        draw.text((30, 14), 'Analyzing', fill=1)
+        for k, dx in enumerate((-14, 0, 14)):
+            r = 4 if k == i % 3 else 2
+            cx, cy = display.width // 2 + dx, 46
+            draw.ellipse((cx - r, cy - r, cx + r, cy + r), fill=1)
+        frames.append(img)
+    return frames
+
+
+def run(name, fn, display, frames, total):
+    bus = display.bus
+    before = (getattr(bus, 'transactions', 0), getattr(bus, 'bytes', 0))
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    for i in range(total):
+        fn(frames[i % len(frames)])
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    line = (f"{name:8} {total / elapsed:7.1f} fps  {elapsed / total * 1000:7.2f} мс/кадр  "
+            f"CPU {cpu / total * 1000:6.2f} мс/кадр")
+    if isinstance(bus, CountingBus):
+        line += (f"  {(bus.transactions - before[0]) / total:6.0f} транзакций/кадр  "
+                 f"{(bus.bytes - before[1]) / total:6.0f} байт/кадр")
+    print(line)
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк OLED')
+    parser.add_argument('--dry', action='store_true', help='без дисплея (шина-заглушка)')
+    parser.add_argument('--frames', type=int, default=100, help='кадров на замер')
+    args = parser.parse_args()
+
+    display = Display(bus=CountingBus() if args.dry else None)
+    if not display._enabled:
+        print('OLED недоступен - запусти с --dry')
+        return
+
+    frames = make_frames(display)
+    legacy_frames = max(10, args.frames // 10)  # старый путь медленный
+    print(f"\n📊 Кадр {display.width}x{display.height}, {'без дисплея' if args.dry else 'реальный дисплей'}\n")
+    before = run('старый', lambda img: legacy_display_image(display, img), display, frames, legacy_frames)
+    run('целиком', lambda img: display._send_frame(pack_pages(img), force=True), display, frames, args.frames)
+    after = run('diff', lambda img: display._draw(pack_pages(img)), display, frames, args.frames)
+    print(f"\nУскорение: x{after / before:.1f}")
+
+    # Через компоновщик: вызовы не ждут шину, перекрытые кадры отбрасываются
+    start = time.perf_counter()
+    for i in range(args.frames):
+        display.display_image(frames[i % len(frames)])
+    submit = time.perf_counter() - start
+    display.flush(timeout=5)
+    print(f"Компоновщик: {submit / args.frames * 1000:.2f} мс на вызов, статистика: {display.stats()}")
+    display.clear()
+    display.close()
+
+
+if __name__ == '__main__':
+    main()
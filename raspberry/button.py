@@ -1,40 +1,194 @@
 #!/usr/bin/env python3
 """
 Button module - GPIO17 (Pin 11)
+
+Кнопка работает по прерываниям: GPIO.add_event_detect на оба фронта,
+дребезг отсекается в обработчике. Нажатия превращаются в события
+в потокобезопасной очереди, ожидание - блокирующее, без опроса пина.
 """
 
 import RPi.GPIO as GPIO
+import threading
 import time
+from collections import deque, namedtuple
 
 BUTTON_PIN = 17  # GPIO17 = Pin 11
 
+DEBOUNCE = 0.03  # фронты ближе 30 мс после предыдущего - дребезг
+LONG_PRESS = 1.5  # удержание дольше - long (и событие hold в момент порога)
+DOUBLE_PRESS_GAP = 0.3  # второе короткое нажатие в этом окне - double
+EVENT_BUFFER = 32  # событий в очереди, старые вытесняются
+POLL_INTERVAL = 0.01  # только если ядро не дало edge detection
+
+
+# kind: press / release - сырые фронты;
+#       hold - кнопка всё ещё зажата и пересекла long_threshold;
+#       short / long / double - жесты после отпускания.
+# pressed_at - time.monotonic() начала нажатия, duration - сколько держали.
+ButtonEvent = namedtuple('ButtonEvent', ['kind', 'pressed_at', 'duration'])
+
+GESTURES = ('short', 'long', 'double')
+
 
 class Button:
-    def __init__(self, pin=BUTTON_PIN):
+    def __init__(self, pin=BUTTON_PIN, long_threshold=LONG_PRESS, double_gap=DOUBLE_PRESS_GAP):
         self.pin = pin
+        self.long_threshold = long_threshold
+        self.double_gap = double_gap
+        self._running = True
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=EVENT_BUFFER)
+        self._listeners = []
+        self._down = False
+        self._pressed_at = None
+        self._last_edge = 0.0
+        self._bounce_edge = 0.0  # последний фронт, отброшенный как дребезг
+        self._hold_timer = None
+        self._pending_short = None  # короткое нажатие, ждущее возможного второго
+        self._short_timer = None
+        self._poll_thread = None
+
         GPIO.setmode(GPIO.BCM)
         GPIO.setup(self.pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        self._running = True
-        print(f'✓ Кнопка на GPIO{self.pin} (Pin 11)')
+        try:
+            # bouncetime не задаём: на BOTH он глотает отпускание - дребезг режем сами
+            GPIO.add_event_detect(self.pin, GPIO.BOTH, callback=self._on_edge)
+            mode = 'прерывания'
+        except RuntimeError as e:
+            # бывает на новых ядрах (sysfs GPIO) - опрашиваем в отдельном потоке
+            print(f'⚠️ Edge detection недоступен ({e}), опрос пина')
+            self._poll_thread = threading.Thread(target=self._poll, name='button-poll', daemon=True)
+            self._poll_thread.start()
+            mode = 'опрос'
+        print(f'✓ Кнопка на GPIO{self.pin} (Pin 11), {mode}')
 
     def is_pressed(self):
         return GPIO.input(self.pin) == GPIO.LOW
 
-    def wait_for_press(self, timeout=None):
-        start = time.time()
+    # --- обработка фронтов (поток RPi.GPIO) ---
+
+    def _on_edge(self, channel=None):
+        now = time.monotonic()
+        down = GPIO.input(self.pin) == GPIO.LOW
+        with self._cond:
+            if down == self._down:
+                return
+            if now - self._last_edge < DEBOUNCE:
+                self._bounce_edge = now
+                return
+            self._last_edge = now
+            self._down = down
+            if down:
+                self._press(now)
+            else:
+                self._release(now)
+
+    def _press(self, now):
+        self._pressed_at = now
+        self._emit('press', now, 0.0)
+        self._hold_timer = threading.Timer(self.long_threshold, self._on_hold, args=(now,))
+        self._hold_timer.daemon = True
+        self._hold_timer.start()
+
+    def _release(self, now):
+        pressed_at = self._pressed_at or now
+        duration = now - pressed_at
+        self._pressed_at = None
+        self._cancel(self._hold_timer)
+        self._emit('release', pressed_at, duration)
+
+        if duration >= self.long_threshold:
+            self._flush_short()
+            self._emit('long', pressed_at, duration)
+        elif self._pending_short is not None:
+            self._cancel(self._short_timer)
+            first = self._pending_short
+            self._pending_short = None
+            self._emit('double', first.pressed_at, now - first.pressed_at)
+        elif self.double_gap:
+            self._pending_short = ButtonEvent('short', pressed_at, duration)
+            self._short_timer = threading.Timer(self.double_gap, self._on_short_timeout)
+            self._short_timer.daemon = True
+            self._short_timer.start()
+        else:
+            self._emit('short', pressed_at, duration)
+
+    def _on_hold(self, pressed_at):
+        with self._cond:
+            if self._pressed_at != pressed_at:
+                return
+            if GPIO.input(self.pin) != GPIO.LOW:
+                # Отпускание потерялось в дребезге: это было короткое нажатие,
+                # отпускание - последний записанный фронт, а не момент порога
+                released_at = max(self._last_edge, self._bounce_edge)
+                self._down = False
+                self._last_edge = released_at
+                self._release(released_at)
+                return
+            self._emit('hold', pressed_at, self.long_threshold)
+
+    def _on_short_timeout(self):
+        with self._cond:
+            self._flush_short()
+
+    def _flush_short(self):
+        if self._pending_short is not None:
+            self._cancel(self._short_timer)
+            self._emit(*self._pending_short)
+            self._pending_short = None
+
+    def _emit(self, kind, pressed_at, duration):
+        event = ButtonEvent(kind, pressed_at, duration)
+        self._events.append(event)
+        self._cond.notify_all()
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception:
+                pass
+
+    @staticmethod
+    def _cancel(timer):
+        if timer is not None:
+            timer.cancel()
+
+    def _poll(self):
+        last = None
         while self._running:
-            if GPIO.input(self.pin) == GPIO.LOW:
-                time.sleep(0.05)
-                if GPIO.input(self.pin) == GPIO.LOW:
-                    while GPIO.input(self.pin) == GPIO.LOW:
-                        time.sleep(0.01)
-                    return True
+            down = GPIO.input(self.pin) == GPIO.LOW
+            if down != last:
+                self._on_edge()
+                last = down
+            time.sleep(POLL_INTERVAL)
+
+    # --- потребители ---
+
+    def add_listener(self, callback):
+        """callback(ButtonEvent) вызывается из потока GPIO на каждое событие"""
+        self._listeners.append(callback)
 
-            if timeout and (time.time() - start) > timeout:
-                return False
+    def get_event(self, timeout=None, kinds=GESTURES, since=None):
+        """
+        Ждёт событие одного из kinds (без опроса - на Condition).
+        since - игнорировать нажатия, начатые раньше этого момента (monotonic).
+        Остальные события из очереди отбрасываются. None - таймаут или cleanup.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._running:
+                while self._events:
+                    event = self._events.popleft()
+                    if event.kind in kinds and (since is None or event.pressed_at >= since):
+                        return event
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+        return None
 
-            time.sleep(0.01)
-        return False
+    def wait_for_press(self, timeout=None):
+        """Ждёт полного нажатия (до отпускания). Нажатия до вызова не считаются."""
+        return self.get_event(timeout, kinds=('release',), since=time.monotonic()) is not None
 
     def wait_for_press_classified(self, timeout=None, long_threshold=1.5):
         """
@@ -42,27 +196,12 @@ class Button:
             'short' — обычное короткое нажатие
             'long'  — удержание дольше long_threshold секунд
             None    — таймаут
-        Возвращает после отпускания (или сразу как только пересечён порог long).
+        Возвращает после отпускания; длительность берётся по меткам времени фронтов.
         """
-        start = time.time()
-        while self._running:
-            if GPIO.input(self.pin) == GPIO.LOW:
-                time.sleep(0.05)
-                if GPIO.input(self.pin) == GPIO.LOW:
-                    t0 = time.time()
-                    while GPIO.input(self.pin) == GPIO.LOW:
-                        if time.time() - t0 >= long_threshold:
-                            while GPIO.input(self.pin) == GPIO.LOW:
-                                time.sleep(0.02)
-                            return 'long'
-                        time.sleep(0.02)
-                    return 'short'
-
-            if timeout and (time.time() - start) > timeout:
-                return None
-
-            time.sleep(0.01)
-        return None
+        event = self.get_event(timeout, kinds=('release',), since=time.monotonic())
+        if event is None:
+            return None
+        return 'long' if event.duration >= long_threshold else 'short'
 
     def held_for(self):
         """
@@ -70,15 +209,19 @@ class Button:
         Иначе возвращает 0. Используется для опроса во время блокирующих операций
         (например, чтобы отменить запись по долгому удержанию).
         """
-        if not hasattr(self, '_hold_start'):
-            self._hold_start = None
-        if GPIO.input(self.pin) == GPIO.LOW:
-            if self._hold_start is None:
-                self._hold_start = time.time()
-            return time.time() - self._hold_start
-        else:
-            self._hold_start = None
+        pressed_at = self._pressed_at
+        if pressed_at is None:
             return 0.0
+        return time.monotonic() - pressed_at
 
     def cleanup(self):
-        self._running = False
+        with self._cond:
+            self._running = False
+            self._cancel(self._hold_timer)
+            self._cancel(self._short_timer)
+            self._cond.notify_all()
+        if self._poll_thread is None:
+            try:
+                GPIO.remove_event_detect(self.pin)
+            except Exception:
+                pass
@@ -8,8 +8,70 @@ class Config:
     APIFY_TOKEN = os.getenv('APIFY_TOKEN', '')
 
     RECORDING_DURATION = 15  # секунд
+    DEVICE_SCAN_INTERVAL = 300  # секунд между фоновыми опросами устройств
+    DEVICE_HOTPLUG_SETTLE = 1.0  # секунд ожидания после события udev
     RECORDINGS_DIR = 'recordings'
     DOWNLOADS_DIR = 'downloads'
+    METRICS_FILE = os.getenv('METRICS_FILE', 'metrics.prom')  # дамп метрик после каждого цикла
+
+    # Захват в нативном формате INMP441 (см. verify_mic.py): 48 кГц S32_LE стерео,
+    # живой канал и ресемплинг в 44.1 кГц mono int16 - в NumPy, а не в plug-слое ALSA
+    CAPTURE_NATIVE = os.getenv('CAPTURE_NATIVE', '1') == '1'
+    CAPTURE_RATE = int(os.getenv('CAPTURE_RATE', '48000'))
+    CAPTURE_CHANNELS = int(os.getenv('CAPTURE_CHANNELS', '2'))
+
+    # Выбор лучшего фрагмента записи перед отправкой в Shazam
+    BEST_WINDOW_ENABLED = os.getenv('BEST_WINDOW_ENABLED', '1') == '1'
+    BEST_WINDOW_MIN_SECONDS = 6
+    BEST_WINDOW_MAX_SECONDS = 10
+    BEST_WINDOW_HOP = 0.5  # секунд между началами окон
+    BEST_WINDOW_CANDIDATES = int(os.getenv('BEST_WINDOW_CANDIDATES', '2'))  # окон параллельно
+
+    # Вторая попытка при промахе: варианты той же записи
+    RETRY_ON_MISS = os.getenv('RETRY_ON_MISS', '1') == '1'
+    RETRY_VARIANTS = [v.strip() for v in os.getenv('RETRY_VARIANTS', 'shifted,normalized,highpass').split(',') if v.strip()]
+    RETRY_MAX_PARALLEL = 2  # одновременных запросов на повтор
+    RETRY_NORMALIZE_PEAK = 0.9  # пик после нормализации громкости
+    RETRY_HIGHPASS_HZ = 150  # срез ФВЧ, Гц
+    RECOGNIZE_BUDGET_PER_MINUTE = int(os.getenv('RECOGNIZE_BUDGET_PER_MINUTE', '6'))  # запросов к API в минуту
+
+    # Офлайн-очередь: записи без сети распознаются, когда сеть вернётся
+    OFFLINE_QUEUE_DB = os.getenv('OFFLINE_QUEUE_DB', 'offline_queue.db')
+    OFFLINE_CHECK_HOST = 'shazam-api.com'  # TCP connect на 443 - проверка сети
+    OFFLINE_CHECK_TIMEOUT = 1.5  # секунд на connect
+    OFFLINE_CHECK_TTL = 15  # секунд кешируется результат проверки
+    OFFLINE_CHECK_INTERVAL = 30  # секунд между проверками, пока сети нет
+    OFFLINE_DRAIN_INTERVAL = 10  # секунд между распознаваниями из очереди
+    OFFLINE_MAX_ATTEMPTS = 5  # попыток на запись при ошибках API
+
+    # Радио-режим: непрерывное прослушивание, распознавание только при смене трека
+    RADIO_LOG_FILE = os.getenv('RADIO_LOG_FILE', 'radio_log.jsonl')  # журнал эфира, JSON Lines
+    RADIO_BLOCK_SECONDS = 2  # анализ сигнатуры по блокам такой длины
+    RADIO_BUFFER_SECONDS = 10  # столько последнего звука уходит на распознавание
+    RADIO_CHANGE_THRESHOLD = float(os.getenv('RADIO_CHANGE_THRESHOLD', '0.12'))  # косинусное расстояние сигнатур
+    RADIO_CHANGE_BLOCKS = 3  # блоков подряд с изменением - это смена трека, а не реплика
+    RADIO_MIN_INTERVAL = int(os.getenv('RADIO_MIN_INTERVAL', '30'))  # секунд между запросами к API
+    RADIO_SILENCE_RMS = 0.003  # тише - пауза, сигнатуру не считаем
+    RADIO_SILENCE_RESET_BLOCKS = int(os.getenv('RADIO_SILENCE_RESET_BLOCKS', '3'))  # столько тихих блоков подряд - пауза между треками
+
+    # Трассировка запросов
+    TRACE_BUFFER_SIZE = int(os.getenv('TRACE_BUFFER_SIZE', '100'))  # последних трасс в памяти
+    TRACE_PROFILE_THRESHOLD = float(os.getenv('TRACE_PROFILE_THRESHOLD', '10'))  # секунд; 0 = без профайлера
+    TRACE_PROFILE_INTERVAL = 0.05  # секунд между выборками стека
+    TRACE_PROFILE_TOP = 20  # самых частых стеков в отчёте
+
+    # Лимиты хранилища (0 = без ограничения)
+    RECORDINGS_MAX_MB = int(os.getenv('RECORDINGS_MAX_MB', '100'))
+    RECORDINGS_MAX_FILES = int(os.getenv('RECORDINGS_MAX_FILES', '200'))
+    RECORDINGS_MAX_AGE_HOURS = int(os.getenv('RECORDINGS_MAX_AGE_HOURS', '0'))
+    DOWNLOADS_MAX_MB = int(os.getenv('DOWNLOADS_MAX_MB', '1000'))
+    DOWNLOADS_MAX_FILES = int(os.getenv('DOWNLOADS_MAX_FILES', '0'))
+    CONVERSIONS_DIR = 'conversions'  # кеш WAV по хешу исходника
+    CONVERSIONS_MAX_MB = int(os.getenv('CONVERSIONS_MAX_MB', '200'))
+    STORAGE_POLICY = os.getenv('STORAGE_POLICY', 'lru')  # lru | age
+    STORAGE_CHECK_INTERVAL = 60  # секунд
+    STORAGE_EVICT_BATCH = 10  # файлов за один проход
 
     os.makedirs(RECORDINGS_DIR, exist_ok=True)
     os.makedirs(DOWNLOADS_DIR, exist_ok=True)
+    os.makedirs(CONVERSIONS_DIR, exist_ok=True)
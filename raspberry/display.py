@@ -3,27 +3,69 @@
 SH1106 OLED Display driver - direct I2C communication
 """
 
+import math
+import queue
 import smbus2
 import threading
 import time
+from collections import OrderedDict
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
 
+CONTROL_CMD = 0x00
+CONTROL_DATA = 0x40
+I2C_BLOCK = 32  # максимум байт в одной SMBus block write
+COLUMN_OFFSET = 2  # SH1106: 132 колонки RAM, видимые 128 начинаются со второй
+RANGE_GAP = 6  # изменённые участки ближе этого склеиваем: новый адрес стоит ~5 байт
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+LAYOUT_CACHE_SIZE = 64  # раскладок текста (текст, шрифт, ширина)
+ANIMATION_CACHE_SIZE = 4  # анимаций с готовыми кадрами (по названию трека)
+BUS_SHARE = 0.5  # анимация занимает шину не больше этой доли времени
+FRAME_TIME_SMOOTHING = 0.2  # вес нового замера в скользящем среднем времени кадра
+
+
+def pack_pages(image, width=128, height=64):
+    """
+    PIL Image -> массив (страницы, колонки) байтов в раскладке SH1106:
+    байт - вертикальная полоска из 8 пикселей, бит 0 сверху.
+    Одна операция NumPy вместо цикла по 8192 пикселям.
+    """
+    pixels = np.asarray(image.convert('1'), dtype=np.uint8)
+    pages = pixels.reshape(height // 8, 8, width).transpose(0, 2, 1)
+    return np.packbits(pages, axis=-1, bitorder='little').reshape(height // 8, width)
+
+
 class Display:
-    def __init__(self, bus_num=1, address=0x3C, width=128, height=64):
-        self._anim_thread = None
-        self._anim_stop = threading.Event()
+    def __init__(self, bus_num=1, address=0x3C, width=128, height=64, bus=None):
         self._lock = threading.Lock()
+        self._scenes = queue.Queue()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._compositor = None
+        self._use_rdwr = True
+        self._shadow = None  # последний отправленный кадр (страницы x колонки)
+        self._stats = {'frames': 0, 'unchanged': 0, 'bytes': 0, 'last_bytes': 0,
+                       'dropped': 0, 'frame_time': 0.0, 'max_frame_time': 0.0, 'interval': 0.0}
+        self._fonts = {}
+        # Кеши LRU трогают и вызывающие потоки, и компоновщик (кадры анимаций);
+        # отдельная блокировка, чтобы не ждать отправки кадра по шине под _lock
+        self._cache_lock = threading.Lock()
+        self._layouts = OrderedDict()
+        self._animations = OrderedDict()  # ключ -> список упакованных кадров цикла
+        self.addr = address
+        self.width = width
+        self.height = height
         try:
-            self.bus = smbus2.SMBus(bus_num)
-            self.addr = address
-            self.width = width
-            self.height = height
+            self.bus = bus or smbus2.SMBus(bus_num)
             self._enabled = True
             
             # SH1106 init sequence
             self._init_display()
-            self.clear()
+            with self._lock:
+                self._send_frame(self._blank(), force=True)
+            self._compositor = threading.Thread(target=self._compose, name='oled', daemon=True)
+            self._compositor.start()
             print(f'✓ OLED SH1106 инициализирован ({width}x{height})')
             
         except Exception as e:
@@ -40,15 +82,111 @@ class Display:
         except:
             pass
     
-    def _write_data(self, data):
-        """Отправить данные"""
+    def _write_cmds(self, cmds):
+        """Отправить несколько команд одной транзакцией"""
         if not self._enabled:
             return
         try:
-            self.bus.write_byte_data(self.addr, 0x40, data)
-        except:
+            for i in range(0, len(cmds), I2C_BLOCK):
+                self.bus.write_i2c_block_data(self.addr, CONTROL_CMD, list(cmds[i:i + I2C_BLOCK]))
+        except Exception:
             pass
-    
+
+    def _page_cmds(self, page, column=0):
+        column += COLUMN_OFFSET
+        return [0xB0 + page, column & 0x0F, 0x10 | (column >> 4)]
+
+    @staticmethod
+    def _dirty_ranges(changed):
+        """Номера изменённых колонок -> [(начало, конец)], близкие участки склеены"""
+        columns = np.flatnonzero(changed)
+        if not len(columns):
+            return []
+        breaks = np.flatnonzero(np.diff(columns) > RANGE_GAP)
+        starts = np.concatenate(([columns[0]], columns[breaks + 1]))
+        ends = np.concatenate((columns[breaks], [columns[-1]]))
+        return list(zip(starts.tolist(), (ends + 1).tolist()))
+
+    def _send_frame(self, pages, force=False):
+        """
+        Отправляет только изменившиеся участки кадра относительно теневой копии.
+        force - отправить кадр целиком (после init/clear состояние RAM неизвестно).
+        Возвращает число отправленных байт.
+        """
+        if force or self._shadow is None:
+            changed = np.ones(pages.shape, dtype=bool)
+        else:
+            changed = pages != self._shadow
+
+        segments = []
+        for page in np.flatnonzero(changed.any(axis=1)):
+            for start, end in self._dirty_ranges(changed[page]):
+                segments.append((int(page), start, pages[page, start:end].tobytes()))
+
+        sent = self._write_segments(segments) if segments else 0
+        if sent is None:
+            self._shadow = None  # запись не удалась - следующий кадр целиком
+            sent = 0
+        else:
+            self._shadow = pages.copy()
+
+        self._stats['frames'] += 1
+        self._stats['unchanged'] += 0 if segments else 1
+        self._stats['bytes'] += sent
+        self._stats['last_bytes'] = sent
+        return sent
+
+    def _write_segments(self, segments):
+        """
+        Отправить участки [(страница, колонка, данные)].
+        Основной путь - один i2c_rdwr на весь кадр (адрес и данные участка
+        отдельными сообщениями); если адаптер не умеет несколько
+        сообщений - блоками по 32 байта через SMBus.
+        Возвращает число байт на шине или None при ошибке.
+        """
+        if not self._enabled:
+            return 0
+        if self._use_rdwr:
+            msgs = []
+            for page, column, data in segments:
+                msgs.append(smbus2.i2c_msg.write(self.addr, [CONTROL_CMD] + self._page_cmds(page, column)))
+                msgs.append(smbus2.i2c_msg.write(self.addr, bytes([CONTROL_DATA]) + data))
+            try:
+                self.bus.i2c_rdwr(*msgs)
+                return sum(len(m) for m in msgs)
+            except Exception as e:
+                print(f'⚠️ OLED: i2c_rdwr недоступен ({e}), перехожу на block write')
+                self._use_rdwr = False
+
+        sent = 0
+        try:
+            for page, column, data in segments:
+                self.bus.write_i2c_block_data(self.addr, CONTROL_CMD, self._page_cmds(page, column))
+                sent += 4
+                for i in range(0, len(data), I2C_BLOCK):
+                    chunk = list(data[i:i + I2C_BLOCK])
+                    self.bus.write_i2c_block_data(self.addr, CONTROL_DATA, chunk)
+                    sent += 1 + len(chunk)
+        except Exception:
+            return None
+        return sent
+
+    def stats(self):
+        """Статистика вывода: кадры, пропущенные без изменений, байт на шине"""
+        frames = self._stats['frames']
+        interval = self._stats['interval']
+        return {
+            'frames': frames,
+            'unchanged_frames': self._stats['unchanged'],
+            'dropped_frames': self._stats['dropped'],
+            'bytes_sent': self._stats['bytes'],
+            'last_frame_bytes': self._stats['last_bytes'],
+            'avg_frame_bytes': round(self._stats['bytes'] / frames, 1) if frames else 0,
+            'avg_frame_ms': round(self._stats['frame_time'] * 1000, 2),
+            'max_frame_ms': round(self._stats['max_frame_time'] * 1000, 2),
+            'animation_fps': round(1 / interval, 1) if interval else None,
+        }
+
     def _init_display(self):
         """Инициализация SH1106"""
         init_seq = [
@@ -69,75 +207,148 @@ class Display:
             0xA6,        # Normal display (not inverted)
             0xAF,        # Display ON
         ]
-        
-        for cmd in init_seq:
-            self._write_cmd(cmd)
-            time.sleep(0.001)
+        # Вся последовательность - одна block write: пауз между командами SH1106 не требует
+        self._write_cmds(init_seq)
     
+    def _blank(self):
+        return np.zeros((self.height // 8, self.width), dtype=np.uint8)
+
     def clear(self):
         """Очистить экран"""
-        self.stop_animation()
-        if not self._enabled:
-            return
-        
-        for page in range(8):
-            self._write_cmd(0xB0 + page)  # Set page
-            self._write_cmd(0x02)  # Set lower column (SH1106 offset)
-            self._write_cmd(0x10)  # Set higher column
-            
-            for _ in range(128):
-                self._write_data(0x00)
-    
+        self._submit(('frame', self._blank(), True))
+
     def display_image(self, image):
-        """Отобразить PIL Image (1-bit, 128x64)"""
-        if not self._enabled:
-            return
+        """Отобразить PIL Image (1-bit, 128x64). Не блокирует: кадр уходит компоновщику."""
+        self._submit(('frame', image, False))
 
-        with self._lock:
-            image = image.convert('1')
-            pixels = list(image.getdata())
-            for page in range(8):
-                self._write_cmd(0xB0 + page)
-                self._write_cmd(0x02)  # SH1106 offset
-                self._write_cmd(0x10)
-                for x in range(128):
-                    byte = 0
-                    for bit in range(8):
-                        y = page * 8 + bit
-                        if y < 64:
-                            if pixels[y * 128 + x]:
-                                byte |= (1 << bit)
-                    self._write_data(byte)
+    def display_pages(self, pages):
+        """Отобразить уже упакованный кадр (результат pack_pages)"""
+        self._submit(('frame', pages, False))
 
     def stop_animation(self):
-        if self._anim_thread:
-            self._anim_stop.set()
-            self._anim_thread.join(timeout=1)
-            self._anim_thread = None
-
-    def _animate(self, frame_fn, fps=8):
-        """Запустить фоновую анимацию. frame_fn(i) -> PIL Image."""
-        self.stop_animation()
+        """Остановить анимацию, оставив на экране последний кадр"""
+        self._submit(('stop',))
+
+    def _animate(self, key, frame_fn, period, fps=8):
+        """
+        Запустить фоновую анимацию. frame_fn(i) -> PIL Image, цикл из period кадров.
+        Кадры рисуются и упаковываются один раз (при первом проходе цикла)
+        и хранятся по key - дальше анимация только отправляет готовые буферы.
+        """
         if not self._enabled:
             return
-        self._anim_stop.clear()
+        self._submit(('animate', self._animation_frames(key, period), frame_fn, fps))
+
+    def _animation_frames(self, key, period):
+        with self._cache_lock:
+            frames = self._animations.get(key)
+            if frames is None:
+                frames = self._animations[key] = [None] * period
+                while len(self._animations) > ANIMATION_CACHE_SIZE:
+                    self._animations.popitem(last=False)
+            self._animations.move_to_end(key)
+            return frames
+
+    def _submit(self, scene):
+        if not self._enabled or self._compositor is None:
+            return
+        self._idle.clear()
+        self._scenes.put(scene)
+
+    def flush(self, timeout=1.0):
+        """Дождаться, пока компоновщик выведет всё отправленное. True - успел."""
+        return self._idle.wait(timeout)
 
-        def loop():
-            i = 0
-            interval = 1.0 / fps
-            while not self._anim_stop.is_set():
+    def close(self, timeout=1.0):
+        """Вывести оставшиеся кадры и остановить компоновщик"""
+        if self._compositor is None:
+            return
+        self.flush(timeout)
+        self._scenes.put(('close',))
+        self._compositor.join(timeout)
+        self._compositor = None
+
+    def _latest_scene(self, scene):
+        """
+        Забирает всё накопившееся в очереди и оставляет последнюю сцену:
+        кадры, которые перекрыты более новыми, так и не попадают на шину.
+        """
+        force = False
+        while True:
+            try:
+                newer = self._scenes.get_nowait()
+            except queue.Empty:
+                break
+            if scene[0] == 'close':
+                continue
+            if scene[0] in ('frame', 'animate'):
+                self._stats['dropped'] += 1
+            if scene[0] == 'frame':
+                force = force or scene[2]
+            scene = newer
+        if force and scene[0] == 'frame':
+            scene = ('frame', scene[1], True)
+        return scene
+
+    def _compose(self):
+        """
+        Поток-компоновщик: единственный владелец шины.
+        Берёт из очереди только самую свежую сцену; анимация идёт с частотой
+        не выше запрошенной и не выше той, что позволяет шина (BUS_SHARE).
+        """
+        animation = None
+        index = 0
+        due = 0.0
+        while True:
+            timeout = None if animation is None else max(0.0, due - time.monotonic())
+            try:
+                scene = self._latest_scene(self._scenes.get(timeout=timeout))
+            except queue.Empty:
+                scene = None  # пора следующий кадр анимации
+
+            if scene is not None:
+                kind = scene[0]
+                if kind == 'close':
+                    self._idle.set()
+                    return
+                animation = None
+                if kind == 'frame':
+                    _, frame, force = scene
+                    if not isinstance(frame, np.ndarray):
+                        frame = pack_pages(frame, self.width, self.height)
+                    self._draw(frame, force)
+                elif kind == 'animate':
+                    animation, index, due = scene, 0, time.monotonic()
+                if self._scenes.empty():
+                    self._idle.set()
+
+            if animation is not None and time.monotonic() >= due:
+                _, frames, frame_fn, fps = animation
+                n = index % len(frames)
+                index += 1
                 try:
-                    img = frame_fn(i)
-                    self.display_image(img)
+                    if frames[n] is None:
+                        frames[n] = pack_pages(frame_fn(n), self.width, self.height)
+                    self._draw(frames[n])
                 except Exception:
                     pass
-                i += 1
-                if self._anim_stop.wait(interval):
-                    break
+                interval = max(1.0 / fps, self._stats['frame_time'] / BUS_SHARE)
+                self._stats['interval'] = interval
+                due = time.monotonic() + interval
+
+    def _draw(self, pages, force=False):
+        start = time.perf_counter()
+        try:
+            with self._lock:
+                self._send_frame(pages, force)
+        except Exception:
+            return
+        elapsed = time.perf_counter() - start
+        average = self._stats['frame_time']
+        self._stats['frame_time'] = elapsed if not average else (
+            average + FRAME_TIME_SMOOTHING * (elapsed - average))
+        self._stats['max_frame_time'] = max(self._stats['max_frame_time'], elapsed)
 
-        self._anim_thread = threading.Thread(target=loop, daemon=True)
-        self._anim_thread.start()
-    
     def show_text(self, lines):
         """Показать текст (список строк)"""
         if not self._enabled:
@@ -160,7 +371,6 @@ class Display:
         self.show_text([line1, line2, line3])
     
     def show_recording(self, seconds_left):
-        self.stop_animation()
         image = Image.new('1', (self.width, self.height), 0)
         draw = ImageDraw.Draw(image)
         font = ImageFont.load_default()
@@ -176,14 +386,33 @@ class Display:
         self.display_image(image)
     
     def _font(self, size):
-        try:
-            return ImageFont.truetype(
-                "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", size
-            )
-        except Exception:
-            return ImageFont.load_default()
+        font = self._fonts.get(size)
+        if font is None:
+            try:
+                font = ImageFont.truetype(FONT_PATH, size)
+            except Exception:
+                font = ImageFont.load_default()
+            self._fonts[size] = font
+        return font
 
     def _wrap(self, draw, text, font, max_w):
+        """Разбивка текста на строки (не больше двух); раскладки кешируются"""
+        key = (str(text), id(font), max_w)
+        with self._cache_lock:
+            lines = self._layouts.get(key)
+            if lines is not None:
+                self._layouts.move_to_end(key)
+                return list(lines)
+        # Раскладка (textbbox) считается вне блокировки
+        lines = self._layout(draw, text, font, max_w)
+        with self._cache_lock:
+            self._layouts[key] = lines
+            self._layouts.move_to_end(key)
+            while len(self._layouts) > LAYOUT_CACHE_SIZE:
+                self._layouts.popitem(last=False)
+        return list(lines)
+
+    def _layout(self, draw, text, font, max_w):
         words = str(text).split()
         if not words:
             return [""]
@@ -219,33 +448,37 @@ class Display:
                 draw.ellipse((cx + dx - r, cy - r, cx + dx + r, cy + r), fill=1)
             return img
 
-        self._animate(frame, fps=4)
+        self._animate(('analyzing',), frame, period=3, fps=4)
 
     def show_downloading(self, title):
         f_top = self._font(13)
         f_title = self._font(11)
-        title_lines = None
+        bar_w, step = 22, 6
+        background = None
 
         def frame(i):
-            nonlocal title_lines
-            img = Image.new("1", (self.width, self.height), 0)
+            nonlocal background
+            if background is None:
+                # заголовок и название одинаковы во всех кадрах - рисуем один раз
+                background = Image.new("1", (self.width, self.height), 0)
+                draw = ImageDraw.Draw(background)
+                draw.text((4, 2), "Downloading", fill=1, font=f_top)
+                for n, line in enumerate(self._wrap(draw, title, f_title, self.width - 8)):
+                    draw.text((4, 22 + n * 14), line, fill=1, font=f_title)
+                draw.rectangle((4, 56, self.width - 5, 60), outline=1)
+            img = background.copy()
             draw = ImageDraw.Draw(img)
-            if title_lines is None:
-                title_lines = self._wrap(draw, title, f_title, self.width - 8)
-            draw.text((4, 2), "Downloading", fill=1, font=f_top)
-            for n, line in enumerate(title_lines):
-                draw.text((4, 22 + n * 14), line, fill=1, font=f_title)
             # бегущая полоска внизу
-            bar_w = 22
-            x = (i * 6) % (self.width + bar_w) - bar_w
-            draw.rectangle((4, 56, self.width - 5, 60), outline=1)
-            draw.rectangle((max(5, x), 57, min(self.width - 6, x + bar_w), 59), fill=1)
+            x = (i * step) % (self.width + bar_w) - bar_w
+            left, right = max(5, x), min(self.width - 6, x + bar_w)
+            if left <= right:
+                draw.rectangle((left, 57, right, 59), fill=1)
             return img
 
-        self._animate(frame, fps=8)
+        period = (self.width + bar_w) // math.gcd(step, self.width + bar_w)
+        self._animate(('downloading', str(title)), frame, period=period, fps=8)
 
     def show_cancelled(self):
-        self.stop_animation()
         img = Image.new("1", (self.width, self.height), 0)
         draw = ImageDraw.Draw(img)
         f = self._font(16)
@@ -258,7 +491,6 @@ class Display:
 
     def show_confirm(self, title, artist):
         """Распознано — спрашиваем: скачивать или пропустить."""
-        self.stop_animation()
         img = Image.new("1", (self.width, self.height), 0)
         draw = ImageDraw.Draw(img)
         f_title = self._font(13)
@@ -278,7 +510,6 @@ class Display:
 
     def show_result(self, title, artist, size_mb=None):
         """Финальный экран: остаётся на дисплее до следующего нажатия."""
-        self.stop_animation()
         img = Image.new("1", (self.width, self.height), 0)
         draw = ImageDraw.Draw(img)
 
@@ -309,7 +540,6 @@ class Display:
         self.show_result(title, artist, size_mb=size_mb)
 
     def show_error(self, message):
-        self.stop_animation()
         img = Image.new("1", (self.width, self.height), 0)
         draw = ImageDraw.Draw(img)
         f_big = self._font(16)
@@ -321,18 +551,40 @@ class Display:
         draw.text((self.width - 30, 54), "PRESS", fill=1, font=f_small)
         self.display_image(img)
 
-    def show_ready(self):
-        self.stop_animation()
+    def show_ready(self, pending=0):
+        """pending - записей в офлайн-очереди (показываются в углу)"""
         img = Image.new("1", (self.width, self.height), 0)
         draw = ImageDraw.Draw(img)
         f_big = self._font(15)
         f_small = self._font(10)
         draw.text((6, 16), "FlashShazam", fill=1, font=f_big)
         draw.line((0, 40, self.width - 1, 40), fill=1)
-        draw.text((26, 48), "press button", fill=1, font=f_small)
+        if pending:
+            draw.text((3, 48), "press", fill=1, font=f_small)
+            text = f"queue {pending}"
+            bbox = draw.textbbox((0, 0), text, font=f_small)
+            draw.text((self.width - 3 - (bbox[2] - bbox[0]), 48), text, fill=1, font=f_small)
+        else:
+            draw.text((26, 48), "press button", fill=1, font=f_small)
+        self.display_image(img)
+
+    def show_offline(self, pending):
+        """Нет сети: запись сохранена и будет распознана позже"""
+        img = Image.new("1", (self.width, self.height), 0)
+        draw = ImageDraw.Draw(img)
+        f_big = self._font(15)
+        f_small = self._font(10)
+        draw.text((28, 2), "OFFLINE", fill=1, font=f_big)
+        draw.text((3, 24), "saved, will recognize", fill=1, font=f_small)
+        draw.text((3, 36), "when online", fill=1, font=f_small)
+        draw.line((0, 52, self.width - 1, 52), fill=1)
+        draw.text((3, 54), f"queue {pending}", fill=1, font=f_small)
+        draw.text((self.width - 30, 54), "PRESS", fill=1, font=f_small)
         self.display_image(img)
     
     def __del__(self):
+        if self._compositor is not None:
+            self._scenes.put(('close',))
         if self.bus:
             self.bus.close()
 
@@ -364,6 +616,7 @@ if __name__ == '__main__':
         time.sleep(2)
         
         display.clear()
-        print('Test complete!')
+        display.close()
+        print(f'Test complete! {display.stats()}')
     else:
         print('OLED not available')
@@ -1,122 +1,432 @@
 #!/usr/bin/env python3
 """
 FlashShazam для Raspberry Pi с OLED и кнопкой
+
+Один asyncio-цикл: события кнопки, запись, распознавание и скачивание -
+отдельные задачи. Блокирующие вызовы (микрофон, HTTP) уходят в потоки
+через asyncio.to_thread, дисплей не блокирует сам по себе.
+
+Старт: сначала дисплей с экраном ready и кнопка, тяжёлые модули
+(pyaudio, requests, apify) импортируются и создаются параллельно в фоне.
 """
 
 import time
+IMPORTS_STARTED = time.perf_counter()
+
+import asyncio
 import os
-from audio_recorder import AudioRecorder
-from shazam_recognizer import ShazamRecognizer
-from spotify_downloader import SpotifyDownloader
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from display import Display
 from button import Button
+from audio_windows import budget, load_wav, recognize_best_window
+from offline_queue import OfflineQueue, is_offline_error
+import metrics
+import tracing
 from config import Config
 
 
+# Состояния цикла распознавания
+IDLE = 'idle'  # ждём нажатия (на экране ready или последний результат)
+STARTING = 'starting'  # цикл создан, ждёт готовности сервисов
+RECORDING = 'recording'
+ANALYZING = 'analyzing'
+CONFIRM = 'confirm'  # распознано, ждём решения: скачивать или нет
+
+STARTUP_TARGET = 1.0  # секунд от запуска процесса до готовности к нажатию
+
+
+def process_age():
+    """Секунд с запуска процесса (по /proc), None - если узнать нельзя"""
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTimer:
+    """Разбивка времени старта: фазы (в т.ч. параллельные) и вехи от запуска процесса"""
+
+    def __init__(self):
+        now = time.perf_counter()
+        age = process_age()
+        self.origin = now - age if age is not None else IMPORTS_STARTED
+        self.phases = [('python', 0.0, IMPORTS_STARTED - self.origin),
+                       ('imports', IMPORTS_STARTED - self.origin, now - IMPORTS_STARTED)]
+        self.marks = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases.append((name, start - self.origin, time.perf_counter() - start))
+
+    def timed(self, name, fn, *args):
+        with self.phase(name):
+            return fn(*args)
+
+    def mark(self, name):
+        with self._lock:
+            self.marks.append((name, time.perf_counter() - self.origin))
+
+    def report(self):
+        print("\n⏱  Старт (мс от запуска процесса):")
+        for name, start, duration in sorted(self.phases, key=lambda p: p[1]):
+            print(f"   {name:12} {start * 1000:6.0f} → {(start + duration) * 1000:6.0f}  ({duration * 1000:.0f})")
+            metrics.stage_seconds.observe(duration, stage=f'startup_{name}')
+        for name, at in self.marks:
+            flag = '✅' if name != 'interactive' or at <= STARTUP_TARGET else '⚠️'
+            print(f"   {flag} {name}: {at:.2f} с")
+
+
+def create_recorder():
+    from audio_recorder import AudioRecorder
+    return AudioRecorder(input_device_index=0)  # INMP441
+
+
+def create_recognizer():
+    from shazam_recognizer import ShazamRecognizer
+    return ShazamRecognizer()
+
+
+def create_downloader():
+    from spotify_downloader import SpotifyDownloader
+    return SpotifyDownloader()
+
+
+def create_storage():
+    from storage_manager import create_storage_manager
+    storage = create_storage_manager()
+    storage.start()
+    return storage
+
+
+# Сервисы, которые создаются в фоне: имя атрибута Orchestrator -> фабрика
+SERVICES = {
+    'recorder': create_recorder,
+    'recognizer': create_recognizer,
+    'downloader': create_downloader,
+    'storage': create_storage,
+}
+
+
+def report_slow_cycle():
+    """Если цикл попал под профайлер - печатает самые частые стеки"""
+    traces = tracing.tracer.recent(limit=1)
+    if not traces or not traces[0].samples:
+        return
+    trace = traces[0].to_dict()
+    print(f"\n🐢 Медленный цикл: {trace['duration']:.1f}с, выборок стека: {trace['profile']['samples']}")
+    for entry in trace['profile']['stacks'][:3]:
+        print(f"   {entry['count']:>4} × {entry['stack'].split(';')[-1]}")
+
+
+class Orchestrator:
+    """
+    Конечный автомат поверх событий кнопки.
+
+    Короткое нажатие: в IDLE - новая запись, в CONFIRM - скачать.
+    Долгое (hold): в RECORDING/ANALYZING - отмена цикла, в CONFIRM - пропустить,
+    в IDLE - отмена идущих скачиваний.
+    Скачивание идёт фоновой задачей: следующая запись может начаться,
+    не дожидаясь его окончания. Без сети запись уходит в офлайн-очередь.
+
+    Сервисы (recorder, recognizer, ...) можно передать готовыми или
+    futures через services - нажатие до их готовности просто подождёт.
+    """
+
+    def __init__(self, display, button, services=None, startup=None, **ready):
+        self.display = display
+        self.button = button
+        self.services = services or {}
+        self.startup = startup
+        self.recorder = ready.get('recorder')
+        self.recognizer = ready.get('recognizer')
+        self.downloader = ready.get('downloader')
+        self.storage = ready.get('storage')
+        self.offline = ready.get('offline')
+        self.ready = None
+        self.pending = 0
+        self.loop = None
+        self.state = IDLE
+        self.cycle = None
+        self.downloads = set()
+        self.decision = None
+        self.stop_recording = threading.Event()
+
+    def set_state(self, state):
+        self.state = state
+        print(f"[{state}]")
+
+    async def run(self):
+        loop = self.loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        self.button.add_listener(lambda event: loop.call_soon_threadsafe(events.put_nowait, event))
+        self.ready = asyncio.create_task(self.attach_services())
+        if self.startup is not None:
+            self.startup.mark('interactive')
+
+        print("\nНажмите кнопку...")
+        try:
+            while True:
+                event = await events.get()
+                if event.kind == 'short':
+                    self.on_short_press()
+                elif event.kind == 'hold':
+                    self.on_long_press()
+        finally:
+            # Поток записи сам не остановится - иначе asyncio.run ждёт его до конца
+            self.stop_recording.set()
+
+    async def attach_services(self):
+        """Дожидается фоновой инициализации и запускает офлайн-очередь"""
+        for name, future in self.services.items():
+            setattr(self, name, await asyncio.wrap_future(future))
+        if self.offline is None:
+            self.offline = await asyncio.to_thread(
+                OfflineQueue, lambda path: self.recognize(path, optional=True),
+                storage=self.storage, on_change=self.on_queue_change
+            )
+            self.offline.start()
+        self.pending = self.offline.pending()
+        if self.pending:
+            print(f"✓ В офлайн-очереди: {self.pending}")
+            self.show_idle()
+        if self.startup is not None:
+            self.startup.mark('services')
+            self.startup.report()
+
+    def on_short_press(self):
+        if self.state == IDLE:
+            if self.cycle is not None and not self.cycle.done():
+                return  # прошлый цикл ещё завершается
+            print("\n🔘 Кнопка нажата!")
+            # состояние - до create_task: второе нажатие до старта задачи не запустит ещё цикл
+            self.set_state(STARTING)
+            self.cycle = asyncio.create_task(self.run_cycle())
+        elif self.state == CONFIRM and not self.decision.done():
+            self.decision.set_result(True)
+
+    def on_long_press(self):
+        if self.state in (STARTING, RECORDING, ANALYZING):
+            self.stop_recording.set()
+            self.cycle.cancel()
+        elif self.state == CONFIRM and not self.decision.done():
+            self.decision.set_result(False)
+        elif self.state == IDLE and self.downloads:
+            for task in self.downloads:
+                task.cancel()
+
+    def show_idle(self):
+        if self.state == IDLE and not self.downloads:
+            self.display.show_ready(self.pending)
+
+    def on_queue_change(self, pending, path, result):
+        """Из потока офлайн-очереди: переносим в цикл событий"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._queue_changed, pending, result)
+
+    def _queue_changed(self, pending, result):
+        self.pending = pending
+        if self.state != IDLE or self.downloads or result is None:
+            return
+        if result.get('success'):
+            # распознано из очереди - показываем, пока кнопку никто не трогает
+            self.display.show_result(result['title'], result['artist'])
+        else:
+            self.display.show_ready(pending)
+
+    async def is_online(self):
+        if self.offline is None:
+            return True
+        return await asyncio.to_thread(self.offline.connectivity.online)
+
+    def save_offline(self, audio_file, error):
+        self.pending = self.offline.add(audio_file, error=error)
+        self.display.show_offline(self.pending)
+
+    async def run_cycle(self):
+        """Запись -> распознавание -> подтверждение. Скачивание запускается после."""
+        track = None
+        try:
+            # Нажали раньше, чем закончилась фоновая инициализация - ждём её
+            await asyncio.shield(self.ready)
+            with metrics.timed('process_track'), tracing.span('process_track'):
+                track = await self.process_track()
+        except asyncio.CancelledError:
+            self.display.show_cancelled()
+            print("⏹  Отменено")
+            asyncio.get_running_loop().call_later(1, self.show_idle)
+        except Exception as e:
+            self.display.show_error(str(e)[:60])
+            print(f"\n❌ Ошибка: {e}")
+            traceback.print_exc()
+        finally:
+            self.set_state(IDLE)
+            metrics.registry.dump(Config.METRICS_FILE)
+            report_slow_cycle()
+
+        # вне спана цикла: у скачивания своя трасса
+        if track is not None:
+            task = asyncio.create_task(self.download(*track))
+            self.downloads.add(task)
+            task.add_done_callback(self.downloads.discard)
+
+    async def process_track(self):
+        """Возвращает (title, artist, spotify_url), если трек нужно скачать"""
+        # 1. Запись (отмена - долгое нажатие)
+        self.set_state(RECORDING)
+        # своё событие на каждый цикл: поток прошлой отменённой записи не «оживёт»
+        stop = self.stop_recording = threading.Event()
+        print(f"\n🎤 Запись ({Config.RECORDING_DURATION} сек). Удерживай кнопку для отмены...")
+        countdown = asyncio.create_task(self.countdown(Config.RECORDING_DURATION))
+        try:
+            audio_file = await asyncio.to_thread(
+                self.recorder.record, Config.RECORDING_DURATION,
+                should_continue=lambda: not stop.is_set(),
+            )
+        finally:
+            countdown.cancel()
+        if audio_file is None:
+            raise asyncio.CancelledError()
+
+        print(f"✓ Записано: {audio_file}")
+        self.storage.track(audio_file)
+
+        # Без сети не тратим время на запрос - запись ждёт в очереди
+        if not await self.is_online():
+            self.save_offline(audio_file, 'Нет сети')
+            return None
+
+        # 2. Распознавание
+        self.set_state(ANALYZING)
+        self.display.show_analyzing()
+        print("\n🔍 Распознавание...")
+        recognition = await asyncio.to_thread(self.recognize, audio_file)
+
+        if self.offline is not None and is_offline_error(recognition):
+            self.offline.connectivity.mark_offline()
+            self.save_offline(audio_file, recognition.get('error'))
+            return None
+
+        if not recognition.get('success'):
+            error_msg = recognition.get('error', 'Unknown error')
+            self.display.show_error(error_msg[:60])
+            print(f"❌ Не распознано: {error_msg}")
+            return None
+
+        title = recognition['title']
+        artist = recognition['artist']
+        print(f"\n🎵 {title} - {artist}")
+
+        # 3. Подтверждение: короткое нажатие = скачать, долгое = пропустить
+        self.set_state(CONFIRM)
+        self.display.show_confirm(title, artist)
+        print("Нажми коротко = скачать, удерживай = пропустить")
+        self.decision = asyncio.get_running_loop().create_future()
+        if not await self.decision:
+            self.display.show_result(title, artist)
+            print("⏭  Скачивание пропущено")
+            return None
+        return title, artist, recognition.get('spotify_url', '')
+
+    async def countdown(self, seconds):
+        for left in range(seconds, 0, -1):
+            self.display.show_recording(left)
+            await asyncio.sleep(1)
+
+    def recognize(self, audio_file, optional=False):
+        """
+        optional - запрос не от нажатия (офлайн-очередь): каждый запрос берёт
+        слот бюджета, None - бюджет исчерпан
+        """
+        with self.storage.pinned(audio_file):
+            if Config.BEST_WINDOW_ENABLED:
+                # Отправляем только самый узнаваемый фрагмент записи
+                samples, rate = load_wav(audio_file)
+                return recognize_best_window(self.recognizer, samples, rate, optional=optional)
+            if not optional:
+                budget.note()
+            elif not budget.try_acquire():
+                return None
+            return self.recognizer.recognize_file(audio_file)
+
+    async def download(self, title, artist, spotify_url):
+        """Фоновое скачивание; экран обновляется, только если его не занял новый цикл"""
+        self.display.show_downloading(title)
+        print("\n📥 Скачивание...")
+        try:
+            with tracing.span('download', title=title):
+                download = await asyncio.to_thread(
+                    self.downloader.download_track, title, artist, spotify_url
+                )
+        except asyncio.CancelledError:
+            # поток дорабатывает сам, результат просто не ждём
+            print(f"⏹  Скачивание отменено: {title}")
+            if self.state == IDLE:
+                self.display.show_cancelled()
+                asyncio.get_running_loop().call_later(1, self.show_idle)
+            raise
+
+        size_mb = None
+        if download.get('success'):
+            self.storage.track(download.get('file_path'))
+            size_mb = download.get('file_size', 0) / 1024 / 1024
+            print(f"\n✅ Готово: {download['filename']}")
+        else:
+            print(f"⚠️ Не удалось скачать: {download.get('error')}")
+        if self.state == IDLE:
+            self.display.show_result(title, artist, size_mb=size_mb)
+        print("\n" + "=" * 60)
+
+
 def main():
     print("=" * 60)
     print("🎵 FlashShazam - Raspberry Pi Edition")
     print("=" * 60)
-    
-    # Инициализация
-    recorder = AudioRecorder(input_device_index=0)  # INMP441
-    recognizer = ShazamRecognizer()
-    downloader = SpotifyDownloader()
-    display = Display()
-    button = Button()
-    
+    startup = StartupTimer()
+
+    # Сначала то, что нужно для отклика: экран и кнопка
+    with startup.phase('display'):
+        display = Display()
+        display.show_ready()
+        display.flush()
+    startup.mark('ready_screen')
+    with startup.phase('button'):
+        button = Button(double_gap=0)  # двойные нажатия не нужны - короткое без задержки
+
+    # Остальное - параллельно в фоне
+    pool = ThreadPoolExecutor(max_workers=len(SERVICES), thread_name_prefix='init')
+    services = {name: pool.submit(startup.timed, name, factory) for name, factory in SERVICES.items()}
+    pool.shutdown(wait=False)
+
     print(f"\n✓ Длительность записи: {Config.RECORDING_DURATION} сек")
     print(f"✓ Записи: {Config.RECORDINGS_DIR}/")
     print(f"✓ Скачанные: {Config.DOWNLOADS_DIR}/")
-    
-    def process_track():
-        """Полный цикл распознавания"""
-        try:
-            # 1. Запись (с возможностью отмены долгим нажатием во время записи)
-            display.show_recording(Config.RECORDING_DURATION)
-            print(f"\n🎤 Запись ({Config.RECORDING_DURATION} сек). Удерживай кнопку 1.5с для отмены...")
-
-            def keep_going():
-                # отмена если кнопка зажата дольше 1.5 сек
-                return button.held_for() < 1.5
-
-            audio_file = recorder.record(Config.RECORDING_DURATION, should_continue=keep_going)
-
-            if audio_file is None:
-                display.show_cancelled()
-                time.sleep(1)
-                display.show_ready()
-                print("⏹  Запись отменена")
-                return
-
-            print(f"✓ Записано: {audio_file}")
-
-            # 2. Распознавание
-            display.show_analyzing()
-            print("\n🔍 Распознавание...")
-            recognition = recognizer.recognize_file(audio_file)
-
-            if not recognition.get('success'):
-                error_msg = recognition.get('error', 'Unknown error')
-                display.show_error(error_msg[:60])
-                print(f"❌ Не распознано: {error_msg}")
-                return
-
-            title = recognition['title']
-            artist = recognition['artist']
-            spotify_url = recognition.get('spotify_url', '')
-
-            print(f"\n🎵 {title} - {artist}")
-
-            # 3. Подтверждение: короткое нажатие = скачать, долгое = пропустить
-            display.show_confirm(title, artist)
-            print("Нажми коротко = скачать, удерживай = пропустить")
-            action = button.wait_for_press_classified(long_threshold=1.0)
-
-            if action == 'long':
-                display.show_result(title, artist)
-                print("⏭  Скачивание пропущено")
-                print("\n" + "=" * 60)
-                return
-
-            # 4. Скачивание
-            display.show_downloading(title)
-            print("\n📥 Скачивание...")
-            download = downloader.download_track(title, artist, spotify_url)
-
-            if download.get('success'):
-                size_mb = download.get('file_size', 0) / 1024 / 1024
-                display.show_result(title, artist, size_mb=size_mb)
-                print(f"\n✅ Готово: {download['filename']}")
-            else:
-                display.show_result(title, artist)
-                print(f"⚠️ Не удалось скачать: {download.get('error')}")
-
-            print("\n" + "=" * 60)
-
-        except KeyboardInterrupt:
-            raise
-        except Exception as e:
-            display.show_error(str(e)[:60])
-            print(f"\n❌ Ошибка: {e}")
-            import traceback
-            traceback.print_exc()
 
-    # Главный цикл: первый раз показываем ready, дальше результат остаётся до нажатия
-    display.show_ready()
+    orchestrator = Orchestrator(display, button, services=services, startup=startup)
     try:
-        while True:
-            print("\n" + "-" * 60)
-            print("Нажмите кнопку...")
-            if button.wait_for_press():
-                print("\n🔘 Кнопка нажата!")
-                process_track()
-                
+        asyncio.run(orchestrator.run())
     except KeyboardInterrupt:
         print("\n\n👋 Прервано")
     finally:
+        if orchestrator.offline is not None:
+            orchestrator.offline.stop()
+        if orchestrator.storage is not None:
+            orchestrator.storage.stop()
         button.cleanup()
         display.clear()
+        display.close()
 
 
 if __name__ == '__main__':
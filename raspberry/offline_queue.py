@@ -0,0 +1,232 @@
+"""
+Офлайн-очередь: записи, сделанные без сети, распознаются позже
+
+Очередь хранится в SQLite (переживает перезапуск сервиса). Фоновый поток
+дожидается сети и разбирает очередь по одной записи, не чаще
+OFFLINE_DRAIN_INTERVAL и только при свободном бюджете запросов к API.
+"""
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+from audio_windows import budget, is_miss
+from config import Config
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    title TEXT,
+    artist TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pending_status ON pending(status);
+"""
+
+# Статусы записи в очереди
+STATUS_PENDING = 'pending'
+STATUS_RECOGNIZED = 'recognized'
+STATUS_NOT_RECOGNIZED = 'not_recognized'
+STATUS_FAILED = 'failed'  # исчерпаны попытки или файл пропал
+
+
+class Connectivity:
+    """
+    Дешёвая проверка сети: TCP connect к API (DNS + рукопожатие, без HTTP).
+    Результат кешируется на OFFLINE_CHECK_TTL секунд.
+    """
+
+    def __init__(self, host=None, port=443, timeout=None, ttl=None):
+        self.host = host or Config.OFFLINE_CHECK_HOST
+        self.port = port
+        self.timeout = timeout or Config.OFFLINE_CHECK_TIMEOUT
+        self.ttl = ttl if ttl is not None else Config.OFFLINE_CHECK_TTL
+        self._online = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def online(self):
+        with self._lock:
+            if self._online is not None and time.monotonic() - self._checked_at < self.ttl:
+                return self._online
+        try:
+            socket.create_connection((self.host, self.port), timeout=self.timeout).close()
+            online = True
+        except OSError:
+            online = False
+        self._set(online)
+        return online
+
+    def mark_offline(self):
+        """Запрос упал с сетевой ошибкой - не ждём TTL"""
+        self._set(False)
+
+    def _set(self, online):
+        with self._lock:
+            if online != self._online:
+                print('🌐 Сеть доступна' if online else '📴 Нет сети - записи копятся в очереди')
+            self._online = online
+            self._checked_at = time.monotonic()
+
+
+def is_offline_error(result):
+    """Распознавание не дошло до API из-за сети"""
+    return not result.get('success') and bool(result.get('offline'))
+
+
+class OfflineQueue:
+    """
+    Очередь записей на распознавание.
+
+    recognize(path) -> результат распознавания (как у ShazamRecognizer) или
+    None, если бюджет запросов к API исчерпан. Слоты бюджета берёт сам
+    recognize на каждый отправленный запрос - очередь их только проверяет.
+    on_change(pending, path, result) вызывается из фонового потока после
+    каждой разобранной записи и при добавлении новой (result=None).
+    """
+
+    def __init__(self, recognize, db_path=None, connectivity=None, storage=None, on_change=None):
+        self.recognize = recognize
+        self.db_path = db_path or Config.OFFLINE_QUEUE_DB
+        self.connectivity = connectivity or Connectivity()
+        self.storage = storage
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(SCHEMA)
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+        # Записи из очереди не должны вытесняться, пока не распознаны
+        if self.storage is not None:
+            for row in self._pending_rows():
+                self.storage.pin(row['path'])
+
+    def add(self, path, error=None):
+        """Кладёт запись в очередь; возвращает число ожидающих"""
+        now = time.time()
+        with self._lock, self._db:
+            inserted = self._db.execute(
+                'INSERT OR IGNORE INTO pending (path, status, last_error, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (os.path.abspath(path), STATUS_PENDING, error, now, now),
+            ).rowcount
+        if inserted and self.storage is not None:
+            self.storage.pin(path)
+        pending = self.pending()
+        print(f"📥 В офлайн-очереди: {pending}")
+        self._notify(pending, path, None)
+        self._wakeup.set()
+        return pending
+
+    def pending(self):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT COUNT(*) FROM pending WHERE status = ?', (STATUS_PENDING,)
+            ).fetchone()
+        return row[0]
+
+    def _pending_rows(self, limit=None):
+        with self._lock:
+            return [dict(r) for r in self._db.execute(
+                'SELECT * FROM pending WHERE status = ? ORDER BY id LIMIT ?',
+                (STATUS_PENDING, limit or -1),
+            ).fetchall()]
+
+    def _finish(self, row, status, error=None, title=None, artist=None, attempt=True):
+        """attempt=False - запрос не дошёл до API (сеть), попытка не считается"""
+        with self._lock, self._db:
+            self._db.execute(
+                'UPDATE pending SET status = ?, attempts = attempts + ?, last_error = ?, '
+                'title = ?, artist = ?, updated_at = ? WHERE id = ?',
+                (status, int(attempt), error, title, artist, time.time(), row['id']),
+            )
+        if status != STATUS_PENDING and self.storage is not None:
+            self.storage.unpin(row['path'])
+
+    def recent(self, limit=20):
+        """Последние разобранные записи (для отчёта)"""
+        with self._lock:
+            return [dict(r) for r in self._db.execute(
+                'SELECT * FROM pending WHERE status != ? ORDER BY updated_at DESC LIMIT ?',
+                (STATUS_PENDING, limit),
+            ).fetchall()]
+
+    def drain_one(self):
+        """
+        Распознаёт самую старую запись из очереди.
+        Возвращает результат или None, если разбирать нечего / нельзя сейчас.
+        """
+        rows = self._pending_rows(limit=1)
+        if not rows or not self.connectivity.online():
+            return None
+        if not budget.available():
+            return None  # бюджет API занят живыми нажатиями - подождём
+        row = rows[0]
+        if not os.path.exists(row['path']):
+            self._finish(row, STATUS_FAILED, error='Файл записи пропал')
+            return None
+
+        result = self.recognize(row['path'])
+        if result is None:
+            return None  # бюджет заняли между проверкой и запросом
+        if is_offline_error(result):
+            self.connectivity.mark_offline()
+            self._finish(row, STATUS_PENDING, error=result.get('error'), attempt=False)
+            return None
+
+        if result.get('success'):
+            self._finish(row, STATUS_RECOGNIZED, title=result.get('title'), artist=result.get('artist'))
+            print(f"✅ Из очереди: {result['title']} - {result['artist']}")
+        elif is_miss(result) or row['attempts'] + 1 >= Config.OFFLINE_MAX_ATTEMPTS:
+            self._finish(row, STATUS_NOT_RECOGNIZED, error=result.get('error'))
+            print(f"❌ Из очереди не распознано: {result.get('error')}")
+        else:
+            self._finish(row, STATUS_PENDING, error=result.get('error'))
+        self._notify(self.pending(), row['path'], result)
+        return result
+
+    def _notify(self, pending, path, result):
+        if self.on_change is None:
+            return
+        try:
+            self.on_change(pending, path, result)
+        except Exception as e:
+            print(f"⚠️ Ошибка обработчика очереди: {e}")
+
+    def start(self):
+        """Запускает фоновый разбор очереди"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='offline-queue', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if not self.pending():
+                self._wakeup.wait()  # пусто - спим до add()
+                self._wakeup.clear()
+                continue
+            drained = self.drain_one() is not None
+            # Между записями - пауза; без сети или бюджета - реже
+            self._wakeup.wait(Config.OFFLINE_DRAIN_INTERVAL if drained else Config.OFFLINE_CHECK_INTERVAL)
+            self._wakeup.clear()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Радио-режим: Pi слушает эфир непрерывно и распознаёт трек только
+при смене звучания.
+
+По каждому блоку звука считается дешёвая сигнатура (хрома 12 нот +
+грубая спектральная огибающая). Запрос к Shazam уходит, только если
+сигнатура несколько блоков подряд заметно отличается от сигнатуры
+последнего распознанного трека - не по таймеру. Запросы ограничены
+RADIO_MIN_INTERVAL и общим бюджетом API. Сыгранное пишется в журнал
+JSON Lines с временем.
+
+Останови flashshazam перед запуском: sudo systemctl stop flashshazam
+
+Использование:
+    python3 radio.py
+    python3 radio.py --log shop.jsonl --duration 3600 --no-display
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+from audio_windows import budget, is_miss, segment_wav_bytes
+from config import Config
+
+
+ANALYSIS_RATE = 11025  # до этой частоты прореживаем перед FFT
+FFT_SIZE = 4096  # ~0.37 с на 11 кГц, разрешение ~2.7 Гц
+CHROMA_HZ = (80, 2000)  # ноты ищем здесь: ниже - гул, выше - гармоники и шум
+ENVELOPE_EDGES_HZ = (80, 250, 500, 1000, 2000, 3500, 5500)
+ENVELOPE_WEIGHT = 0.5  # вклад огибающей в сигнатуру относительно хромы
+
+
+def _chroma_matrix(freqs):
+    """Матрица (бины FFT x 12): к какой ноте относится каждый бин"""
+    matrix = np.zeros((len(freqs), 12), dtype=np.float32)
+    band = (freqs >= CHROMA_HZ[0]) & (freqs <= CHROMA_HZ[1])
+    pitch = np.round(12 * np.log2(freqs[band] / 440.0)).astype(int) % 12
+    matrix[np.flatnonzero(band), pitch] = 1.0
+    return matrix
+
+
+_FREQS = np.fft.rfftfreq(FFT_SIZE, 1.0 / ANALYSIS_RATE)
+_CHROMA = _chroma_matrix(_FREQS)
+_ENVELOPE = np.searchsorted(_FREQS, ENVELOPE_EDGES_HZ)
+_WINDOW = np.hanning(FFT_SIZE).astype(np.float32)
+
+
+def signature(samples, rate):
+    """
+    Сигнатура блока: нормированный вектор (хрома 12 + огибающая 6).
+    Возвращает (вектор или None для тишины, RMS блока).
+    """
+    x = samples.astype(np.float32) / 32768.0
+    rms = float(np.sqrt(np.mean(x * x))) if len(x) else 0.0
+    if rms < Config.RADIO_SILENCE_RMS:
+        return None, rms
+
+    # Прореживание усреднением: грубый ФНЧ, для хромы до 2 кГц достаточно
+    factor = max(1, rate // ANALYSIS_RATE)
+    x = x[:len(x) // factor * factor].reshape(-1, factor).mean(axis=1)
+    n_frames = len(x) // FFT_SIZE
+    if n_frames == 0:
+        return None, rms
+    frames = x[:n_frames * FFT_SIZE].reshape(n_frames, FFT_SIZE)
+    power = np.abs(np.fft.rfft(frames * _WINDOW, axis=1)) ** 2
+
+    chroma = (power @ _CHROMA).sum(axis=0)
+    chroma /= np.linalg.norm(chroma) + 1e-12
+    bands = np.add.reduceat(power.sum(axis=0)[:_ENVELOPE[-1]], _ENVELOPE[:-1])
+    envelope = np.log10(bands + 1e-12)
+    envelope -= envelope.mean()  # форма спектра, без громкости
+    envelope /= np.linalg.norm(envelope) + 1e-12
+
+    vector = np.concatenate((chroma, ENVELOPE_WEIGHT * envelope))
+    return vector / np.linalg.norm(vector), rms
+
+
+def distance(a, b):
+    """Косинусное расстояние сигнатур: 0 - одно и то же, 1+ - совсем разное"""
+    return float(1.0 - np.dot(a, b))
+
+
+class RadioMonitor:
+    """
+    Непрерывное прослушивание с распознаванием по смене звучания.
+
+    reference - сигнатура последнего отправленного звука; пока текущая
+    (скользящее среднее по блокам) близка к ней, API не трогаем.
+    """
+
+    def __init__(self, recorder, recognizer, log_path=None, display=None):
+        self.recorder = recorder
+        self.recognizer = recognizer
+        self.log_path = log_path or Config.RADIO_LOG_FILE
+        self.display = display
+        self.rate = recorder.rate
+        self.reference = None
+        self.current = None
+        self.changed_blocks = []  # блоки (отсчёты, сигнатура) с начала изменения
+        self.silent_blocks = 0  # тихих блоков подряд
+        self.last_key = None
+        self.last_request = 0.0
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='radio')
+        self._inflight = None
+        self.stats = {'blocks': 0, 'silent': 0, 'changes': 0, 'requests': 0,
+                      'plays': 0, 'analysis': 0.0}
+
+    def run(self, duration=0):
+        """Слушает duration секунд (0 - пока не прервут)"""
+        deadline = time.monotonic() + duration if duration else None
+        print(f"📻 Радио-режим: блоки {Config.RADIO_BLOCK_SECONDS}с, порог {Config.RADIO_CHANGE_THRESHOLD}, "
+              f"не чаще раза в {Config.RADIO_MIN_INTERVAL}с. Журнал: {self.log_path}")
+        if self.display is not None:
+            self.display.show_text(['RADIO MODE', 'listening...'])
+        try:
+            for block in self.recorder.listen(
+                Config.RADIO_BLOCK_SECONDS,
+                should_continue=lambda: deadline is None or time.monotonic() < deadline,
+            ):
+                self.feed(block)
+        finally:
+            self._pool.shutdown(wait=True)
+            self._collect()
+            self.report()
+
+    def feed(self, block):
+        """Один блок звука: сигнатура, детектор смены, при необходимости - запрос"""
+        self._collect()
+        start = time.perf_counter()
+        vector, rms = signature(block, self.rate)
+        self.stats['analysis'] += time.perf_counter() - start
+        self.stats['blocks'] += 1
+
+        if vector is None:
+            self.stats['silent'] += 1
+            self.silent_blocks += 1
+            self.current = None
+            self.changed_blocks = []
+            if self.silent_blocks >= Config.RADIO_SILENCE_RESET_BLOCKS:
+                # Пауза между треками: после неё любое звучание - кандидат на новый трек.
+                # Тихое место внутри трека короче - reference переживает его
+                self.reference = None
+            return
+        self.silent_blocks = 0
+
+        self.current = vector if self.current is None else 0.5 * (self.current + vector)
+        self.current /= np.linalg.norm(self.current)
+
+        if self.reference is not None and distance(self.current, self.reference) < Config.RADIO_CHANGE_THRESHOLD:
+            self.changed_blocks = []
+            return
+
+        self.changed_blocks.append((block, vector))
+        max_blocks = max(1, int(Config.RADIO_BUFFER_SECONDS / Config.RADIO_BLOCK_SECONDS))
+        del self.changed_blocks[:-max_blocks]
+        if len(self.changed_blocks) == Config.RADIO_CHANGE_BLOCKS:
+            self.stats['changes'] += 1
+            print(f"🔀 Звучание изменилось"
+                  + (f" (расстояние {distance(self.current, self.reference):.2f})" if self.reference is not None else ""))
+        if len(self.changed_blocks) >= Config.RADIO_CHANGE_BLOCKS:
+            self._maybe_recognize()
+
+    def _maybe_recognize(self):
+        if self._inflight is not None:
+            return
+        if time.monotonic() - self.last_request < Config.RADIO_MIN_INTERVAL:
+            return
+        if not budget.try_acquire():
+            return  # бюджет API занят - попробуем со следующим блоком
+        self.last_request = time.monotonic()
+        self.stats['requests'] += 1
+        samples = np.concatenate([b for b, _ in self.changed_blocks])
+        sent = np.mean([v for _, v in self.changed_blocks], axis=0)
+        sent /= np.linalg.norm(sent)
+        data = segment_wav_bytes(samples, self.rate)
+        future = self._pool.submit(self.recognizer.recognize_bytes, data, 'radio.wav')
+        self._inflight = (future, sent, datetime.now())
+
+    def _collect(self):
+        """Забирает готовый результат распознавания (без ожидания)"""
+        if self._inflight is None or not self._inflight[0].done():
+            return
+        future, sent, heard_at = self._inflight
+        self._inflight = None
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+
+        if result.get('success'):
+            self.reference = sent
+            self.changed_blocks = []
+            key = result.get('shazam_key') or f"{result['title']}|{result['artist']}"
+            if key != self.last_key:
+                self.last_key = key
+                self.log_play(result, heard_at)
+        elif is_miss(result):
+            # Неизвестный трек: запоминаем звучание, чтобы не спрашивать о нём снова
+            self.reference = sent
+            self.changed_blocks = []
+            print("❔ Не распознано - ждём следующей смены")
+        else:
+            print(f"⚠️ Ошибка распознавания: {result.get('error')} - повторим позже")
+
+    def log_play(self, result, heard_at):
+        self.stats['plays'] += 1
+        entry = {
+            'time': heard_at.isoformat(timespec='seconds'),
+            'title': result['title'],
+            'artist': result['artist'],
+            'shazam_key': result.get('shazam_key', ''),
+            'spotify_url': result.get('spotify_url', ''),
+        }
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        print(f"🎵 {heard_at:%H:%M:%S} {result['title']} - {result['artist']}")
+        if self.display is not None:
+            self.display.show_result(result['title'], result['artist'])
+
+    def report(self):
+        blocks = self.stats['blocks'] or 1
+        print(f"\n📊 Блоков: {self.stats['blocks']} (тишина {self.stats['silent']}), "
+              f"смен: {self.stats['changes']}, запросов: {self.stats['requests']}, "
+              f"треков в журнале: {self.stats['plays']}")
+        print(f"   Анализ: {self.stats['analysis'] / blocks * 1000:.1f} мс на блок "
+              f"{Config.RADIO_BLOCK_SECONDS}с "
+              f"({self.stats['analysis'] / (blocks * Config.RADIO_BLOCK_SECONDS) * 100:.2f}% CPU)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Радио-режим FlashShazam')
+    parser.add_argument('--log', help=f'журнал эфира (по умолчанию {Config.RADIO_LOG_FILE})')
+    parser.add_argument('--duration', type=int, default=0, help='секунд слушать (0 - без ограничения)')
+    parser.add_argument('--no-display', action='store_true', help='не использовать OLED')
+    args = parser.parse_args()
+
+    from audio_recorder import AudioRecorder
+    from shazam_recognizer import ShazamRecognizer
+
+    display = None
+    if not args.no_display:
+        from display import Display
+        display = Display()
+
+    monitor = RadioMonitor(AudioRecorder(input_device_index=0), ShazamRecognizer(), args.log, display)
+    try:
+        monitor.run(args.duration)
+    except KeyboardInterrupt:
+        print("\n👋 Прервано")
+    finally:
+        if display is not None:
+            display.clear()
+            display.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Перевод звука с нативного формата I2S-микрофона в формат распознавания
+
+INMP441 отдаёт 48 кГц S32_LE стерео, причём звук есть только в одном
+канале (по пину L/R). Shazam нужны 44.1 кГц mono int16. Вместо
+поотсчётной конвертации в plug-слое ALSA: выбор живого канала и
+полифазный ресемплинг 48000 -> 44100 (147/160) пачкой в NumPy.
+"""
+
+from math import gcd
+import numpy as np
+
+
+FULL_SCALE_32 = 2.0 ** 31
+
+
+def int32_frames(raw, channels):
+    """Байты S32_LE -> массив (кадры, каналы) int32"""
+    return np.frombuffer(raw, dtype='<i4').reshape(-1, channels)
+
+
+def live_channel(frames):
+    """Индекс канала со звуком: у INMP441 второй канал - нули или шум"""
+    if frames.shape[1] == 1:
+        return 0
+    level = np.abs(frames[::8].astype(np.float32)).mean(axis=0)
+    return int(np.argmax(level))
+
+
+def to_float(samples):
+    """int32 -> float32 в диапазоне [-1, 1)"""
+    return samples.astype(np.float32) / np.float32(FULL_SCALE_32)
+
+
+def to_int16(x):
+    return np.clip(np.round(x * 32767.0), -32768, 32767).astype(np.int16)
+
+
+class PolyphaseResampler:
+    """
+    Потоковый полифазный ресемплер с рациональным коэффициентом up/down.
+
+    Прототип ФНЧ - sinc с окном Кайзера на 2*half_taps отсчётов входа;
+    фильтр разложен на up фаз, и каждый выходной отсчёт - скалярное
+    произведение одной фазы на half_taps*2 входных отсчётов. Хвост
+    входа сохраняется между вызовами, так что куски стыкуются без щелчков.
+    """
+
+    def __init__(self, rate_in, rate_out, half_taps=16, rolloff=0.9, beta=8.0, block=8192):
+        g = gcd(rate_in, rate_out)
+        self.up = rate_out // g
+        self.down = rate_in // g
+        self.taps = 2 * half_taps
+        self.block = block
+
+        length = self.taps * self.up
+        m = np.arange(length) - (length - 1) / 2.0
+        cutoff = 0.5 * rolloff / max(self.up, self.down)  # циклов на отсчёт повышенной частоты
+        prototype = 2 * cutoff * np.sinc(2 * cutoff * m) * np.kaiser(length, beta) * self.up
+        # phases[p, j] = h[p + j*up]; порядок j - от нового отсчёта к старому
+        self.phases = prototype.reshape(self.taps, self.up).T.astype(np.float32)
+
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._start = -(self.taps - 1)  # абсолютный индекс первого отсчёта истории
+        self._next = 0  # абсолютный индекс следующего выходного отсчёта
+
+    def process(self, x):
+        """Очередной кусок float32 -> выходные отсчёты, готовые к этому моменту"""
+        buf = np.concatenate((self._history, np.asarray(x, dtype=np.float32)))
+        end = self._start + len(buf)  # абсолютный индекс за последним отсчётом
+        count = max(0, -(-(end * self.up) // self.down) - self._next)
+        out = np.empty(count, dtype=np.float32)
+        offsets = np.arange(self.taps)
+
+        for i in range(0, count, self.block):
+            n = np.arange(self._next + i, self._next + min(i + self.block, count), dtype=np.int64)
+            t = n * self.down
+            newest = t // self.up - self._start
+            window = buf[newest[:, None] - offsets[None, :]]
+            out[i:i + len(n)] = np.einsum('ij,ij->i', window, self.phases[t % self.up])
+
+        self._next += count
+        keep = self.taps - 1
+        self._history = buf[-keep:].copy() if keep else buf[:0]
+        self._start = end - keep
+        return out
+
+
+def to_recognition_format(raw, channels, rate_in, rate_out=44100, channel=None):
+    """
+    Целый клип S32_LE -> (mono int16 на rate_out, выбранный канал).
+    Один батч: выбор канала, перевод во float и ресемплинг.
+    """
+    frames = int32_frames(raw, channels)
+    if channel is None:
+        channel = live_channel(frames)
+    x = to_float(frames[:, channel])
+    if rate_in != rate_out:
+        x = PolyphaseResampler(rate_in, rate_out).process(x)
+    return to_int16(x), channel
@@ -1,6 +1,8 @@
 import requests
 import time
 import os
+import metrics
+import tracing
 from config import Config
 
 
@@ -16,16 +18,41 @@ class ShazamRecognizer:
         """Распознает трек из аудио файла через Shazam API"""
         if not os.path.exists(audio_file_path):
             return {'success': False, 'error': 'Аудио файл не найден'}
-
+        print(f"📁 Файл: {audio_file_path} ({os.path.getsize(audio_file_path)} bytes)")
+        with open(audio_file_path, 'rb') as f:
+            return self._recognize(f, os.path.getsize(audio_file_path), audio_file_path)
+
+    def recognize_bytes(self, data, filename='recording.wav'):
+        """Распознает трек из WAV в памяти (например, выбранного окна записи)"""
+        print(f"📁 Данные: {filename} ({len(data)} bytes)")
+        return self._recognize((filename, data, 'audio/wav'), len(data), filename)
+
+    def _recognize(self, payload, size, filename):
+        with metrics.timed('recognize'), tracing.span('recognize_file', filename=filename, bytes=size) as span:
+            result = self._recognize_request(payload, size)
+            span.set(success=bool(result.get('success')), error=result.get('error'))
+        if result.get('success'):
+            outcome = 'hit'
+        elif result.get('error') == 'Трек не распознан':
+            outcome = 'miss'
+        elif result.get('offline'):
+            outcome = 'offline'
+        else:
+            outcome = 'error'
+        metrics.recognitions.inc(result=outcome)
+        return result
+
+    def _recognize_request(self, payload, size):
         headers = {'Authorization': f'Bearer {self.api_key}'}
 
         try:
             print(f"🔍 Отправляем запрос к Shazam API...")
-            print(f"📁 Файл: {audio_file_path} ({os.path.getsize(audio_file_path)} bytes)")
             
-            with open(audio_file_path, 'rb') as f:
-                files = {'file': f}
+            with metrics.timed('upload'), tracing.span('upload', bytes=size) as span:
+                files = {'file': payload}
                 response = requests.post(self.api_url, headers=headers, files=files, timeout=30)
+                span.set(status_code=response.status_code)
+            metrics.transfer_bytes.inc(size, stage='upload')
 
             print(f"📡 Статус: {response.status_code}")
             
@@ -42,29 +69,39 @@ class ShazamRecognizer:
                 print("🔄 Ожидаем результаты...")
 
                 # Ожидаем результаты (до 60 сек)
-                for attempt in range(30):
-                    time.sleep(2)
-                    results_response = requests.post(f"{self.results_url}{uuid}", headers=headers, timeout=10)
-                    results_response.raise_for_status()
-                    results_data = results_response.json()
-
-                    status = results_data.get('status')
-                    if status in ('finished', 'completed', 'done'):
-                        if results_data.get('results'):
-                            track_info = results_data['results'][0].get('track', {})
-                            if track_info:
-                                return self._parse_track_info(track_info)
-                        return {'success': False, 'error': 'Трек не распознан'}
-
-                    elif status == 'error':
-                        return {'success': False, 'error': results_data.get('error', 'Ошибка API')}
-                    
-                    print(f"   Обработка... (попытка {attempt + 1})")
+                attempts = 0
+                try:
+                    with metrics.timed('poll_wait'), tracing.span('poll_results', uuid=uuid) as span:
+                        for attempt in range(30):
+                            time.sleep(2)
+                            attempts = attempt + 1
+                            span.set(poll_attempts=attempts)
+                            results_response = requests.post(f"{self.results_url}{uuid}", headers=headers, timeout=10)
+                            results_response.raise_for_status()
+                            results_data = results_response.json()
+
+                            status = results_data.get('status')
+                            if status in ('finished', 'completed', 'done'):
+                                if results_data.get('results'):
+                                    track_info = results_data['results'][0].get('track', {})
+                                    if track_info:
+                                        return self._parse_track_info(track_info)
+                                return {'success': False, 'error': 'Трек не распознан'}
+
+                            elif status == 'error':
+                                return {'success': False, 'error': results_data.get('error', 'Ошибка API')}
+                            
+                            print(f"   Обработка... (попытка {attempt + 1})")
+                finally:
+                    metrics.poll_attempts.observe(attempts)
 
                 return {'success': False, 'error': 'Таймаут ожидания результатов'}
             else:
                 return {'success': False, 'error': initial_response.get('error', 'Неизвестная ошибка')}
 
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            # Сеть недоступна - запись можно распознать позже (офлайн-очередь)
+            return {'success': False, 'error': f'Нет сети: {e}', 'offline': True}
         except requests.exceptions.RequestException as e:
             return {'success': False, 'error': f'Ошибка запроса: {e}'}
         except Exception as e:
@@ -1,7 +1,8 @@
 import requests
 import os
 from datetime import datetime
-from apify_client import ApifyClient
+import metrics
+import tracing
 from config import Config
 
 
@@ -12,25 +13,34 @@ class SpotifyDownloader:
     SEARCH_ACTOR_NAME = "automation-lab/spotify-scraper"
 
     def __init__(self):
-        self.apify_client = ApifyClient(Config.APIFY_TOKEN)
+        self._apify_client = None
+
+    @property
+    def apify_client(self):
+        """Клиент создаётся при первом обращении: apify_client долго импортируется"""
+        if self._apify_client is None:
+            from apify_client import ApifyClient
+            self._apify_client = ApifyClient(Config.APIFY_TOKEN)
+        return self._apify_client
 
     def search_spotify_url(self, track_name, artist_name):
         """Ищет Spotify URL по названию + артисту через Apify."""
         query = f"{artist_name} {track_name}".strip()
         print(f"[apify-search] {query}")
 
-        run = self.apify_client.actor(self.SEARCH_ACTOR_NAME).call(
-            run_input={
-                "mode": "search",
-                "searchTerms": [query],
-                "searchType": "tracks",
-                "maxResults": 5,
-            }
-        )
-        if not run or not run.get("defaultDatasetId"):
-            return None
+        with metrics.timed('search_actor'):
+            run = self.apify_client.actor(self.SEARCH_ACTOR_NAME).call(
+                run_input={
+                    "mode": "search",
+                    "searchTerms": [query],
+                    "searchType": "tracks",
+                    "maxResults": 5,
+                }
+            )
+            if not run or not run.get("defaultDatasetId"):
+                return None
 
-        items = list(self.apify_client.dataset(run["defaultDatasetId"]).iterate_items())
+            items = list(self.apify_client.dataset(run["defaultDatasetId"]).iterate_items())
         if not items:
             return None
 
@@ -45,21 +55,29 @@ class SpotifyDownloader:
 
     def download_by_spotify_url(self, spotify_url):
         """Скачивает MP3 по Spotify URL через Apify актор"""
+        with tracing.span('download_by_spotify_url', spotify_url=spotify_url) as span:
+            result = self._download_by_spotify_url(spotify_url)
+            span.set(success=bool(result.get('success')), error=result.get('error'))
+        metrics.downloads.inc(result='ok' if result.get('success') else 'error')
+        return result
+
+    def _download_by_spotify_url(self, spotify_url):
         try:
             print(f"[apify] Запуск: {spotify_url}")
 
-            run = self.apify_client.actor(self.ACTOR_NAME).call(
-                run_input={"links": [spotify_url]}
-            )
+            with metrics.timed('download_actor'), tracing.span('apify_actor', actor=self.ACTOR_NAME):
+                run = self.apify_client.actor(self.ACTOR_NAME).call(
+                    run_input={"links": [spotify_url]}
+                )
 
-            if not run:
-                return {"success": False, "error": "Apify: запуск не удался"}
+                if not run:
+                    return {"success": False, "error": "Apify: запуск не удался"}
 
-            dataset_id = run.get("defaultDatasetId")
-            if not dataset_id:
-                return {"success": False, "error": "Apify: нет dataset"}
+                dataset_id = run.get("defaultDatasetId")
+                if not dataset_id:
+                    return {"success": False, "error": "Apify: нет dataset"}
 
-            items = list(self.apify_client.dataset(dataset_id).iterate_items())
+                items = list(self.apify_client.dataset(dataset_id).iterate_items())
             if not items:
                 return {"success": False, "error": "Apify: пустой результат"}
 
@@ -88,20 +106,24 @@ class SpotifyDownloader:
         """Скачивает MP3 файл по прямой ссылке"""
         print(f"[download] {title}")
 
-        resp = requests.get(mp3_url, stream=True, timeout=120)
-        resp.raise_for_status()
-
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         safe_title = "".join(c for c in title if c.isalnum() or c in " -_").strip()
         filename = f"{safe_title}_{timestamp}.mp3"
         filepath = os.path.join(Config.DOWNLOADS_DIR, filename)
 
-        with open(filepath, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        with metrics.timed('mp3_transfer'), tracing.span('_download_mp3', title=title) as span:
+            resp = requests.get(mp3_url, stream=True, timeout=120)
+            span.set(status_code=resp.status_code)
+            resp.raise_for_status()
+
+            with open(filepath, "wb") as f:
+                for chunk in resp.iter_content(chunk_size=8192):
+                    if chunk:
+                        f.write(chunk)
 
-        file_size = os.path.getsize(filepath)
+            file_size = os.path.getsize(filepath)
+            span.set(bytes=file_size)
+        metrics.transfer_bytes.inc(file_size, stage='mp3_transfer')
         print(f"[download] OK: {filename} ({file_size / 1024 / 1024:.1f} MB)")
 
         return {
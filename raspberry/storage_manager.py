@@ -0,0 +1,285 @@
+"""
+Управление местом на диске: бюджеты и вытеснение файлов для recordings/ и downloads/
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from config import Config
+
+
+class StorageBudget:
+    """Лимиты одной директории и индекс её файлов"""
+
+    def __init__(self, directory, max_bytes=0, max_files=0, policy='lru', max_age=0):
+        if policy not in ('lru', 'age'):
+            raise ValueError(f"Неизвестная политика вытеснения: {policy}")
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes      # 0 = без ограничения
+        self.max_files = max_files      # 0 = без ограничения
+        self.max_age = max_age          # секунд, 0 = без ограничения
+        self.policy = policy
+        # path -> [size, created, last_access]; порядок = порядок вытеснения
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+
+    def over_budget(self, now):
+        if self.max_bytes and self.total_bytes > self.max_bytes:
+            return True
+        if self.max_files and len(self.entries) > self.max_files:
+            return True
+        if self.max_age and self.entries:
+            oldest = min(entry[1] for entry in self.entries.values())
+            return now - oldest > self.max_age
+        return False
+
+
+class StorageManager:
+    """
+    Следит за размером директорий и удаляет старые файлы.
+
+    Размеры хранятся в индексе, который обновляется при записи (track)
+    и чтении (touch) файлов, поэтому проверка бюджета не сканирует диск.
+    Закреплённые (pin) файлы никогда не удаляются.
+    """
+
+    def __init__(self, check_interval=None, evict_batch=None):
+        self.check_interval = check_interval or Config.STORAGE_CHECK_INTERVAL
+        self.evict_batch = evict_batch or Config.STORAGE_EVICT_BATCH
+        self._budgets = {}
+        self._pins = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._evict_callbacks = []
+
+    def register(self, directory, max_bytes=0, max_files=0, policy='lru', max_age=0):
+        """Добавляет директорию под управление и один раз индексирует её содержимое"""
+        budget = StorageBudget(directory, max_bytes, max_files, policy, max_age)
+        os.makedirs(budget.directory, exist_ok=True)
+
+        found = []
+        with os.scandir(budget.directory) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    found.append((entry.path, st.st_size, st.st_mtime, max(st.st_atime, st.st_mtime)))
+
+        sort_key = (lambda f: f[3]) if policy == 'lru' else (lambda f: f[2])
+        for path, size, created, accessed in sorted(found, key=sort_key):
+            budget.entries[path] = [size, created, accessed]
+            budget.total_bytes += size
+
+        with self._lock:
+            self._budgets[budget.directory] = budget
+
+        print(f"🗄️ {directory}: {len(budget.entries)} файлов, {budget.total_bytes / 1024 / 1024:.1f} MB")
+        self._wakeup.set()
+        return budget
+
+    def on_evict(self, callback):
+        """Регистрирует callback(path), вызываемый после удаления файла"""
+        self._evict_callbacks.append(callback)
+
+    def _budget_for(self, path):
+        return self._budgets.get(os.path.dirname(os.path.abspath(path)))
+
+    def track(self, path):
+        """Учитывает новый или изменившийся файл"""
+        if not path or not os.path.isfile(path):
+            return
+        path = os.path.abspath(path)
+        size = os.path.getsize(path)
+        now = time.time()
+        with self._lock:
+            budget = self._budget_for(path)
+            if budget is None:
+                return
+            old = budget.entries.pop(path, None)
+            if old is not None:
+                budget.total_bytes -= old[0]
+                created = old[1]
+            else:
+                created = now
+            budget.entries[path] = [size, created, now]
+            budget.total_bytes += size
+            needs_check = budget.over_budget(now)
+        if needs_check:
+            self._wakeup.set()
+
+    def touch(self, path):
+        """Отмечает обращение к файлу (для LRU)"""
+        path = os.path.abspath(path)
+        with self._lock:
+            budget = self._budget_for(path)
+            if budget is None or path not in budget.entries:
+                return
+            budget.entries[path][2] = time.time()
+            if budget.policy == 'lru':
+                budget.entries.move_to_end(path)
+
+    def forget(self, path):
+        """Убирает файл из индекса (если он удалён в обход менеджера)"""
+        path = os.path.abspath(path)
+        with self._lock:
+            budget = self._budget_for(path)
+            if budget is None:
+                return
+            old = budget.entries.pop(path, None)
+            if old is not None:
+                budget.total_bytes -= old[0]
+
+    def pin(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            self._pins[path] = self._pins.get(path, 0) + 1
+
+    def unpin(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            count = self._pins.get(path, 0) - 1
+            if count > 0:
+                self._pins[path] = count
+            else:
+                self._pins.pop(path, None)
+
+    @contextmanager
+    def pinned(self, *paths):
+        """Защищает файлы от удаления на время обработки"""
+        paths = [p for p in paths if p]
+        for p in paths:
+            self.pin(p)
+        try:
+            yield
+        finally:
+            for p in paths:
+                self.unpin(p)
+
+    def usage(self):
+        """Текущее использование по директориям (из индекса)"""
+        with self._lock:
+            return {
+                budget.directory: {
+                    'bytes': budget.total_bytes,
+                    'files': len(budget.entries),
+                    'max_bytes': budget.max_bytes,
+                    'max_files': budget.max_files,
+                    'policy': budget.policy,
+                }
+                for budget in self._budgets.values()
+            }
+
+    def _pick_victims(self, budget, limit, now):
+        """Выбирает файлы для удаления, не трогая закреплённые"""
+        victims = []
+        total_bytes = budget.total_bytes
+        total_files = len(budget.entries)
+        for path, (size, created, _) in budget.entries.items():
+            if len(victims) >= limit:
+                break
+            too_big = budget.max_bytes and total_bytes > budget.max_bytes
+            too_many = budget.max_files and total_files > budget.max_files
+            too_old = budget.max_age and now - created > budget.max_age
+            if not (too_big or too_many or too_old):
+                if budget.policy == 'age' or not budget.max_age:
+                    break
+                continue
+            if path in self._pins:
+                continue
+            victims.append(path)
+            total_bytes -= size
+            total_files -= 1
+        return victims
+
+    def enforce(self, max_evictions=None):
+        """
+        Один шаг вытеснения: удаляет не больше max_evictions файлов.
+        Возвращает список удалённых путей.
+        """
+        limit = max_evictions or self.evict_batch
+        now = time.time()
+        with self._lock:
+            victims = []
+            for budget in self._budgets.values():
+                if budget.over_budget(now):
+                    victims.extend(self._pick_victims(budget, limit - len(victims), now))
+                if len(victims) >= limit:
+                    break
+
+        evicted = []
+        for path in victims:
+            # Между выбором и удалением файл могли закрепить или убрать из индекса -
+            # проверка и удаление под одной блокировкой
+            with self._lock:
+                budget = self._budget_for(path)
+                if path in self._pins or budget is None or path not in budget.entries:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"⚠️ Не удалось удалить {path}: {e}")
+                    continue
+                budget.total_bytes -= budget.entries.pop(path)[0]
+            evicted.append(path)
+            for callback in self._evict_callbacks:
+                try:
+                    callback(path)
+                except Exception as e:
+                    print(f"⚠️ Ошибка обработчика вытеснения: {e}")
+
+        if evicted:
+            print(f"🧹 Удалено файлов: {len(evicted)}")
+        return evicted
+
+    def start(self):
+        """Запускает фоновое вытеснение"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='storage-manager', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.check_interval)
+            self._wakeup.clear()
+            # Удаляем порциями, чтобы не занимать диск надолго
+            while not self._stop.is_set() and len(self.enforce()) >= self.evict_batch:
+                time.sleep(0.05)
+
+
+def create_storage_manager():
+    """Менеджер с бюджетами из Config для recordings/, downloads/ и кеша конвертаций"""
+    storage = StorageManager()
+    storage.register(
+        Config.RECORDINGS_DIR,
+        max_bytes=Config.RECORDINGS_MAX_MB * 1024 * 1024,
+        max_files=Config.RECORDINGS_MAX_FILES,
+        policy=Config.STORAGE_POLICY,
+        max_age=Config.RECORDINGS_MAX_AGE_HOURS * 3600,
+    )
+    storage.register(
+        Config.DOWNLOADS_DIR,
+        max_bytes=Config.DOWNLOADS_MAX_MB * 1024 * 1024,
+        max_files=Config.DOWNLOADS_MAX_FILES,
+        policy=Config.STORAGE_POLICY,
+    )
+    # Кеш конвертаций всегда вытесняется по LRU - его можно пересобрать
+    storage.register(
+        Config.CONVERSIONS_DIR,
+        max_bytes=Config.CONVERSIONS_MAX_MB * 1024 * 1024,
+        policy='lru',
+    )
+    return storage
@@ -9,11 +9,9 @@
 его запущенным.
 """
 
-import os
-import struct
 import subprocess
 import sys
-import wave
+from wav_analysis import analyze as analyze_wav
 
 DEV = "plughw:0,0"
 DURATION = 5
@@ -56,32 +54,23 @@ def record():
 
 
 def analyze():
-    w = wave.open(OUT, "rb")
-    raw = w.readframes(w.getnframes())
-    sr = w.getframerate() * w.getnchannels()
-    w.close()
+    stats = analyze_wav(OUT)
+    if stats.get('empty'):
+        return [], stats
 
-    n = len(raw) // 4
-    vals = struct.unpack(f"<{n}i", raw)
-    abs_v = [abs(v) for v in vals]
-    MAX = 2 ** 31
-
-    print("\nПо секундам (rms / peak):")
+    print(f"\nПо секундам, канал {stats['channel']} (rms / peak):")
     per_sec = []
-    for i in range(0, len(vals) - sr, sr):
-        c = abs_v[i:i + sr]
-        rms = (sum(x * x for x in c) / len(c)) ** 0.5
-        pk = max(c)
-        rms_pct = rms / MAX * 100
-        pk_pct = pk / MAX * 100
+    for block in stats['blocks']:
+        rms_pct = block['rms'] * 100
+        pk_pct = block['peak'] * 100
         per_sec.append((rms_pct, pk_pct))
         bar = "█" * min(40, int(pk_pct * 2))
-        print(f"  t={i // sr}s  rms={rms_pct:6.3f}%  peak={pk_pct:5.2f}%  {bar}")
+        print(f"  t={block['t']:.0f}s  rms={rms_pct:6.3f}%  peak={pk_pct:5.2f}%  {bar}")
 
-    return per_sec
+    return per_sec, stats
 
 
-def verdict(per_sec):
+def verdict(per_sec, stats):
     if not per_sec:
         print(f"\n{RED}❌ Запись пустая.{RESET}")
         return 2
@@ -105,6 +94,8 @@ def verdict(per_sec):
 
     print(f"{GREEN}✅ Микрофон работает.{RESET}")
     print(f"   Макс rms={max_rms:.2f}%  peak={max_peak:.2f}%")
+    print(f"   Шумовой фон {stats.get('noise_floor_dbfs')} dBFS, SNR {stats.get('snr_db')} dB, "
+          f"DC {stats['dc_offset'] * 100:+.3f}%, клиппинг {stats['clipped_ratio'] * 100:.3f}%")
     print("   Можно запускать flashshazam: sudo systemctl start flashshazam")
     return 0
 
@@ -112,8 +103,8 @@ def verdict(per_sec):
 def main():
     stop_service()
     record()
-    per_sec = analyze()
-    sys.exit(verdict(per_sec))
+    per_sec, stats = analyze()
+    sys.exit(verdict(per_sec, stats))
 
 
 if __name__ == "__main__":
@@ -1,31 +1,66 @@
-from flask import Flask, render_template, jsonify, request, send_file
+from flask import Flask, Response, render_template, jsonify, request
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
+import json
 import os
+import threading
+import uuid
+import numpy as np
 from audio_recorder import AudioRecorder
-from audio_converter import convert_to_wav
-from shazam_recognizer import ShazamRecognizer
+from capture_devices import DeviceManager, DeviceBusyError
+from audio_converter import convert_to_wav, wav_duration
+from shazam_recognizer import ShazamRecognizer, FORMAT_DIRECT, media_format
 from spotify_downloader import SpotifyDownloader
+from storage_manager import create_storage_manager
+from jobs import Job, JobManager, QueueFullError
+from stream_ingest import UploadTooLarge, ingest_stream, file_sha256
+from live_stream import LiveSession
+from audio_windows import budget, is_miss, load_wav, recognize_best_window
+from static_files import resolve_media_path, send_media
+from recordings_catalog import RecordingsCatalog, STATUS_RECOGNIZED, STATUS_NOT_RECOGNIZED
+import metrics
+import tracing
 from config import Config
 
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = Config.MAX_UPLOAD_MB * 1024 * 1024
+app.config['USE_X_SENDFILE'] = Config.SENDFILE_MODE == 'x-sendfile'
 CORS(app)
 
 recorder = AudioRecorder()
+recorder.registry.start()
+devices = DeviceManager(recorder)
 recognizer = ShazamRecognizer()
 downloader = SpotifyDownloader()
+storage = create_storage_manager()
+catalog = RecordingsCatalog()
+if catalog.is_empty():
+    catalog.backfill(Config.RECORDINGS_DIR)
+storage.on_evict(catalog.forget_path)
+storage.start()
+jobs = JobManager()
+
+# WebSocket для живого распознавания - необязательная зависимость
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+    sock = Sock(app)
+except ImportError:
+    sock = None
+live_slots = threading.BoundedSemaphore(Config.LIVE_MAX_SESSIONS)
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', live_enabled=sock is not None)
 
 @app.route('/api/devices', methods=['GET'])
 def list_devices():
-    """Возвращает список доступных аудио устройств"""
+    """Возвращает список доступных аудио устройств (?refresh=1 - опросить заново)"""
     try:
-        devices = recorder.list_input_devices()
         return jsonify({
             'success': True,
-            'devices': devices
+            'devices': recorder.list_input_devices(refresh=request.args.get('refresh') == '1'),
+            'active': devices.active()
         })
     except Exception as e:
         return jsonify({
@@ -34,20 +69,25 @@ def list_devices():
         }), 500
 
 @app.route('/api/record', methods=['POST'])
+@tracing.traced('POST /api/record')
 def record_audio():
     """Записывает аудио с микрофона (для Raspberry Pi)"""
     try:
         duration = request.json.get('duration', Config.RECORDING_DURATION)
         device_index = request.json.get('device_index', None)
+        exclusive = bool(request.json.get('exclusive', False))
         
-        if device_index is not None:
-            recorder.input_device_index = device_index
-        
-        audio_file = recorder.record(duration)
+        audio_file = devices.record(duration, device_index, exclusive)
+        storage.track(audio_file)
         return jsonify({
             'success': True,
             'audio_file': audio_file
         })
+    except DeviceBusyError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
     except Exception as e:
         return jsonify({
             'success': False,
@@ -55,6 +95,7 @@ def record_audio():
         }), 500
 
 @app.route('/api/recognize', methods=['POST'])
+@tracing.traced('POST /api/recognize')
 def recognize_track():
     """Распознает трек из аудио файла"""
     try:
@@ -65,7 +106,9 @@ def recognize_track():
                 'error': 'Аудио файл не найден'
             }), 400
         
-        result = recognizer.recognize_file(audio_file)
+        storage.touch(audio_file)
+        with storage.pinned(audio_file):
+            result = recognizer.recognize_file(audio_file)
         return jsonify(result)
     except Exception as e:
         return jsonify({
@@ -92,6 +135,7 @@ def download_track_from_recognition(recognition):
         )
 
     if download_result and download_result.get('success'):
+        storage.track(download_result.get('file_path'))
         print(f"✅ Скачано: {download_result.get('filename')}")
     elif download_result:
         print(f"⚠️ Ошибка скачивания: {download_result.get('error')}")
@@ -99,70 +143,279 @@ def download_track_from_recognition(recognition):
     return download_result
 
 
+UPLOAD_EXTENSIONS = {
+    'audio/webm': 'webm',
+    'audio/ogg': 'ogg',
+    'audio/mp4': 'm4a',
+    'audio/mpeg': 'mp3',
+    'audio/wav': 'wav',
+    'audio/x-wav': 'wav',
+}
+
+
+MEDIA_TYPES = {
+    'webm': 'audio/webm',
+    'ogg': 'audio/ogg',
+    'm4a': 'audio/mp4',
+    'mp3': 'audio/mpeg',
+    'wav': 'audio/wav',
+}
+
+
+def new_recording_path(ext='webm'):
+    """
+    Путь для новой записи в RECORDINGS_DIR. Микросекунды и случайный суффикс:
+    параллельные загрузки и live-сессии в одну секунду не делят файл.
+    """
+    from datetime import datetime
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return os.path.join(Config.RECORDINGS_DIR, f"recording_{timestamp}_{uuid.uuid4().hex[:8]}.{ext}")
+
+
+def save_uploaded_audio(audio_file):
+    """Сохраняет загруженный браузером файл в RECORDINGS_DIR; возвращает (путь, ID в каталоге)"""
+    filepath = new_recording_path()
+    audio_file.save(filepath)
+    storage.track(filepath)
+    recording_id = catalog.add(filepath, 'webm', content_hash=file_sha256(filepath))
+    return filepath, recording_id
+
+
+def ingest_uploaded_stream():
+    """
+    Принимает сырое тело запроса (Content-Type: audio/*) потоком:
+    считает хеш и сохраняет только сжатый оригинал. В PCM декодируем,
+    только если API может не принять формат как есть.
+    """
+    ext = UPLOAD_EXTENSIONS.get(request.mimetype, 'bin')
+    filepath = new_recording_path(ext)
+    decode = ext != 'wav' and recognizer.formats.get(media_format(request.mimetype)) != FORMAT_DIRECT
+    with metrics.timed('ingest'):
+        ingest = ingest_stream(request.stream, tee_path=filepath, decode=decode,
+                               content_type=request.mimetype)
+    storage.track(filepath)
+    recording_id = catalog.add(filepath, ext, duration=ingest.duration,
+                               size=ingest.size, content_hash=ingest.sha256)
+    return ingest, recording_id
+
+
+def prepare_audio(job, source_path=None, duration=None, device_index=None, recording_id=None,
+                  exclusive=False):
+    """
+    Возвращает (WAV для распознавания, ID в каталоге):
+    конвертирует загрузку или пишет с микрофона.
+    """
+    if source_path is not None:
+        # Конвертируем webm в wav для распознавания (хеш из каталога - ключ кеша)
+        recording = catalog.get(recording_id) if recording_id is not None else None
+        content_hash = recording['content_hash'] if recording else None
+        with job.stage('convert'), storage.pinned(source_path):
+            print(f"📁 Конвертация {source_path} в WAV...")
+            audio_file_path = convert_to_wav(source_path, content_hash=content_hash)
+        storage.track(audio_file_path)
+        storage.touch(audio_file_path)
+        if recording_id is not None:
+            catalog.set_converted(recording_id, audio_file_path, duration=wav_duration(audio_file_path))
+        return audio_file_path, recording_id
+
+    # Режим записи с сервера (Raspberry Pi)
+    with job.stage('capture', duration=duration):
+        audio_file_path = devices.record(duration, device_index, exclusive)
+    storage.track(audio_file_path)
+    recording_id = catalog.add(audio_file_path, 'wav', duration=wav_duration(audio_file_path),
+                               content_hash=file_sha256(audio_file_path))
+    return audio_file_path, recording_id
+
+
+def record_recognition(recording_id, recognition):
+    """Сохраняет результат распознавания в каталог"""
+    if recording_id is None:
+        return
+    if recognition.get('success'):
+        catalog.set_status(recording_id, STATUS_RECOGNIZED,
+                           recognition.get('title'), recognition.get('artist'))
+    else:
+        catalog.set_status(recording_id, STATUS_NOT_RECOGNIZED)
+
+
+def recognize_original(job, path, content_type):
+    """
+    Отправляет запись в исходном формате, если API его принимает.
+    None - формат нужно конвертировать.
+    """
+    if not recognizer.accepts_original(content_type):
+        return None
+    print(f"🔍 Распознавание без конвертации ({media_format(content_type)}): {path}")
+    with job.stage('recognize', source='original'), storage.pinned(path):
+        return recognizer.recognize_original(path, content_type)
+
+
+def recognize_and_download(job, audio_file_path=None, ingest=None, recording_id=None,
+                           source_path=None):
+    """
+    Распознавание через Shazam и скачивание через Spotify.
+
+    WAV и уже декодированный PCM режутся на окна без перекодирования -
+    в Shazam сразу уходит самый узнаваемый фрагмент. Сжатый оригинал
+    (ingest или source_path) сначала отправляется как есть; в WAV
+    конвертируем, только если API не принимает формат.
+    """
+    recognition = None
+    content_type = None
+    if ingest is not None:
+        if ingest.decoded and ingest.stats['silent']:
+            return {
+                'success': False,
+                'error': 'Запись слишком тихая - проверьте микрофон',
+                'ingest': ingest.stats
+            }
+        if ingest.decoded and Config.BEST_WINDOW_ENABLED:
+            # PCM уже в памяти - лучшее окно без промежуточного WAV на диске
+            print(f"🔍 Распознавание трека из потока ({ingest.duration:.1f}с PCM)")
+            with job.stage('recognize', source='memory'), storage.pinned(ingest.path):
+                samples = np.frombuffer(ingest.pcm, dtype=np.int16)
+                recognition = recognize_best_window(recognizer, samples, ingest.rate)
+            return complete_recognition(job, recognition, recording_id)
+        source_path, content_type = ingest.path, ingest.content_type
+    elif source_path is not None:
+        ext = os.path.splitext(source_path)[1].lower().lstrip('.')
+        content_type = MEDIA_TYPES.get(ext, 'application/octet-stream')
+
+    windowed_wav = Config.BEST_WINDOW_ENABLED and media_format(content_type) == 'audio/wav'
+    whole_miss = None
+    if source_path is not None and not windowed_wav:
+        recognition = recognize_original(job, source_path, content_type)
+        if recognition is None and ingest is not None and ingest.decoded:
+            # PCM уже в памяти - отправляем без промежуточного WAV на диске
+            print(f"🔍 Распознавание трека из потока ({ingest.duration:.1f}с PCM)")
+            with job.stage('recognize', source='memory'), storage.pinned(ingest.path):
+                recognition = recognizer.recognize_bytes(ingest.wav_bytes())
+        elif recognition is not None and Config.BEST_WINDOW_ENABLED and is_miss(recognition):
+            # Целиком не распознано - вторая попытка по окнам и вариантам из WAV
+            print("🔁 Целиком не распознано - пробуем лучшие окна")
+            whole_miss, recognition = recognition, None
+
+    if recognition is None:
+        if audio_file_path is None:
+            # WAV возвращается как есть, остальное конвертируется
+            audio_file_path, recording_id = prepare_audio(job, source_path=source_path,
+                                                          recording_id=recording_id)
+        print(f"🔍 Распознавание трека из файла: {audio_file_path}")
+        with job.stage('recognize'), storage.pinned(audio_file_path):
+            if Config.BEST_WINDOW_ENABLED:
+                # В Shazam уходит только самый узнаваемый фрагмент
+                samples, rate = load_wav(audio_file_path)
+                recognition = recognize_best_window(recognizer, samples, rate,
+                                                    optional=whole_miss is not None)
+            else:
+                recognition = recognizer.recognize_file(audio_file_path)
+        if recognition is None:
+            recognition = whole_miss  # на окна не хватило бюджета
+
+    return complete_recognition(job, recognition, recording_id)
+
+
+def complete_recognition(job, recognition, recording_id=None):
+    """Записывает результат в каталог и при успехе скачивает трек"""
+    record_recognition(recording_id, recognition)
+    if not recognition.get('success'):
+        return {
+            'success': False,
+            'error': 'Не удалось распознать трек',
+            'recognition': recognition
+        }
+
+    print(f"✅ Распознан трек: {recognition['title']} - {recognition['artist']}")
+
+    with job.stage('download'):
+        download_result = download_track_from_recognition(recognition)
+
+    response_data = {
+        'success': True,
+        'recognition': recognition,
+        'download': download_result
+    }
+
+    # Добавляем URL для воспроизведения если файл скачан
+    if download_result and download_result.get('success') and download_result.get('filename'):
+        response_data['audioUrl'] = f'/api/downloads/{download_result["filename"]}'
+
+    return response_data
+
+
+def run_pipeline(job, source_path=None, duration=None, device_index=None, ingest=None,
+                 recording_id=None, exclusive=False):
+    """Полный цикл обработки для одной задачи"""
+    if ingest is not None:
+        return recognize_and_download(job, ingest=ingest, recording_id=recording_id)
+    if source_path is not None:
+        return recognize_and_download(job, source_path=source_path, recording_id=recording_id)
+    audio_file_path, recording_id = prepare_audio(
+        job, None, duration, device_index, recording_id, exclusive
+    )
+    return recognize_and_download(job, audio_file_path, recording_id=recording_id)
+
+
+def timed_pipeline(job, **kwargs):
+    """run_pipeline с замером общей длительности (для фоновых задач)"""
+    with metrics.timed('pipeline'), tracing.span('job', job_id=job.id):
+        return run_pipeline(job, **kwargs)
+
+
+def parse_process_request():
+    """
+    Разбирает запрос /api/process и /api/jobs.
+
+    Поддерживаем три режима:
+    1. Потоковая загрузка от браузера - сырое тело с Content-Type audio/*
+    2. Загрузка файла от браузера - через multipart/form-data
+    3. Запись с сервера (Raspberry Pi) - через параметр duration
+    Возвращает (kwargs для run_pipeline, ответ с ошибкой или None).
+    """
+    if request.mimetype.startswith('audio/'):
+        try:
+            ingest, recording_id = ingest_uploaded_stream()
+            return {'ingest': ingest, 'recording_id': recording_id}, None
+        except (UploadTooLarge, RequestEntityTooLarge) as e:
+            return None, (jsonify({
+                'success': False,
+                'error': str(e)
+            }), 413)
+
+    if 'audio' in request.files:
+        audio_file = request.files['audio']
+        if audio_file.filename == '':
+            return None, (jsonify({
+                'success': False,
+                'error': 'Файл не выбран'
+            }), 400)
+        # Файл нужно сохранить до выхода из запроса
+        source_path, recording_id = save_uploaded_audio(audio_file)
+        return {'source_path': source_path, 'recording_id': recording_id}, None
+
+    params = request.get_json(silent=True) or {}
+    return {
+        'duration': params.get('duration', Config.RECORDING_DURATION),
+        'device_index': params.get('device_index', None),
+        'exclusive': bool(params.get('exclusive', False)),
+    }, None
+
+
 @app.route('/api/process', methods=['POST'])
+@tracing.traced('POST /api/process')
 def process_full():
     """Полный цикл: запись -> распознавание -> скачивание"""
     try:
-        # Поддерживаем два режима:
-        # 1. Загрузка файла от браузера - через multipart/form-data
-        # 2. Запись с сервера (Raspberry Pi) - через параметр duration
-        
-        if 'audio' in request.files:
-            # Режим загрузки от браузера
-            audio_file = request.files['audio']
-            if audio_file.filename == '':
-                return jsonify({
-                    'success': False,
-                    'error': 'Файл не выбран'
-                }), 400
-            
-            # Сохраняем файл
-            from datetime import datetime
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"recording_{timestamp}.webm"
-            filepath = os.path.join(Config.RECORDINGS_DIR, filename)
-            audio_file.save(filepath)
-            
-            # Конвертируем webm в wav для распознавания
-            print(f"📁 Конвертация {filepath} в WAV...")
-            audio_file_path = convert_to_wav(filepath)
-        else:
-            # Режим записи с сервера (Raspberry Pi)
-            duration = request.json.get('duration', Config.RECORDING_DURATION) if request.is_json else Config.RECORDING_DURATION
-            device_index = request.json.get('device_index', None) if request.is_json else None
-            
-            if device_index is not None:
-                recorder.input_device_index = device_index
-            
-            audio_file_path = recorder.record(duration)
-        
-        # 2. Распознавание через Shazam
-        print(f"🔍 Распознавание трека из файла: {audio_file_path}")
-        recognition = recognizer.recognize_file(audio_file_path)
-        
-        if not recognition.get('success'):
-            return jsonify({
-                'success': False,
-                'error': 'Не удалось распознать трек',
-                'recognition': recognition
-            })
-        
-        print(f"✅ Распознан трек: {recognition['title']} - {recognition['artist']}")
-        
-        # 3. Скачивание через Spotify
-        download_result = download_track_from_recognition(recognition)
-        
-        response_data = {
-            'success': True,
-            'recognition': recognition,
-            'download': download_result
-        }
-        
-        # Добавляем URL для воспроизведения если файл скачан
-        if download_result and download_result.get('success') and download_result.get('filename'):
-            response_data['audioUrl'] = f'/api/downloads/{download_result["filename"]}'
-        
-        return jsonify(response_data)
+        kwargs, error_response = parse_process_request()
+        if error_response:
+            return error_response
+        with metrics.timed('pipeline'):
+            return jsonify(run_pipeline(Job(), **kwargs))
+    except DeviceBusyError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -171,58 +424,175 @@ def process_full():
             'error': str(e)
         }), 500
 
+@app.route('/api/jobs', methods=['POST'])
+@tracing.traced('POST /api/jobs')
+def create_job():
+    """Ставит полный цикл в очередь и сразу возвращает ID задачи"""
+    try:
+        # Место в очереди - до приёма тела: 429 не стоит загрузки и файла на диске
+        jobs.reserve()
+        try:
+            kwargs, error_response = parse_process_request()
+        except Exception:
+            jobs.release()
+            raise
+        if error_response:
+            jobs.release()
+            return error_response
+        job = jobs.submit_reserved(timed_pipeline, **kwargs)
+        tracing.annotate(job_id=job.id)
+    except QueueFullError as e:
+        response = jsonify({
+            'success': False,
+            'error': str(e),
+            'retry_after': e.retry_after
+        })
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status_url': f'/api/jobs/{job.id}',
+        'events_url': f'/api/jobs/{job.id}/events'
+    }), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Возвращает состояние и результат задачи"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Задача не найдена'}), 404
+    return jsonify({'success': True, 'job': job.snapshot()})
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Поток событий задачи (Server-Sent Events)"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Задача не найдена'}), 404
+
+    # EventSource сам присылает Last-Event-ID при переподключении
+    try:
+        after = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        after = 0
+
+    def stream():
+        for event in job.iter_events(after=after):
+            if event is None:
+                yield ': keepalive\n\n'
+                continue
+            data = json.dumps(event, ensure_ascii=False)
+            yield f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n"
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def live_recognition(ws):
+    """
+    Живое распознавание: клиент шлёт бинарные куски MediaRecorder
+    (?mime=audio/webm;codecs=opus) и текст 'stop' в конце.
+    Сервер отвечает JSON событиями attempt / match / done / failed.
+    После первого совпадения приём прекращается.
+    """
+    send_lock = threading.Lock()
+
+    def send(event):
+        with send_lock:
+            try:
+                ws.send(json.dumps(event))
+            except ConnectionClosed:
+                pass
+
+    if not live_slots.acquire(blocking=False):
+        send({'event': 'failed', 'error': 'Сервер занят, попробуйте позже'})
+        return
+
+    mimetype = request.args.get('mime', 'audio/webm')
+    ext = UPLOAD_EXTENSIONS.get(media_format(mimetype), 'webm')
+    filepath = new_recording_path(ext)
+    session = None
+    try:
+        with tracing.span('WS /api/live', mime=mimetype) as span:
+            session = LiveSession(recognizer, send, tee_path=filepath, budget=budget)
+            storage.track(filepath)
+            with storage.pinned(filepath):
+                abandoned = False  # клиент ушёл без 'stop' - последняя попытка никому не нужна
+                while not session.matched.is_set():
+                    try:
+                        message = ws.receive(timeout=Config.LIVE_IDLE_TIMEOUT)
+                    except ConnectionClosed:
+                        abandoned = True
+                        break
+                    if message is None:
+                        abandoned = True
+                        break
+                    if message == 'stop':
+                        break
+                    if isinstance(message, bytes):
+                        session.feed(message)
+
+                recognition = session.finish(final_attempt=not abandoned)
+            span.set(bytes=session.size, attempts=session.attempts, seconds=round(session.duration, 1))
+            storage.track(filepath)
+            recording_id = catalog.add(filepath, ext, duration=session.duration,
+                                       size=session.size, content_hash=session.sha256)
+            result = complete_recognition(Job(), recognition, recording_id)
+        send({'event': 'done', 'result': result})
+    except Exception as e:
+        if session:
+            session.abort()
+        import traceback
+        traceback.print_exc()
+        send({'event': 'failed', 'error': str(e)})
+    finally:
+        live_slots.release()
+
+
+if sock is not None:
+    sock.route('/api/live')(live_recognition)
+
 @app.route('/api/process_last', methods=['POST'])
+@tracing.traced('POST /api/process_last')
 def process_last():
     """Обрабатывает последний записанный файл"""
     try:
-        import glob
-        
-        # Ищем файлы в директории записей
-        files = glob.glob(os.path.join(Config.RECORDINGS_DIR, "*"))
-        if not files:
+        # Последняя запись из каталога - без сканирования директории
+        recording = catalog.latest()
+        if recording is None or not os.path.exists(recording['path']):
             return jsonify({
                 'success': False,
                 'error': 'Нет записанных файлов'
             }), 404
-            
-        # Берем самый новый файл
-        last_file = max(files, key=os.path.getctime)
+
+        last_file = recording['path']
         print(f"📁 Обработка последнего файла: {last_file}")
+        storage.touch(last_file)
         
-        # Если это webm, конвертируем в wav
-        if last_file.lower().endswith('.webm'):
-            print(f"📁 Конвертация {last_file} в WAV...")
-            audio_file_path = convert_to_wav(last_file)
-        else:
-            audio_file_path = last_file
-            
-        # 2. Распознавание через Shazam
-        print(f"🔍 Распознавание трека из файла: {audio_file_path}")
-        recognition = recognizer.recognize_file(audio_file_path)
-        
-        if not recognition.get('success'):
-            return jsonify({
-                'success': False,
-                'error': 'Не удалось распознать трек',
-                'recognition': recognition
-            })
-        
-        print(f"✅ Распознан трек: {recognition['title']} - {recognition['artist']}")
-        
-        # 3. Скачивание через Spotify
-        download_result = download_track_from_recognition(recognition)
-        
-        response_data = {
-            'success': True,
-            'recognition': recognition,
-            'download': download_result
-        }
-        
-        # Добавляем URL для воспроизведения если файл скачан
-        if download_result and download_result.get('success') and download_result.get('filename'):
-            response_data['audioUrl'] = f'/api/downloads/{download_result["filename"]}'
-        
-        return jsonify(response_data)
+        job = Job()
+        with storage.pinned(last_file):
+            converted = recording['converted_path']
+            if recording['format'] == 'wav':
+                audio_file_path = last_file
+            elif converted and os.path.exists(converted):
+                # Уже конвертировали раньше - не повторяем
+                audio_file_path = converted
+                storage.touch(converted)
+            else:
+                # Оригинал уйдёт как есть или будет сконвертирован при необходимости
+                return jsonify(recognize_and_download(job, source_path=last_file,
+                                                      recording_id=recording['id']))
+            return jsonify(recognize_and_download(job, audio_file_path, recording_id=recording['id']))
             
     except Exception as e:
         import traceback
@@ -232,22 +602,72 @@ def process_last():
             'error': str(e)
         }), 500
 
+@app.route('/api/recordings', methods=['GET'])
+def list_recordings():
+    """Постраничный список записей из каталога"""
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 20, type=int)
+    recordings, has_more = catalog.page(page, per_page)
+    return jsonify({
+        'success': True,
+        'page': page,
+        'per_page': per_page,
+        'has_more': has_more,
+        'recordings': recordings
+    })
+
+@app.route('/api/storage', methods=['GET'])
+def storage_usage():
+    """Возвращает использование места в recordings/ и downloads/"""
+    return jsonify({
+        'success': True,
+        'storage': storage.usage()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Метрики этапов в текстовом формате Prometheus"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/debug/traces', methods=['GET'])
+def debug_traces():
+    """
+    Последние трассы, новые первыми.
+    ?limit=N, ?min_duration=секунды - только медленные.
+    """
+    limit = request.args.get('limit', 20, type=int)
+    min_duration = request.args.get('min_duration', 0, type=float)
+    return jsonify({
+        'success': True,
+        'profile_threshold': Config.TRACE_PROFILE_THRESHOLD,
+        'traces': [t.to_dict() for t in tracing.tracer.recent(limit, min_duration)]
+    })
+
+@app.route('/api/debug/traces/<trace_id>', methods=['GET'])
+def debug_trace(trace_id):
+    trace = tracing.tracer.get(trace_id)
+    if trace is None:
+        return jsonify({'success': False, 'error': 'Трасса не найдена'}), 404
+    return jsonify({'success': True, 'trace': trace.to_dict()})
+
 @app.route('/api/audio/<path:filename>')
 def serve_audio(filename):
     """Отдает аудио файлы"""
-    filepath = os.path.join(Config.RECORDINGS_DIR, filename)
-    if os.path.exists(filepath):
-        return send_file(filepath)
+    filepath = resolve_media_path(Config.RECORDINGS_DIR, filename)
+    if filepath:
+        storage.touch(filepath)
+        return send_media(filepath)
     return jsonify({'error': 'File not found'}), 404
 
 @app.route('/api/downloads/<path:filename>')
 def serve_download(filename):
     """Отдает скачанные MP3 файлы"""
-    filepath = os.path.join(Config.DOWNLOADS_DIR, filename)
-    if os.path.exists(filepath):
-        return send_file(filepath, mimetype='audio/mpeg')
+    filepath = resolve_media_path(Config.DOWNLOADS_DIR, filename)
+    if filepath:
+        storage.touch(filepath)
+        # Имена скачанных файлов уникальны (с меткой времени) - можно кешировать
+        return send_media(filepath, mimetype='audio/mpeg', max_age=Config.DOWNLOADS_MAX_AGE)
     return jsonify({'error': 'File not found'}), 404
 
-
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001)
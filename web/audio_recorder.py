@@ -4,54 +4,37 @@ import os
 import struct
 from datetime import datetime
 from config import Config
+from device_registry import DeviceRegistry
+import metrics
+import tracing
 
 class AudioRecorder:
-    def __init__(self, input_device_index=None):
+    def __init__(self, input_device_index=None, registry=None):
         self.chunk = 1024
         self.sample_format = pyaudio.paInt16
         self.channels = 1
         self.rate = 44100
         self.input_device_index = input_device_index
+        self.registry = registry or DeviceRegistry()
         
-    def list_input_devices(self):
-        """Список доступных входных устройств"""
-        audio = pyaudio.PyAudio()
-        devices = []
+    def list_input_devices(self, refresh=False):
+        """Список доступных входных устройств (из кеша реестра)"""
+        if refresh:
+            self.registry.refresh()
+        devices = self.registry.devices()
         
         print("\nДоступные аудио устройства:")
-        for i in range(audio.get_device_count()):
-            info = audio.get_device_info_by_index(i)
-            if info['maxInputChannels'] > 0:
-                devices.append({
-                    'index': i,
-                    'name': info['name'],
-                    'channels': info['maxInputChannels'],
-                    'rate': info['defaultSampleRate']
-                })
-                print(f"  [{i}] {info['name']} - {info['maxInputChannels']} каналов")
+        for device in devices:
+            print(f"  [{device['index']}] {device['name']} - {device['channels']} каналов")
         
-        audio.terminate()
         return devices
     
     def find_default_input_device(self):
-        """Находит устройство по умолчанию"""
-        audio = pyaudio.PyAudio()
-        try:
-            default_device = audio.get_default_input_device_info()
-            device_index = default_device['index']
-            print(f"Используется устройство по умолчанию: [{device_index}] {default_device['name']}")
-            return device_index
-        except Exception as e:
-            print(f"Ошибка получения устройства по умолчанию: {e}")
-            # Пробуем найти любое устройство с входом
-            for i in range(audio.get_device_count()):
-                info = audio.get_device_info_by_index(i)
-                if info['maxInputChannels'] > 0:
-                    print(f"Используется устройство: [{i}] {info['name']}")
-                    return i
-            return None
-        finally:
-            audio.terminate()
+        """Находит устройство по умолчанию (из кеша реестра)"""
+        device_index = self.registry.default_index()
+        if device_index is None:
+            print("Ошибка получения устройства по умолчанию: нет устройств ввода")
+        return device_index
     
     def check_audio_level(self, audio_data_bytes):
         """Проверяет уровень звука в записанных данных"""
@@ -141,22 +124,27 @@ class AudioRecorder:
             raise Exception(f"Ошибка записи: {e}")
         
         # Сохраняем файл
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        try:
+            return self.save_frames(frames, audio.get_sample_size(self.sample_format))
+        finally:
+            audio.terminate()
+
+    def save_frames(self, frames, sample_width):
+        """Сохраняет записанные куски в WAV в RECORDINGS_DIR"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
         filename = os.path.join(Config.RECORDINGS_DIR, f"recording_{timestamp}.wav")
         
         try:
-            wf = wave.open(filename, 'wb')
-            wf.setnchannels(self.channels)
-            wf.setsampwidth(audio.get_sample_size(self.sample_format))
-            wf.setframerate(self.rate)
-            wf.writeframes(b''.join(frames))
-            wf.close()
+            with metrics.timed('save'), tracing.span('save_wav', bytes=sum(len(f) for f in frames)):
+                wf = wave.open(filename, 'wb')
+                wf.setnchannels(self.channels)
+                wf.setsampwidth(sample_width)
+                wf.setframerate(self.rate)
+                wf.writeframes(b''.join(frames))
+                wf.close()
             
             print(f"Запись сохранена: {filename}")
             return filename
         except Exception as e:
-            audio.terminate()
             raise Exception(f"Ошибка сохранения файла: {e}")
-        finally:
-            audio.terminate()
 
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк выбора лучшего окна на наборе записей
+
+Для каждого файла из директории сравнивает отправку всей записи
+и лучших окон: размер запроса, время анализа и (с --recognize)
+процент распознаваний через Shazam API.
+
+Ожидаемый трек берётся из expected.json в той же директории
+({"файл.webm": "Название"}) или из имени файла вида «Артист - Название.ext».
+
+Использование:
+    python bench_windows.py fixtures/
+    python bench_windows.py fixtures/ --recognize --json results.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from audio_converter import convert_to_wav
+from audio_windows import load_wav, best_windows, window_wav_bytes, recognize_best_window
+from config import Config
+
+AUDIO_EXTENSIONS = {'.wav', '.webm', '.ogg', '.mp3', '.m4a', '.flac'}
+
+
+def expected_titles(directory):
+    path = os.path.join(directory, 'expected.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    titles = {}
+    for name in os.listdir(directory):
+        stem = os.path.splitext(name)[0]
+        if ' - ' in stem:
+            titles[name] = stem.split(' - ', 1)[1]
+    return titles
+
+
+def is_correct(result, expected):
+    if not result.get('success'):
+        return False
+    if not expected:
+        return True  # ожидание не задано - считаем любое совпадение
+    return expected.lower() in (result.get('title') or '').lower()
+
+
+def bench_file(path, expected, recognizer=None):
+    wav_path = convert_to_wav(path)
+    samples, rate = load_wav(wav_path)
+    full_bytes = len(samples) * 2 + 44
+
+    start = time.perf_counter()
+    windows = best_windows(samples, rate)
+    analysis = time.perf_counter() - start
+
+    row = {
+        'file': os.path.basename(path),
+        'duration': round(len(samples) / rate, 2),
+        'analysis_ms': round(analysis * 1000, 1),
+        'full_bytes': full_bytes,
+        'window_bytes': len(window_wav_bytes(samples, rate, windows[0])),
+        'windows': windows,
+    }
+
+    if recognizer is not None:
+        full = recognizer.recognize_file(wav_path)
+        best = recognize_best_window(recognizer, samples, rate)
+        row['full_hit'] = is_correct(full, expected)
+        row['window_hit'] = is_correct(best, expected)
+        row['window_used'] = best.get('window')
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк выбора лучшего окна')
+    parser.add_argument('directory', help='директория с записями')
+    parser.add_argument('--recognize', action='store_true',
+                        help='распознавать через Shazam API (тратит запросы)')
+    parser.add_argument('--json', help='сохранить результаты в JSON')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f"❌ Директория не найдена: {args.directory}")
+        sys.exit(1)
+
+    recognizer = None
+    if args.recognize:
+        from shazam_recognizer import ShazamRecognizer
+        recognizer = ShazamRecognizer()
+
+    titles = expected_titles(args.directory)
+    files = sorted(
+        name for name in os.listdir(args.directory)
+        if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS
+    )
+    if not files:
+        print("❌ Нет аудио файлов")
+        sys.exit(1)
+
+    print(f"\n📊 Записей: {len(files)}, окна {Config.BEST_WINDOW_MIN_SECONDS}-"
+          f"{Config.BEST_WINDOW_MAX_SECONDS}с, кандидатов {Config.BEST_WINDOW_CANDIDATES}\n")
+    rows = []
+    for name in files:
+        try:
+            row = bench_file(os.path.join(args.directory, name), titles.get(name), recognizer)
+        except Exception as e:
+            print(f"⚠️ {name}: {e}")
+            continue
+        rows.append(row)
+        best = row['windows'][0]
+        line = (f"{name[:40]:40} {row['duration']:5.1f}с  окно {best['start']:5.1f}-{best['end']:5.1f}с  "
+                f"{row['full_bytes'] // 1024:5d} -> {row['window_bytes'] // 1024:5d} KB  "
+                f"{row['analysis_ms']:6.1f} мс")
+        if recognizer is not None:
+            line += f"  вся: {'✅' if row['full_hit'] else '❌'}  окно: {'✅' if row['window_hit'] else '❌'}"
+        print(line)
+
+    if not rows:
+        sys.exit(1)
+
+    full_total = sum(r['full_bytes'] for r in rows)
+    window_total = sum(r['window_bytes'] for r in rows)
+    print(f"\nОбъём запросов: {full_total // 1024} KB -> {window_total // 1024} KB "
+          f"({100 * (1 - window_total / full_total):.0f}% меньше)")
+    print(f"Анализ: в среднем {sum(r['analysis_ms'] for r in rows) / len(rows):.1f} мс на запись")
+    if recognizer is not None:
+        full_hits = sum(r['full_hit'] for r in rows)
+        window_hits = sum(r['window_hit'] for r in rows)
+        print(f"Распознано: вся запись {full_hits}/{len(rows)}, лучшее окно {window_hits}/{len(rows)}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        print(f"💾 Результаты: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
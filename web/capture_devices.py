@@ -0,0 +1,283 @@
+"""
+Захват с микрофона для нескольких клиентов: один поток на устройство,
+раздача данных сессиям и очередь к эксклюзивным устройствам
+"""
+
+import queue
+import threading
+import pyaudio
+import metrics
+import tracing
+from config import Config
+
+
+class DeviceBusyError(Exception):
+    """Устройство занято эксклюзивной сессией дольше таймаута"""
+
+
+class CaptureEngine:
+    """
+    Один открытый поток PyAudio на физическое устройство.
+    Каждый прочитанный кусок раздаётся всем подписанным очередям.
+    """
+
+    def __init__(self, device_index, rate, channels, chunk, sample_format):
+        self.device_index = device_index
+        self.rate = rate
+        self.channels = channels
+        self.chunk = chunk
+        self.sample_format = sample_format
+        self.sample_width = None
+        self.error = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._audio = None
+        self._stream = None
+
+    def start(self):
+        self._audio = pyaudio.PyAudio()
+        try:
+            self.sample_width = self._audio.get_sample_size(self.sample_format)
+            self._stream = self._audio.open(
+                format=self.sample_format,
+                channels=self.channels,
+                rate=self.rate,
+                frames_per_buffer=self.chunk,
+                input=True,
+                input_device_index=self.device_index
+            )
+        except Exception:
+            self._audio.terminate()
+            raise
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._read_loop, name=f'capture-{self.device_index}', daemon=True
+        )
+        self._thread.start()
+        print(f"🎙️ Поток устройства [{self.device_index}] открыт")
+
+    def _read_loop(self):
+        while not self._stop.is_set():
+            try:
+                data = self._stream.read(self.chunk, exception_on_overflow=False)
+            except Exception as e:
+                self.error = e
+                print(f"Ошибка чтения данных: {e}")
+                break
+            with self._lock:
+                subscribers = list(self._subscribers)
+            for q in subscribers:
+                try:
+                    q.put_nowait(data)
+                except queue.Full:
+                    pass  # медленный клиент теряет кусок, остальные не ждут
+
+        # Будим читателей, чтобы они не ждали данных вечно
+        with self._lock:
+            for q in self._subscribers:
+                try:
+                    q.put_nowait(None)
+                except queue.Full:
+                    pass
+
+    def subscribe(self):
+        max_chunks = int(self.rate / self.chunk * Config.CAPTURE_BUFFER_SECONDS)
+        q = queue.Queue(maxsize=max_chunks)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+        try:
+            self._stream.stop_stream()
+            self._stream.close()
+        except Exception:
+            pass
+        self._audio.terminate()
+        print(f"🎙️ Поток устройства [{self.device_index}] закрыт")
+
+
+class CaptureSession:
+    """Подписка одного клиента на общий поток устройства"""
+
+    def __init__(self, manager, engine, exclusive):
+        self.manager = manager
+        self.engine = engine
+        self.exclusive = exclusive
+        self._queue = engine.subscribe()
+        self._closed = False
+
+    @property
+    def device_index(self):
+        return self.engine.device_index
+
+    def read(self, duration, should_continue=None):
+        """
+        Читает duration секунд звука из общего потока.
+        Возвращает список кусков или None, если should_continue() вернул False.
+        """
+        total_chunks = int(self.engine.rate / self.engine.chunk * duration)
+        frames = []
+        while len(frames) < total_chunks:
+            try:
+                data = self._queue.get(timeout=Config.CAPTURE_READ_TIMEOUT)
+            except queue.Empty:
+                raise Exception(f"Нет данных от устройства [{self.device_index}]")
+            if data is None:
+                raise Exception(f"Поток устройства остановлен: {self.engine.error}")
+            frames.append(data)
+            if should_continue is not None and not should_continue():
+                return None
+        return frames
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.engine.unsubscribe(self._queue)
+        self.manager._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DeviceManager:
+    """
+    Владеет движками захвата и выдаёт сессии со счётчиком ссылок.
+
+    Обычные сессии одного устройства делят один поток.
+    Эксклюзивная сессия ждёт, пока устройство освободится, и блокирует
+    остальных; ожидание ограничено таймаутом (DeviceBusyError).
+    """
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self._cond = threading.Condition()
+        self._engines = {}    # device_index -> CaptureEngine
+        self._shared = {}     # device_index -> число обычных сессий
+        self._exclusive = set()
+        self._transitions = set()  # устройства, чей поток сейчас открывается или закрывается
+
+    def _resolve(self, device):
+        """Индекс PortAudio по индексу, стабильному ID или None (устройство по умолчанию)"""
+        device_index = self.recorder.registry.resolve(device)
+        if device_index is None:
+            raise Exception(f"Не найдено устройство ввода: {device}")
+        return device_index
+
+    def open_session(self, device_index=None, exclusive=False, timeout=None):
+        device_index = self._resolve(device_index)
+        exclusive = exclusive or device_index in Config.EXCLUSIVE_DEVICES
+        timeout = Config.CAPTURE_QUEUE_TIMEOUT if timeout is None else timeout
+
+        def available():
+            if device_index in self._exclusive or device_index in self._transitions:
+                return False
+            return not exclusive or self._shared.get(device_index, 0) == 0
+
+        with self._cond:
+            if not self._cond.wait_for(available, timeout):
+                raise DeviceBusyError(f"Устройство [{device_index}] занято")
+
+            engine = self._engines.get(device_index)
+            if engine is not None:
+                return self._register(engine, exclusive)
+
+            # Открытие PortAudio может длиться сотни мс - без блокировки,
+            # остальные клиенты этого устройства ждут по _transitions
+            self._transitions.add(device_index)
+
+        engine = CaptureEngine(
+            device_index,
+            rate=self.recorder.rate,
+            channels=self.recorder.channels,
+            chunk=self.recorder.chunk,
+            sample_format=self.recorder.sample_format,
+        )
+        try:
+            engine.start()
+        except Exception:
+            with self._cond:
+                self._transitions.discard(device_index)
+                self._cond.notify_all()
+            raise
+
+        with self._cond:
+            self._transitions.discard(device_index)
+            self._engines[device_index] = engine
+            session = self._register(engine, exclusive)
+            self._cond.notify_all()
+            return session
+
+    def _register(self, engine, exclusive):
+        """Учитывает новую сессию; вызывается под self._cond"""
+        device_index = engine.device_index
+        if exclusive:
+            self._exclusive.add(device_index)
+        else:
+            self._shared[device_index] = self._shared.get(device_index, 0) + 1
+        return CaptureSession(self, engine, exclusive)
+
+    def _release(self, session):
+        engine = None
+        with self._cond:
+            device_index = session.device_index
+            if session.exclusive:
+                self._exclusive.discard(device_index)
+            else:
+                self._shared[device_index] -= 1
+                if self._shared[device_index] == 0:
+                    del self._shared[device_index]
+
+            # Последний клиент закрывает поток устройства
+            if device_index not in self._exclusive and device_index not in self._shared:
+                engine = self._engines.pop(device_index, None)
+                if engine:
+                    self._transitions.add(device_index)
+            self._cond.notify_all()
+
+        if engine is None:
+            return
+        # Остановка ждёт поток чтения до секунды - тоже вне блокировки
+        try:
+            engine.stop()
+        finally:
+            with self._cond:
+                self._transitions.discard(device_index)
+                self._cond.notify_all()
+
+    def record(self, duration, device_index=None, exclusive=False, timeout=None):
+        """Записывает duration секунд через сессию и сохраняет WAV"""
+        with tracing.span('record', duration=duration, exclusive=exclusive) as span:
+            with self.open_session(device_index, exclusive, timeout) as session:
+                span.set(device_index=session.device_index, wait=round(span.elapsed(), 3))
+                print(f"Запись {duration} секунд с устройства [{session.device_index}]...")
+                with metrics.timed('capture'):
+                    frames = session.read(duration)
+                span.set(chunks=len(frames))
+                sample_width = session.engine.sample_width
+            return self.recorder.save_frames(frames, sample_width)
+
+    def active(self):
+        """Открытые устройства и число клиентов на каждом"""
+        with self._cond:
+            return {
+                index: {
+                    'clients': self._shared.get(index, 0) + (1 if index in self._exclusive else 0),
+                    'exclusive': index in self._exclusive,
+                }
+                for index in self._engines
+            }
@@ -3,10 +3,11 @@
 Проверка записанного файла на наличие звука
 """
 
-import wave
-import struct
+import json
 import sys
 import os
+import numpy as np
+from wav_analysis import analyze, find_wavs, open_wav, report
 
 def analyze_wav(filename):
     """Анализирует WAV файл на наличие звука"""
@@ -15,52 +16,31 @@ def analyze_wav(filename):
         return
     
     try:
-        wf = wave.open(filename, 'rb')
-        channels = wf.getnchannels()
-        sample_width = wf.getsampwidth()
-        framerate = wf.getframerate()
-        n_frames = wf.getnframes()
-        duration = n_frames / framerate
+        stats = analyze(filename, blocks=False)
         
         print(f"\n📊 Анализ файла: {filename}")
-        print(f"   Каналы: {channels}")
-        print(f"   Частота дискретизации: {framerate} Hz")
-        print(f"   Размер сэмпла: {sample_width} байт")
-        print(f"   Количество фреймов: {n_frames}")
-        print(f"   Длительность: {duration:.2f} секунд")
+        print(f"   Каналы: {stats['channels']}")
+        print(f"   Частота дискретизации: {stats['rate']} Hz")
+        print(f"   Размер сэмпла: {stats['bits'] // 8} байт")
+        print(f"   Количество фреймов: {stats['frames']}")
+        print(f"   Длительность: {stats['duration']:.2f} секунд")
         
-        # Читаем все данные
-        frames = wf.readframes(n_frames)
-        wf.close()
-        
-        if len(frames) == 0:
+        if stats.get('empty'):
             print("\n❌ Файл пустой!")
             return
         
-        # Анализируем уровень звука
-        if sample_width == 2:  # 16-bit
-            samples = struct.unpack(f'{len(frames)//2}h', frames)
-        elif sample_width == 1:  # 8-bit
-            samples = struct.unpack(f'{len(frames)}B', frames)
-            samples = [s - 128 for s in samples]  # Convert to signed
-        else:
-            print(f"❌ Неподдерживаемый размер сэмпла: {sample_width}")
-            return
-        
-        # Находим максимальный уровень
-        max_amplitude = max(abs(s) for s in samples)
-        min_amplitude = min(abs(s) for s in samples)
-        avg_amplitude = sum(abs(s) for s in samples) / len(samples)
+        max_percent = stats['peak'] * 100
+        rms_percent = stats['rms'] * 100
         
-        # Для 16-bit максимальное значение 32768
-        max_possible = 32768 if sample_width == 2 else 128
-        max_percent = (max_amplitude / max_possible) * 100
-        avg_percent = (avg_amplitude / max_possible) * 100
-        
-        print(f"\n🔊 Уровни звука:")
-        print(f"   Максимальная амплитуда: {max_amplitude} ({max_percent:.2f}%)")
-        print(f"   Средняя амплитуда: {avg_amplitude:.1f} ({avg_percent:.2f}%)")
-        print(f"   Минимальная амплитуда: {min_amplitude}")
+        print(f"\n🔊 Уровни звука (канал {stats['channel']}):")
+        print(f"   Пик: {max_percent:.2f}% ({_db(stats['peak_dbfs'])})")
+        print(f"   RMS: {rms_percent:.2f}% ({_db(stats['rms_dbfs'])})")
+        print(f"   Шумовой фон: {_db(stats.get('noise_floor_dbfs'))}, SNR: {_db(stats.get('snr_db'), 'dB')}")
+        print(f"   DC-смещение: {stats['dc_offset'] * 100:+.3f}%")
+        print(f"   Клиппинг: {stats['clipped']} сэмплов ({stats['clipped_ratio'] * 100:.3f}%)")
+        if stats.get('spectrum'):
+            bands = '  '.join(f"{b['low']:g}-{b['high']:g}: {_db(b['db'], 'dB')}" for b in stats['spectrum'])
+            print(f"   Спектр по октавам (Гц): {bands}")
         
         # Проверяем на тишину
         if max_percent < 0.1:
@@ -78,8 +58,12 @@ def analyze_wav(filename):
             print("\n✅ Звук обнаружен!")
             print(f"   Уровень достаточен для распознавания")
         
+        if stats['clipped_ratio'] > 0.001:
+            print("\n⚠️  Заметный клиппинг: источник слишком громкий или усиление завышено")
+        
         # Проверяем на монотонность (все одинаковые значения = тишина)
-        unique_values = len(set(samples[:1000]))  # Проверяем первые 1000 сэмплов
+        _, data = open_wav(filename)
+        unique_values = len(np.unique(data[:1000, stats['channel']], axis=0))  # Проверяем первые 1000 сэмплов
         if unique_values < 10:
             print("\n⚠️  Подозрение на тишину: очень мало уникальных значений")
         
@@ -88,7 +72,14 @@ def analyze_wav(filename):
         import traceback
         traceback.print_exc()
 
+def _db(value, unit='dBFS'):
+    return f"{value:.1f} {unit}" if value is not None else "—"
+
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and os.path.isdir(sys.argv[1]):
+        # Каталог: все WAV параллельно по ядрам, отчёт в JSON
+        print(json.dumps(report(find_wavs(sys.argv[1])), ensure_ascii=False, indent=2))
+        sys.exit(0)
     if len(sys.argv) > 1:
         filename = sys.argv[1]
     else:
@@ -100,7 +91,7 @@ if __name__ == '__main__':
             print(f"Используется последний файл: {filename}")
         else:
             print("❌ Не найдено записанных файлов")
-            print("Использование: python check_recording.py <путь_к_файлу.wav>")
+            print("Использование: python check_recording.py <путь_к_файлу.wav | каталог>")
             sys.exit(1)
     
     analyze_wav(filename)
@@ -8,8 +8,76 @@ class Config:
     APIFY_TOKEN = os.getenv('APIFY_TOKEN', '')
 
     RECORDING_DURATION = 15  # секунд
+    DEVICE_SCAN_INTERVAL = 300  # секунд между фоновыми опросами устройств
+    DEVICE_HOTPLUG_SETTLE = 1.0  # секунд ожидания после события udev
+
+    # Захват с серверного микрофона
+    EXCLUSIVE_DEVICES = {int(i) for i in os.getenv('EXCLUSIVE_DEVICES', '').split(',') if i.strip()}
+    CAPTURE_QUEUE_TIMEOUT = 30  # секунд ожидания занятого устройства
+    CAPTURE_READ_TIMEOUT = 5  # секунд без данных = устройство отвалилось
+    CAPTURE_BUFFER_SECONDS = 5  # сколько звука копится для медленного клиента
     RECORDINGS_DIR = 'recordings'
     DOWNLOADS_DIR = 'downloads'
+    CATALOG_DB = os.getenv('CATALOG_DB', 'recordings.db')  # SQLite каталог записей
+
+    # Лимиты хранилища (0 = без ограничения)
+    RECORDINGS_MAX_MB = int(os.getenv('RECORDINGS_MAX_MB', '200'))
+    RECORDINGS_MAX_FILES = int(os.getenv('RECORDINGS_MAX_FILES', '200'))
+    RECORDINGS_MAX_AGE_HOURS = int(os.getenv('RECORDINGS_MAX_AGE_HOURS', '0'))
+    DOWNLOADS_MAX_MB = int(os.getenv('DOWNLOADS_MAX_MB', '2000'))
+    DOWNLOADS_MAX_FILES = int(os.getenv('DOWNLOADS_MAX_FILES', '0'))
+    CONVERSIONS_DIR = 'conversions'  # кеш WAV по хешу исходника
+    CONVERSIONS_MAX_MB = int(os.getenv('CONVERSIONS_MAX_MB', '200'))
+    STORAGE_POLICY = os.getenv('STORAGE_POLICY', 'lru')  # lru | age
+    STORAGE_CHECK_INTERVAL = 60  # секунд
+    STORAGE_EVICT_BATCH = 10  # файлов за один проход
+
+    # Фоновые задачи /api/jobs
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+    JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', '8'))
+    JOB_RETENTION = 600  # секунд хранения завершённых задач
+
+    # Приём загрузок
+    MAX_UPLOAD_MB = int(os.getenv('MAX_UPLOAD_MB', '20'))
+    RECOGNITION_RATE = 44100  # Гц, mono 16-bit для Shazam
+    SILENCE_PEAK = 0.001  # пик ниже этого уровня = тишина, не тратим запрос к API
+    FORMAT_CACHE_FILE = os.getenv('FORMAT_CACHE_FILE', 'format_support.json')  # какие форматы API принимает как есть
+
+    # Выбор лучшего фрагмента записи перед отправкой в Shazam
+    BEST_WINDOW_ENABLED = os.getenv('BEST_WINDOW_ENABLED', '1') == '1'
+    BEST_WINDOW_MIN_SECONDS = 6
+    BEST_WINDOW_MAX_SECONDS = 10
+    BEST_WINDOW_HOP = 0.5  # секунд между началами окон
+    BEST_WINDOW_CANDIDATES = int(os.getenv('BEST_WINDOW_CANDIDATES', '2'))  # окон параллельно
+
+    # Вторая попытка при промахе: варианты той же записи
+    RETRY_ON_MISS = os.getenv('RETRY_ON_MISS', '1') == '1'
+    RETRY_VARIANTS = [v.strip() for v in os.getenv('RETRY_VARIANTS', 'shifted,normalized,highpass').split(',') if v.strip()]
+    RETRY_MAX_PARALLEL = 2  # одновременных запросов на повтор
+    RETRY_NORMALIZE_PEAK = 0.9  # пик после нормализации громкости
+    RETRY_HIGHPASS_HZ = 150  # срез ФВЧ, Гц
+    RECOGNIZE_BUDGET_PER_MINUTE = int(os.getenv('RECOGNIZE_BUDGET_PER_MINUTE', '12'))  # запросов к API в минуту
+
+    # Живое распознавание по WebSocket (/api/live, нужен flask-sock)
+    LIVE_MAX_SESSIONS = int(os.getenv('LIVE_MAX_SESSIONS', '4'))
+    LIVE_MIN_SECONDS = 3  # меньше звука Shazam не распознаёт
+    LIVE_FIRST_ATTEMPT_SECONDS = 4  # первая попытка после стольких секунд звука
+    LIVE_ATTEMPT_STEP = 4  # секунд нового звука между попытками
+    LIVE_WINDOW_SECONDS = 10  # последние N секунд в каждой попытке
+    LIVE_MAX_ATTEMPTS = 4  # запросов к API на один поток
+    LIVE_IDLE_TIMEOUT = 10  # секунд без данных = клиент пропал
+
+    # Отдача файлов: '' (сам Flask), 'x-sendfile' (Apache/lighttpd), 'x-accel' (nginx)
+    SENDFILE_MODE = os.getenv('SENDFILE_MODE', '')
+    ACCEL_REDIRECT_PREFIX = os.getenv('ACCEL_REDIRECT_PREFIX', '/protected')
+    DOWNLOADS_MAX_AGE = 86400  # секунд кеширования скачанных MP3 в браузере
+
+    # Трассировка запросов
+    TRACE_BUFFER_SIZE = int(os.getenv('TRACE_BUFFER_SIZE', '100'))  # последних трасс в памяти
+    TRACE_PROFILE_THRESHOLD = float(os.getenv('TRACE_PROFILE_THRESHOLD', '10'))  # секунд; 0 = без профайлера
+    TRACE_PROFILE_INTERVAL = 0.05  # секунд между выборками стека
+    TRACE_PROFILE_TOP = 20  # самых частых стеков в отчёте
 
     os.makedirs(RECORDINGS_DIR, exist_ok=True)
     os.makedirs(DOWNLOADS_DIR, exist_ok=True)
+    os.makedirs(CONVERSIONS_DIR, exist_ok=True)
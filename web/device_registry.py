@@ -0,0 +1,141 @@
+"""
+Кеш списка аудио устройств со стабильными ID и обновлением по hotplug
+"""
+
+import re
+import threading
+import time
+import pyaudio
+from config import Config
+
+
+def _slug(name):
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-') or 'device'
+
+
+class DeviceRegistry:
+    """
+    Один раз опрашивает PortAudio и хранит результат.
+
+    Список обновляется по событиям udev (если установлен pyudev)
+    или редким фоновым опросом, поэтому record() получает устройство
+    по умолчанию из памяти, не поднимая PortAudio/ALSA заново.
+    ID устройства строится из имени и не меняется при смене индексов.
+    """
+
+    def __init__(self, scan_interval=None):
+        self.scan_interval = scan_interval or Config.DEVICE_SCAN_INTERVAL
+        self._devices = []
+        self._default_index = None
+        self._lock = threading.Lock()
+        self._scanned = False
+        self._thread = None
+        self._stop = threading.Event()
+        self._changed = threading.Event()
+
+    def refresh(self):
+        """Опрашивает PortAudio; возвращает True, если список изменился"""
+        audio = pyaudio.PyAudio()
+        try:
+            devices = []
+            seen = {}
+            for i in range(audio.get_device_count()):
+                info = audio.get_device_info_by_index(i)
+                if info['maxInputChannels'] <= 0:
+                    continue
+                base = _slug(info['name'])
+                seen[base] = seen.get(base, 0) + 1
+                device_id = base if seen[base] == 1 else f"{base}-{seen[base]}"
+                devices.append({
+                    'id': device_id,
+                    'index': i,
+                    'name': info['name'],
+                    'channels': info['maxInputChannels'],
+                    'rate': info['defaultSampleRate']
+                })
+
+            try:
+                default_index = audio.get_default_input_device_info()['index']
+            except Exception:
+                default_index = devices[0]['index'] if devices else None
+        finally:
+            audio.terminate()
+
+        with self._lock:
+            changed = devices != self._devices or default_index != self._default_index
+            self._devices = devices
+            self._default_index = default_index
+            self._scanned = True
+
+        if changed:
+            print(f"🎚️ Устройств ввода: {len(devices)}, по умолчанию: [{default_index}]")
+        return changed
+
+    def _ensure_scanned(self):
+        if not self._scanned:
+            self.refresh()
+
+    def devices(self):
+        self._ensure_scanned()
+        with self._lock:
+            return [dict(d) for d in self._devices]
+
+    def default_index(self):
+        self._ensure_scanned()
+        with self._lock:
+            return self._default_index
+
+    def resolve(self, device):
+        """Принимает индекс PortAudio или стабильный ID; возвращает индекс или None"""
+        if device is None:
+            return self.default_index()
+        if isinstance(device, int) or str(device).isdigit():
+            return int(device)
+        self._ensure_scanned()
+        with self._lock:
+            for d in self._devices:
+                if d['id'] == device or d['name'] == device:
+                    return d['index']
+        return None
+
+    def start(self):
+        """Фоновое обновление: события udev или опрос раз в scan_interval"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='device-registry', daemon=True)
+        self._thread.start()
+        self._start_udev_monitor()
+
+    def _start_udev_monitor(self):
+        try:
+            import pyudev
+        except ImportError:
+            return
+        try:
+            context = pyudev.Context()
+            monitor = pyudev.Monitor.from_netlink(context)
+            monitor.filter_by('sound')
+            observer = pyudev.MonitorObserver(monitor, callback=lambda device: self._changed.set())
+            observer.daemon = True
+            observer.start()
+            print("🎚️ Слежение за подключением устройств через udev")
+        except Exception as e:
+            print(f"⚠️ udev недоступен, остаётся периодический опрос: {e}")
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if self._changed.wait(self.scan_interval):
+                # Устройство появляется в ALSA чуть позже события udev
+                time.sleep(Config.DEVICE_HOTPLUG_SETTLE)
+                self._changed.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Ошибка опроса устройств: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self._changed.set()
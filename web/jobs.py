@@ -0,0 +1,195 @@
+"""
+Фоновые задачи обработки с событиями прогресса (для SSE)
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import tracing
+from config import Config
+
+
+class QueueFullError(Exception):
+    """Очередь задач переполнена"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Очередь задач заполнена, повторите через {retry_after} с")
+        self.retry_after = retry_after
+
+
+class Job:
+    """Одна задача: состояние, результат и журнал событий"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.state = 'queued'
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.events = []
+        self._cond = threading.Condition()
+
+    def emit(self, event, **data):
+        """Добавляет событие в журнал и будит подписчиков"""
+        with self._cond:
+            entry = {
+                'id': len(self.events) + 1,
+                'event': event,
+                'time': time.time(),
+                'elapsed': round(time.time() - self.created, 3),
+            }
+            entry.update(data)
+            self.events.append(entry)
+            self._cond.notify_all()
+        return entry
+
+    @contextmanager
+    def stage(self, name, **data):
+        """Отмечает начало и конец этапа с длительностью"""
+        start = time.perf_counter()
+        self.emit('stage', stage=name, status='start', **data)
+        try:
+            with tracing.span(name, **data):
+                yield
+        except Exception as e:
+            self.emit('stage', stage=name, status='error', error=str(e),
+                      duration=round(time.perf_counter() - start, 3))
+            raise
+        self.emit('stage', stage=name, status='end',
+                  duration=round(time.perf_counter() - start, 3))
+
+    def finish(self, state, **data):
+        """Переводит задачу в конечное состояние вместе с последним событием"""
+        with self._cond:
+            self.finished = time.time()
+            self.state = state
+            self.emit(state, **data)
+
+    @property
+    def done(self):
+        return self.state in ('done', 'failed')
+
+    def iter_events(self, after=0, keepalive=15):
+        """
+        Отдаёт события начиная с номера after+1.
+        Возвращает None каждые keepalive секунд без событий.
+        """
+        position = after
+        while True:
+            with self._cond:
+                if position >= len(self.events) and not self.done:
+                    self._cond.wait(keepalive)
+                pending = self.events[position:]
+                finished = self.done
+            if not pending:
+                if finished:
+                    return
+                yield None
+                continue
+            for entry in pending:
+                yield entry
+            position += len(pending)
+
+    def snapshot(self):
+        return {
+            'id': self.id,
+            'state': self.state,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'result': self.result,
+            'error': self.error,
+            'events': len(self.events),
+        }
+
+
+class JobManager:
+    """
+    Ограниченный пул воркеров для задач обработки.
+
+    В пуле max_workers потоков и не больше max_queue ожидающих задач;
+    при переполнении submit() сразу бросает QueueFullError.
+    """
+
+    def __init__(self, max_workers=None, max_queue=None, retention=None):
+        self.max_workers = max_workers or Config.JOB_WORKERS
+        self.max_queue = max_queue if max_queue is not None else Config.JOB_QUEUE_SIZE
+        self.retention = retention or Config.JOB_RETENTION
+        self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='job')
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._avg_duration = 30.0  # секунд, уточняется по завершённым задачам
+
+    def reserve(self):
+        """
+        Занимает место в очереди заранее - до приёма загрузки, чтобы
+        при переполнении не принимать и не сохранять файл зря.
+        Место отдаётся через submit_reserved() или release().
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(self.retry_after())
+
+    def release(self):
+        """Возвращает место, занятое reserve(), если задача так и не поставлена"""
+        self._slots.release()
+
+    def submit(self, fn, *args, **kwargs):
+        """Ставит fn(job, *args, **kwargs) в очередь и возвращает Job"""
+        self.reserve()
+        return self.submit_reserved(fn, *args, **kwargs)
+
+    def submit_reserved(self, fn, *args, **kwargs):
+        """submit() на место, уже занятое reserve()"""
+        self._prune()
+        job = Job()
+        with self._lock:
+            self._jobs[job.id] = job
+        job.emit('queued')
+        try:
+            self._executor.submit(self._run, job, fn, args, kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.started = time.time()
+        job.state = 'running'
+        job.emit('started', wait=round(job.started - job.created, 3))
+        try:
+            job.result = fn(job, *args, **kwargs)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            job.error = str(e)
+        finally:
+            duration = time.time() - job.started
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+            self._slots.release()
+
+        if job.error is None:
+            job.finish('done', duration=round(duration, 3), result=job.result)
+        else:
+            job.finish('failed', duration=round(duration, 3), error=job.error)
+
+    def retry_after(self):
+        """Оценка, через сколько секунд освободится место в очереди"""
+        return max(1, int(self._avg_duration / self.max_workers))
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        """Забывает завершённые задачи старше retention"""
+        cutoff = time.time() - self.retention
+        with self._lock:
+            stale = [job_id for job_id, job in self._jobs.items()
+                     if job.done and job.finished < cutoff]
+            for job_id in stale:
+                del self._jobs[job_id]
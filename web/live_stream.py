@@ -0,0 +1,136 @@
+"""
+Живое распознавание: аудио приходит кусками (WebSocket), декодируется на лету,
+попытки распознавания идут по мере накопления звука
+"""
+
+import hashlib
+import threading
+import time
+import numpy as np
+from stream_ingest import PcmDecoder, UploadTooLarge, pcm_to_wav_bytes
+from config import Config
+
+
+class LiveSession:
+    """
+    Один живой поток от браузера.
+
+    Сжатые куски идут в ffmpeg (PcmDecoder) и, если указан tee_path, на диск.
+    Как только декодировано LIVE_FIRST_ATTEMPT_SECONDS звука, в фоне
+    запускается попытка распознавания по последнему окну, дальше - каждые
+    LIVE_ATTEMPT_STEP секунд нового звука. Одновременно идёт не больше
+    одной попытки; первое совпадение останавливает остальные.
+    Каждая попытка берёт слот budget (RateBudget); без слота она
+    откладывается на следующий шаг.
+    События отправляются через send(dict).
+    """
+
+    def __init__(self, recognizer, send, tee_path=None, max_bytes=None, budget=None):
+        self.recognizer = recognizer
+        self.budget = budget
+        self.send = send
+        self.tee_path = tee_path
+        self.max_bytes = max_bytes or Config.MAX_UPLOAD_MB * 1024 * 1024
+        self.decoder = PcmDecoder()
+        self.size = 0
+        self.attempts = 0
+        self.result = None
+        self.last_result = None
+        self.matched = threading.Event()
+        self._digest = hashlib.sha256()
+        self._tee = open(tee_path, 'wb') if tee_path else None
+        self._next_at = Config.LIVE_FIRST_ATTEMPT_SECONDS
+        self._last_attempt_at = 0.0
+        self._worker = None
+        self._started = time.perf_counter()
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    @property
+    def duration(self):
+        return self.decoder.decoded_seconds
+
+    def feed(self, chunk):
+        """Принимает очередной кусок от MediaRecorder"""
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"Поток больше {self.max_bytes // 1024 // 1024} MB")
+        self._digest.update(chunk)
+        if self._tee:
+            self._tee.write(chunk)
+        self.decoder.feed(chunk)
+        self._maybe_attempt()
+
+    def _maybe_attempt(self, final=False):
+        if self.matched.is_set() or self.attempts >= Config.LIVE_MAX_ATTEMPTS:
+            return
+        if self._worker and self._worker.is_alive():
+            return
+        seconds = self.decoder.decoded_seconds
+        if seconds < Config.LIVE_MIN_SECONDS or (not final and seconds < self._next_at):
+            return
+        if final and seconds - self._last_attempt_at < 1.0:
+            return  # нового звука почти нет - повторять ту же попытку незачем
+        self._next_at = seconds + Config.LIVE_ATTEMPT_STEP
+        if self.budget is not None and not self.budget.try_acquire():
+            print(f"⏳ Живая попытка на {seconds:.1f} с отложена: лимит запросов к API")
+            return
+        self._last_attempt_at = seconds
+        self.attempts += 1
+        self._worker = threading.Thread(
+            target=self._attempt, args=(self.decoder.pcm_snapshot(), self.attempts),
+            name='live-attempt', daemon=True,
+        )
+        self._worker.start()
+
+    def _attempt(self, pcm, number):
+        rate = self.decoder.rate
+        window = pcm[-int(Config.LIVE_WINDOW_SECONDS * rate) * 2:]
+        seconds = round(len(pcm) / 2 / rate, 1)
+        samples = np.frombuffer(window, dtype=np.int16)
+        if not len(samples) or np.abs(samples.astype(np.int32)).max() < Config.SILENCE_PEAK * 32768:
+            self.send({'event': 'attempt', 'attempt': number, 'seconds': seconds,
+                       'success': False, 'error': 'Тишина - ждём звук'})
+            return
+
+        result = self.recognizer.recognize_bytes(
+            pcm_to_wav_bytes(window, rate), filename=f'live_{number}.wav'
+        )
+        self.last_result = result
+        self.send({'event': 'attempt', 'attempt': number, 'seconds': seconds,
+                   'success': bool(result.get('success')), 'error': result.get('error')})
+        if result.get('success') and not self.matched.is_set():
+            self.result = result
+            self.matched.set()
+            self.send({'event': 'match', 'recognition': result, 'seconds': seconds,
+                       'elapsed': round(time.perf_counter() - self._started, 2)})
+
+    def finish(self, final_attempt=True):
+        """
+        Конец потока: дожидается декодера и текущей попытки.
+        Если совпадения ещё нет - последняя попытка по свежему окну;
+        final_attempt=False (клиент отключился) - без неё.
+        Возвращает результат распознавания (или последнюю неудачу).
+        """
+        self._close_tee()
+        self.decoder.close()
+        if self._worker:
+            self._worker.join()
+        if final_attempt and not self.matched.is_set():
+            self._maybe_attempt(final=True)
+            if self._worker:
+                self._worker.join()
+        if self.result:
+            return self.result
+        return self.last_result or {'success': False, 'error': 'Трек не распознан'}
+
+    def abort(self):
+        self._close_tee()
+        self.decoder.abort()
+
+    def _close_tee(self):
+        if self._tee:
+            self._tee.close()
+            self._tee = None
@@ -0,0 +1,160 @@
+"""
+Метрики конвейера: счётчики и гистограммы в формате Prometheus
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Границы бакетов длительности этапов, секунд
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+POLL_BUCKETS = (1, 2, 3, 5, 8, 10, 15, 20, 30)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape_label(value):
+    """Экранирование значения метки по текстовому формату Prometheus"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    body = ','.join(f'{k}="{_escape_label(v)}"' for k, v in pairs)
+    return '{' + body + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(key)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [counts по бакетам, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    lines.append(f'{self.name}_bucket{_format_labels(key, [("le", bound)])} {cumulative}')
+                lines.append(f'{self.name}_bucket{_format_labels(key, [("le", "+Inf")])} {count}')
+                lines.append(f'{self.name}_sum{_format_labels(key)} {total:.6f}')
+                lines.append(f'{self.name}_count{_format_labels(key)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args)
+            return metric
+
+    def counter(self, name, help_text):
+        return self._get_or_create(Counter, name, help_text)
+
+    def histogram(self, name, help_text, buckets=STAGE_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, buckets)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """Атомарно записывает метрики в файл (для node_exporter textfile)"""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    'flashshazam_stage_seconds', 'Длительность этапов конвейера, секунд'
+)
+stage_errors = registry.counter(
+    'flashshazam_stage_errors_total', 'Этапы, завершившиеся исключением'
+)
+poll_attempts = registry.histogram(
+    'flashshazam_recognize_poll_attempts', 'Число опросов результатов Shazam на одно распознавание',
+    POLL_BUCKETS
+)
+recognitions = registry.counter(
+    'flashshazam_recognitions_total', 'Распознавания по результату'
+)
+downloads = registry.counter(
+    'flashshazam_downloads_total', 'Скачивания по результату'
+)
+transfer_bytes = registry.counter(
+    'flashshazam_transfer_bytes_total', 'Байт передано по этапам'
+)
+retry_variants = registry.counter(
+    'flashshazam_retry_variants_total',
+    'Попытки распознавания по вариантам звука (hit - вариант дал результат первым)'
+)
+
+
+@contextmanager
+def timed(stage):
+    """Замеряет длительность этапа в flashshazam_stage_seconds{stage=...}"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(stage=stage)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=stage)
@@ -0,0 +1,167 @@
+"""
+Каталог записей в SQLite: заполняется при записи файлов, без сканирования диска
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from config import Config
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    format TEXT NOT NULL,
+    duration REAL,
+    size INTEGER,
+    content_hash TEXT,
+    converted_path TEXT,
+    status TEXT NOT NULL DEFAULT 'new',
+    title TEXT,
+    artist TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recordings_hash ON recordings(content_hash);
+CREATE INDEX IF NOT EXISTS idx_recordings_converted ON recordings(converted_path);
+"""
+
+# Статусы распознавания
+STATUS_NEW = 'new'
+STATUS_RECOGNIZED = 'recognized'
+STATUS_NOT_RECOGNIZED = 'not_recognized'
+STATUS_ERROR = 'error'
+
+
+class RecordingsCatalog:
+    """Потокобезопасный каталог записей (одно соединение под блокировкой)"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or Config.CATALOG_DB
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(SCHEMA)
+
+    def _row(self, row):
+        return dict(row) if row else None
+
+    def add(self, path, format, duration=None, size=None, content_hash=None):
+        """
+        Регистрирует новую запись; возвращает её ID.
+        Путь уже в каталоге - sqlite3.IntegrityError: молча заменять строку
+        нельзя, на неё может ссылаться задача в очереди.
+        """
+        now = time.time()
+        if size is None and os.path.exists(path):
+            size = os.path.getsize(path)
+        with self._lock, self._db:
+            cur = self._db.execute(
+                'INSERT INTO recordings '
+                '(path, format, duration, size, content_hash, status, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (os.path.abspath(path), format, duration, size, content_hash, STATUS_NEW, now, now),
+            )
+            return cur.lastrowid
+
+    def set_converted(self, recording_id, converted_path, duration=None):
+        """Запоминает сконвертированный вариант (WAV) записи"""
+        with self._lock, self._db:
+            self._db.execute(
+                'UPDATE recordings SET converted_path = ?, duration = COALESCE(?, duration), '
+                'updated_at = ? WHERE id = ?',
+                (os.path.abspath(converted_path), duration, time.time(), recording_id),
+            )
+
+    def set_status(self, recording_id, status, title=None, artist=None):
+        with self._lock, self._db:
+            self._db.execute(
+                'UPDATE recordings SET status = ?, title = ?, artist = ?, updated_at = ? WHERE id = ?',
+                (status, title, artist, time.time(), recording_id),
+            )
+
+    def get(self, recording_id):
+        with self._lock:
+            row = self._db.execute('SELECT * FROM recordings WHERE id = ?', (recording_id,)).fetchone()
+        return self._row(row)
+
+    def latest(self):
+        """Последняя запись - поиск по первичному ключу, O(1)"""
+        with self._lock:
+            row = self._db.execute('SELECT * FROM recordings ORDER BY id DESC LIMIT 1').fetchone()
+        return self._row(row)
+
+    def page(self, page=1, per_page=20):
+        """
+        Страница записей от новых к старым.
+        Возвращает (записи, есть_ли_ещё) - без COUNT(*) по всей таблице.
+        """
+        page = max(1, page)
+        per_page = max(1, min(per_page, 100))
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT * FROM recordings ORDER BY id DESC LIMIT ? OFFSET ?',
+                (per_page + 1, (page - 1) * per_page),
+            ).fetchall()
+        return [dict(r) for r in rows[:per_page]], len(rows) > per_page
+
+    def is_empty(self):
+        with self._lock:
+            return self._db.execute('SELECT 1 FROM recordings LIMIT 1').fetchone() is None
+
+    def backfill(self, directory):
+        """
+        Однократный импорт файлов, записанных до появления каталога.
+        WAV рядом с одноимённым webm считается его сконвертированным вариантом.
+        """
+        files = {}
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_file():
+                    stem, ext = os.path.splitext(entry.name)
+                    files.setdefault(stem, {})[ext.lower().lstrip('.')] = entry
+
+        rows = []
+        for stem, variants in files.items():
+            originals = [ext for ext in variants if ext != 'wav'] or ['wav']
+            original = variants.get(originals[0])
+            if original is None:
+                continue
+            st = original.stat()
+            converted = variants.get('wav') if originals[0] != 'wav' else None
+            rows.append((
+                os.path.abspath(original.path), originals[0], st.st_size,
+                os.path.abspath(converted.path) if converted else None,
+                STATUS_NEW, st.st_mtime, st.st_mtime,
+            ))
+
+        rows.sort(key=lambda r: r[5])
+        with self._lock, self._db:
+            self._db.executemany(
+                'INSERT OR IGNORE INTO recordings '
+                '(path, format, size, converted_path, status, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows,
+            )
+        print(f"🗂️ В каталог импортировано записей: {len(rows)}")
+
+    def forget_path(self, path):
+        """
+        Файл удалён с диска: удаляем запись, если это оригинал,
+        или только ссылку на сконвертированный вариант.
+        """
+        path = os.path.abspath(path)
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM recordings WHERE path = ?', (path,))
+            self._db.execute(
+                'UPDATE recordings SET converted_path = NULL, updated_at = ? WHERE converted_path = ?',
+                (time.time(), path),
+            )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
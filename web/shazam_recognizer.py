@@ -1,9 +1,78 @@
 import requests
+import json
 import os
+import threading
 import time
+import metrics
+import tracing
 from config import Config
 
 
+# Ответы API, означающие «такой формат не принимаем»
+FORMAT_REJECT_STATUS = 415  # Unsupported Media Type - отказ по формату однозначно
+FORMAT_MAYBE_STATUSES = (400, 422)  # отказ по формату, только если об этом сказано в ответе
+FORMAT_REJECT_WORDS = ('format', 'unsupported', 'codec', 'decode', 'формат')
+
+# Результат разбора ответа для кеша форматов
+REJECT_FORMAT = 'format'  # API не принимает формат - запоминаем
+REJECT_AMBIGUOUS = 'ambiguous'  # 400/422 без указания причины - не запоминаем
+
+FORMAT_DIRECT = 'direct'
+FORMAT_CONVERT = 'convert'
+
+_FORMAT_ALIASES = {
+    'audio/x-wav': 'audio/wav',
+    'audio/wave': 'audio/wav',
+    'audio/vnd.wave': 'audio/wav',
+    'video/webm': 'audio/webm',
+    'audio/x-m4a': 'audio/mp4',
+    'audio/mp3': 'audio/mpeg',
+}
+
+
+def media_format(content_type):
+    """'audio/webm;codecs=opus' -> 'audio/webm' (ключ кеша форматов)"""
+    base = (content_type or '').split(';')[0].strip().lower()
+    return _FORMAT_ALIASES.get(base, base)
+
+
+class FormatSupport:
+    """
+    Какие форматы API принимает без конвертации.
+    Решение принимается по первому запросу и сохраняется в JSON,
+    чтобы не перепроверять формат после перезапуска.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or Config.FORMAT_CACHE_FILE
+        self._lock = threading.Lock()
+        self._decisions = {'audio/wav': FORMAT_DIRECT}
+        try:
+            with open(self.path) as f:
+                self._decisions.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+    def get(self, fmt):
+        with self._lock:
+            return self._decisions.get(fmt)
+
+    def set(self, fmt, decision):
+        with self._lock:
+            if self._decisions.get(fmt) == decision:
+                return
+            self._decisions[fmt] = decision
+            snapshot = dict(self._decisions)
+        print(f"🎛️ Формат {fmt}: {'как есть' if decision == FORMAT_DIRECT else 'конвертация в WAV'}")
+        try:
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ Не удалось сохранить кеш форматов: {e}")
+
+
 class ShazamRecognizer:
     """Распознавание музыки через Shazam API (shazam-api.com)"""
     
@@ -11,31 +80,111 @@ class ShazamRecognizer:
         self.api_key = Config.SHAZAM_API_KEY
         self.api_url = 'https://shazam-api.com/api/recognize'
         self.results_url = 'https://shazam-api.com/api/results'
+        self.formats = FormatSupport()
 
-    def recognize_file(self, audio_file_path):
+    def recognize_file(self, audio_file_path, content_type='audio/wav'):
         """Распознает трек из аудио файла"""
-        try:
-            if not os.path.exists(audio_file_path):
-                return {'success': False, 'error': 'Аудио файл не найден'}
+        if not os.path.exists(audio_file_path):
+            return {'success': False, 'error': 'Аудио файл не найден'}
+
+        size = os.path.getsize(audio_file_path)
+        print(f"📁 Файл: {audio_file_path} ({size} bytes)")
+        with open(audio_file_path, 'rb') as f:
+            return self._recognize(os.path.basename(audio_file_path), f, content_type, size)
+
+    def accepts_original(self, content_type):
+        """False, если уже известно, что формат нужно конвертировать"""
+        return self.formats.get(media_format(content_type)) != FORMAT_CONVERT
+
+    def recognize_original(self, audio_file_path, content_type):
+        """
+        Отправляет файл в исходном формате (например, webm/opus из браузера).
+        Возвращает None, если API этот формат не принимает - тогда
+        вызывающий конвертирует в WAV; решение запоминается для формата.
+        """
+        fmt = media_format(content_type)
+        if self.formats.get(fmt) == FORMAT_CONVERT:
+            return None
+
+        for attempt in range(2):
+            result = self.recognize_file(audio_file_path, content_type)
+            rejection = self._rejection(result)
+            if rejection != REJECT_AMBIGUOUS or attempt:
+                break
+            # Неудачный запрос не по формату не должен навсегда включать конвертацию
+            print(f"↩️ HTTP {result.get('status_code')} на {fmt} без указания на формат - повторяем")
+
+        if rejection == REJECT_FORMAT:
+            print(f"↩️ API не принял {fmt}, нужна конвертация")
+            self.formats.set(fmt, FORMAT_CONVERT)
+            return None
+        if rejection == REJECT_AMBIGUOUS:
+            print(f"↩️ {fmt} снова отклонён без причины - конвертируем, не запоминая")
+            return None
+        if self._outcome(result) in ('hit', 'miss'):
+            # API разобрал файл (даже если трек не найден) - формат подходит
+            self.formats.set(fmt, FORMAT_DIRECT)
+        return result
 
+    @staticmethod
+    def _rejection(result):
+        """REJECT_FORMAT, REJECT_AMBIGUOUS или None - формат тут ни при чём"""
+        if result.get('success'):
+            return None
+        status = result.get('status_code')
+        error = (result.get('error') or '').lower()
+        about_format = any(word in error for word in FORMAT_REJECT_WORDS)
+        if status == FORMAT_REJECT_STATUS:
+            return REJECT_FORMAT
+        if status in FORMAT_MAYBE_STATUSES:
+            return REJECT_FORMAT if about_format else REJECT_AMBIGUOUS
+        return REJECT_FORMAT if status is None and about_format else None
+
+    def recognize_bytes(self, data, filename='recording.wav', content_type='audio/wav'):
+        """Распознает трек из аудио в памяти (без временных файлов)"""
+        print(f"📁 Данные: {filename} ({len(data)} bytes)")
+        return self._recognize(filename, data, content_type, len(data))
+
+    def _recognize(self, filename, payload, content_type, size):
+        """Отправляет аудио в Shazam API и учитывает результат в метриках"""
+        with metrics.timed('recognize'), tracing.span(
+            'recognize_file', filename=filename, bytes=size, content_type=content_type
+        ) as span:
+            result = self._recognize_request(filename, payload, content_type, size)
+            span.set(outcome=self._outcome(result), error=result.get('error'))
+        metrics.recognitions.inc(result=self._outcome(result))
+        return result
+
+    @staticmethod
+    def _outcome(result):
+        if result.get('success'):
+            return 'hit'
+        if result.get('error') in ('Трек не найден', 'Данные трека отсутствуют', 'Трек не распознан'):
+            return 'miss'
+        return 'error'
+
+    def _recognize_request(self, filename, payload, content_type, size):
+        """Отправляет аудио в Shazam API и ждёт результат"""
+        try:
             headers = {
                 'Authorization': f'Bearer {self.api_key}'
             }
 
             # 1. Отправляем файл на распознавание
             print(f"🔍 Отправляем запрос к Shazam API...")
-            print(f"📁 Файл: {audio_file_path} ({os.path.getsize(audio_file_path)} bytes)")
-            
-            with open(audio_file_path, 'rb') as f:
-                files = {'file': (os.path.basename(audio_file_path), f, 'audio/wav')}
+            files = {'file': (filename, payload, content_type)}
+            with metrics.timed('upload'), tracing.span('upload', bytes=size) as span:
                 response = requests.post(self.api_url, headers=headers, files=files, timeout=60)
+                span.set(status_code=response.status_code)
+            metrics.transfer_bytes.inc(size, stage='upload')
 
             print(f"📡 Статус: {response.status_code}")
             
             if response.status_code != 200:
                 return {
                     'success': False,
-                    'error': f'HTTP {response.status_code}: {response.text[:300]}'
+                    'error': f'HTTP {response.status_code}: {response.text[:300]}',
+                    'status_code': response.status_code
                 }
 
             data = response.json()
@@ -56,23 +205,32 @@ class ShazamRecognizer:
             # Запрашиваем результаты (с retry)
             results_url = f"{self.results_url}/{uuid}"
             
-            for attempt in range(15):  # Максимум 30 секунд
-                time.sleep(2)
-                
-                results_response = requests.post(results_url, headers=headers, timeout=30)
-                
-                if results_response.status_code != 200:
-                    continue
-                
-                results_data = results_response.json()
-                
-                # Проверяем статус
-                if results_data.get('status') == 'processing':
-                    print(f"   Обработка... (попытка {attempt + 1})")
-                    continue
-                
-                # Получили результаты
-                return self._process_results(results_data)
+            attempts = 0
+            statuses = []
+            try:
+                with metrics.timed('poll_wait'), tracing.span('poll_results', uuid=uuid) as span:
+                    for attempt in range(15):  # Максимум 30 секунд
+                        time.sleep(2)
+                        attempts = attempt + 1
+                        
+                        results_response = requests.post(results_url, headers=headers, timeout=30)
+                        statuses.append(results_response.status_code)
+                        span.set(poll_attempts=attempts, status_codes=statuses)
+                        
+                        if results_response.status_code != 200:
+                            continue
+                        
+                        results_data = results_response.json()
+                        
+                        # Проверяем статус
+                        if results_data.get('status') == 'processing':
+                            print(f"   Обработка... (попытка {attempt + 1})")
+                            continue
+                        
+                        # Получили результаты
+                        return self._process_results(results_data)
+            finally:
+                metrics.poll_attempts.observe(attempts)
 
             return {'success': False, 'error': 'Таймаут ожидания результатов'}
 
@@ -0,0 +1,58 @@
+"""
+Отдача аудио файлов: безопасные пути, Range, ETag и разгрузка через веб-сервер
+"""
+
+import os
+from flask import Response, send_file
+from werkzeug.security import safe_join
+from config import Config
+
+
+def resolve_media_path(directory, filename):
+    """
+    Безопасно соединяет директорию и имя из URL.
+    Возвращает абсолютный путь к существующему файлу или None
+    (для '..', абсолютных путей и отсутствующих файлов).
+    """
+    path = safe_join(os.path.abspath(directory), filename)
+    if path is None or not os.path.isfile(path):
+        return None
+    return path
+
+
+def strong_etag(stat_result):
+    """Сильный ETag из inode, размера и времени изменения (без чтения файла)"""
+    return f"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"
+
+
+def send_media(path, mimetype=None, max_age=0):
+    """
+    Отдаёт файл с поддержкой Range (206), If-None-Match / If-Modified-Since (304).
+
+    Режим задаётся Config.SENDFILE_MODE:
+    - ''          - Werkzeug отдаёт файл сам (через wsgi.file_wrapper, т.е. sendfile у gunicorn)
+    - 'x-sendfile' - заголовок X-Sendfile для Apache/lighttpd
+    - 'x-accel'   - заголовок X-Accel-Redirect для nginx (Range и 304 делает nginx)
+    """
+    st = os.stat(path)
+    etag = strong_etag(st)
+
+    if Config.SENDFILE_MODE == 'x-accel':
+        relative = os.path.relpath(path, os.path.abspath('.')).replace(os.sep, '/')
+        response = Response(mimetype=mimetype or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = f"{Config.ACCEL_REDIRECT_PREFIX.rstrip('/')}/{relative}"
+        response.set_etag(etag)
+        response.last_modified = st.st_mtime
+        response.cache_control.max_age = max_age
+        return response
+
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        conditional=True,
+        etag=etag,
+        last_modified=st.st_mtime,
+        max_age=max_age,
+    )
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,237 @@
+"""
+Потоковый приём загрузок: декодирование в PCM, хеш и статистика на лету
+"""
+
+import hashlib
+import io
+import os
+import subprocess
+import threading
+import wave
+import numpy as np
+from config import Config
+
+
+class UploadTooLarge(Exception):
+    """Загрузка превышает Config.MAX_UPLOAD_MB"""
+
+
+class PcmStats:
+    """Накопительная статистика 16-bit PCM: пик, RMS и доля звучащих блоков"""
+
+    def __init__(self, rate, block_ms=50, active_threshold=0.003):
+        self.block = rate * block_ms // 1000
+        self.active_threshold = active_threshold
+        self.peak = 0
+        self.sum_squares = 0.0
+        self.samples = 0
+        self.blocks = 0
+        self.active_blocks = 0
+        self._tail = np.zeros(0, dtype=np.int16)
+
+    def update(self, samples):
+        if not len(samples):
+            return
+        self.peak = max(self.peak, int(np.abs(samples.astype(np.int32)).max()))
+        self.sum_squares += float(np.square(samples, dtype=np.float64).sum())
+        self.samples += len(samples)
+
+        # Доля блоков громче порога — грубый признак наличия музыки
+        data = np.concatenate((self._tail, samples)) if len(self._tail) else samples
+        full = len(data) // self.block * self.block
+        if full:
+            blocks = data[:full].reshape(-1, self.block).astype(np.float64) / 32768.0
+            rms = np.sqrt(np.mean(blocks * blocks, axis=1))
+            self.blocks += len(rms)
+            self.active_blocks += int(np.count_nonzero(rms > self.active_threshold))
+        self._tail = data[full:].copy()
+
+    def as_dict(self):
+        rms = (self.sum_squares / self.samples) ** 0.5 / 32768.0 if self.samples else 0.0
+        return {
+            'peak': round(self.peak / 32768.0, 5),
+            'rms': round(rms, 5),
+            'active_ratio': round(self.active_blocks / self.blocks, 3) if self.blocks else 0.0,
+        }
+
+    @property
+    def silent(self):
+        return self.peak < Config.SILENCE_PEAK * 32768
+
+
+class PcmDecoder:
+    """
+    ffmpeg как потоковый декодер: сжатые байты на stdin,
+    16-bit mono PCM с нужной частотой на stdout.
+    """
+
+    def __init__(self, rate=None, channels=1):
+        self.rate = rate or Config.RECOGNITION_RATE
+        self.channels = channels
+        self.stats = PcmStats(self.rate)
+        self._pcm = bytearray()
+        self._odd = b''
+        self._lock = threading.Lock()
+        self._proc = subprocess.Popen(
+            ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+             '-f', 's16le', '-ac', str(channels), '-ar', str(self.rate), 'pipe:1'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        self._stderr = b''
+        self._reader = threading.Thread(target=self._read_output, daemon=True)
+        self._reader.start()
+        self._errors = threading.Thread(target=self._read_errors, daemon=True)
+        self._errors.start()
+
+    def _read_output(self):
+        while True:
+            chunk = self._proc.stdout.read1(65536)
+            if not chunk:
+                break
+            self._on_pcm(chunk)
+
+    def _read_errors(self):
+        self._stderr = self._proc.stderr.read()
+
+    def _on_pcm(self, chunk):
+        data = self._odd + chunk
+        usable = len(data) - len(data) % 2
+        self._odd = data[usable:]
+        with self._lock:
+            self._pcm.extend(data[:usable])
+        self.stats.update(np.frombuffer(data[:usable], dtype=np.int16))
+
+    def feed(self, data):
+        self._proc.stdin.write(data)
+
+    def pcm_snapshot(self):
+        """Копия уже декодированного PCM (для частичного распознавания)"""
+        with self._lock:
+            return bytes(self._pcm)
+
+    @property
+    def decoded_seconds(self):
+        with self._lock:
+            return len(self._pcm) / 2 / self.channels / self.rate
+
+    def close(self):
+        """Закрывает вход и ждёт конца декодирования; возвращает весь PCM"""
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._reader.join()
+        self._errors.join()
+        code = self._proc.wait()
+        if code != 0:
+            message = self._stderr.decode(errors='replace').strip()[-300:]
+            raise Exception(f"ffmpeg не смог декодировать поток: {message}")
+        return bytes(self._pcm)
+
+    def abort(self):
+        self._proc.kill()
+        self._proc.wait()
+
+
+class IngestResult:
+    """
+    Результат приёма: PCM в памяти плюс метаданные исходного файла.
+    Без декодирования pcm, rate и stats равны None - есть только оригинал.
+    """
+
+    def __init__(self, pcm, rate, sha256, size, stats, path=None, content_type=None):
+        self.pcm = pcm
+        self.rate = rate
+        self.sha256 = sha256
+        self.size = size
+        self.stats = stats
+        self.path = path
+        self.content_type = content_type
+
+    @property
+    def decoded(self):
+        return self.pcm is not None
+
+    @property
+    def duration(self):
+        if self.pcm is None:
+            return None
+        return len(self.pcm) / 2 / self.rate
+
+    def wav_bytes(self):
+        return pcm_to_wav_bytes(self.pcm, self.rate)
+
+
+def pcm_to_wav_bytes(pcm, rate, channels=1):
+    """Заворачивает 16-bit PCM в WAV-контейнер в памяти"""
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(pcm)
+    return buf.getvalue()
+
+
+def file_sha256(path, chunk_size=65536):
+    """sha256 файла, читая его кусками"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def ingest_stream(stream, tee_path=None, max_bytes=None, chunk_size=65536, decode=True,
+                  content_type=None):
+    """
+    Читает загрузку кусками и одновременно:
+    - декодирует её через ffmpeg в 16-bit mono PCM (если decode),
+    - считает sha256,
+    - сохраняет исходные (сжатые) байты в tee_path, если указан.
+    При превышении max_bytes бросает UploadTooLarge.
+    """
+    if not decode and not tee_path:
+        raise ValueError("Без декодирования нужен tee_path")
+    max_bytes = max_bytes or Config.MAX_UPLOAD_MB * 1024 * 1024
+    digest = hashlib.sha256()
+    decoder = PcmDecoder() if decode else None
+    tee = open(tee_path, 'wb') if tee_path else None
+    size = 0
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"Файл больше {max_bytes // 1024 // 1024} MB")
+            digest.update(chunk)
+            if tee:
+                tee.write(chunk)
+            if decoder:
+                decoder.feed(chunk)
+        if size == 0:
+            raise Exception("Пустая загрузка")
+        pcm = decoder.close() if decoder else None
+    except BaseException:
+        if decoder:
+            decoder.abort()
+        if tee:
+            tee.close()
+            tee = None
+            os.remove(tee_path)
+        raise
+    finally:
+        if tee:
+            tee.close()
+
+    if decoder is None:
+        print(f"📥 Принято {size} байт без декодирования ({content_type})")
+        return IngestResult(None, None, digest.hexdigest(), size, None, tee_path, content_type)
+
+    stats = decoder.stats.as_dict()
+    stats['silent'] = decoder.stats.silent
+    print(f"📥 Принято {size} байт, {len(pcm) / 2 / decoder.rate:.1f}с PCM, "
+          f"пик {stats['peak'] * 100:.1f}%, звук в {stats['active_ratio'] * 100:.0f}% блоков")
+    return IngestResult(pcm, decoder.rate, digest.hexdigest(), size, stats, tee_path, content_type)
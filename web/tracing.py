@@ -0,0 +1,234 @@
+"""
+Трассировка отдельных запросов: вложенные спаны с атрибутами,
+кольцевой буфер последних трасс и профайлер медленных запросов
+"""
+
+import collections
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from config import Config
+
+
+_current = contextvars.ContextVar('tracing_span', default=None)
+
+
+class Span:
+    """Участок работы: имя, атрибуты, длительность и вложенные спаны"""
+
+    def __init__(self, name, trace, attrs=None):
+        self.name = name
+        self.trace = trace
+        self.attrs = dict(attrs or {})
+        self.children = []
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+        self._t0 = time.perf_counter()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def elapsed(self):
+        return time.perf_counter() - self._t0
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'start': round(self.start, 6),
+            'duration': round(self.duration, 4) if self.duration is not None else None,
+            'attrs': self.attrs,
+            'error': self.error,
+            'children': [child.to_dict() for child in self.children],
+        }
+
+
+class Trace:
+    """Дерево спанов одного запроса или задачи"""
+
+    def __init__(self, name, attrs=None):
+        self.id = uuid.uuid4().hex[:16]
+        self.thread_id = threading.get_ident()
+        self.root = Span(name, self, attrs)
+        self.samples = collections.Counter()  # свёрнутый стек -> число выборок
+        self._lock = threading.Lock()
+
+    def add_sample(self, stack):
+        with self._lock:
+            self.samples[stack] += 1
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'name': self.root.name,
+            'start': round(self.root.start, 6),
+            'duration': round(self.root.duration, 4) if self.root.duration is not None else None,
+            'error': self.root.error,
+            'profiled': bool(self.samples),
+        }
+
+    def to_dict(self):
+        data = self.summary()
+        data['spans'] = self.root.to_dict()
+        if self.samples:
+            with self._lock:
+                top = self.samples.most_common(Config.TRACE_PROFILE_TOP)
+                total = sum(self.samples.values())
+            data['profile'] = {
+                'interval': Config.TRACE_PROFILE_INTERVAL,
+                'samples': total,
+                'stacks': [{'stack': stack, 'count': count} for stack, count in top],
+            }
+        return data
+
+
+class _NullSpan:
+    """Заглушка для annotate() вне трассы"""
+
+    def set(self, **attrs):
+        pass
+
+
+class SlowRequestProfiler:
+    """
+    Сэмплирующий профайлер: раз в interval секунд снимает стек потоков,
+    чьи трассы идут дольше threshold секунд. Быстрые запросы не затрагивает.
+    """
+
+    def __init__(self, tracer, threshold, interval):
+        self.tracer = tracer
+        self.threshold = threshold
+        self.interval = interval
+        self._thread = None
+        self._wake = threading.Event()
+
+    def notify(self):
+        if self.threshold <= 0:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name='trace-profiler', daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            active = self.tracer.active()
+            if not active:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            time.sleep(self.interval)
+            slow = [t for t in active if t.root.elapsed() >= self.threshold]
+            if not slow:
+                continue
+            frames = sys._current_frames()
+            for trace in slow:
+                frame = frames.get(trace.thread_id)
+                if frame is not None:
+                    trace.add_sample(self._collapse(frame))
+
+    @staticmethod
+    def _collapse(frame, depth=40):
+        """Стек в формате flamegraph: внешний;...;внутренний"""
+        parts = []
+        while frame is not None and len(parts) < depth:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(parts))
+
+
+class Tracer:
+    """Выдаёт спаны и хранит последние завершённые трассы"""
+
+    def __init__(self, capacity=None, profile_threshold=None, profile_interval=None):
+        self._traces = collections.deque(maxlen=capacity or Config.TRACE_BUFFER_SIZE)
+        self._active = {}  # id трассы -> Trace
+        self._lock = threading.Lock()
+        self.profiler = SlowRequestProfiler(
+            self,
+            Config.TRACE_PROFILE_THRESHOLD if profile_threshold is None else profile_threshold,
+            profile_interval or Config.TRACE_PROFILE_INTERVAL,
+        )
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """
+        Вложенный спан текущей трассы.
+        Вне трассы открывает новую - корнем становится этот спан.
+        """
+        parent = _current.get()
+        if parent is None:
+            trace = Trace(name, attrs)
+            span = trace.root
+            with self._lock:
+                self._active[trace.id] = trace
+            self.profiler.notify()
+        else:
+            span = Span(name, parent.trace, attrs)
+            parent.children.append(span)
+
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration = span.elapsed()
+            _current.reset(token)
+            if parent is None:
+                with self._lock:
+                    self._active.pop(span.trace.id, None)
+                    self._traces.append(span.trace)
+
+    def active(self):
+        with self._lock:
+            return list(self._active.values())
+
+    def recent(self, limit=20, min_duration=0):
+        """Последние завершённые трассы, новые первыми"""
+        with self._lock:
+            traces = list(self._traces)
+        traces = [t for t in reversed(traces) if t.root.duration >= min_duration]
+        return traces[:limit]
+
+    def get(self, trace_id):
+        with self._lock:
+            for trace in self._traces:
+                if trace.id == trace_id:
+                    return trace
+            return self._active.get(trace_id)
+
+
+tracer = Tracer()
+
+
+def span(name, **attrs):
+    return tracer.span(name, **attrs)
+
+
+def current():
+    """Текущий спан (или заглушка, если трассы нет)"""
+    return _current.get() or _NullSpan()
+
+
+def annotate(**attrs):
+    """Добавляет атрибуты к текущему спану"""
+    current().set(**attrs)
+
+
+def traced(name=None):
+    """Декоратор: вызов функции - спан с её именем"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
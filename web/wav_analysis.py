@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Анализ WAV записей: пик, RMS, шумовой фон, SNR, клиппинг, DC-смещение
+и грубый спектр по октавам.
+
+Файл не читается целиком: блок data отображается в память (np.memmap) и
+обходится блоками фиксированной длины, так что час записи стоит столько же
+памяти, сколько секунда. Уровни - доли полной шкалы (0..1), dBFS - от неё же.
+
+Каталог разбирается параллельно по ядрам (ProcessPoolExecutor), результат -
+JSON.
+
+Использование:
+    python3 wav_analysis.py recordings/recording_20250101_120000.wav
+    python3 wav_analysis.py recordings/ --workers 4 --out report.json
+    python3 wav_analysis.py recordings/ --recursive --blocks
+"""
+
+import argparse
+import glob
+import json
+import os
+import struct
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+
+BLOCK_SECONDS = 1.0  # блок обхода файла и строка в поблочном отчёте
+FRAME = 2048  # кадр для шумового фона и спектра
+NOISE_PERCENTILE = 10  # тише этого процентиля кадров - фон
+SIGNAL_PERCENTILE = 95  # громче - полезный сигнал
+CLIP_LEVEL = 0.999  # отсчёт на полной шкале - клиппинг
+OCTAVE_EDGES_HZ = (31.25, 62.5, 125, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+CHANNEL_PROBE = 100000  # отсчётов на выбор живого канала
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# offset - смещение блока data в файле, frames - кадров (отсчётов на канал)
+WavInfo = namedtuple('WavInfo', ['rate', 'channels', 'width', 'format', 'offset', 'frames'])
+
+_WINDOW = np.hanning(FRAME).astype(np.float32)
+
+
+def read_header(path):
+    """Разбирает RIFF-заголовок: параметры и положение блока data"""
+    with open(path, 'rb') as f:
+        riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            raise ValueError('Не WAV файл')
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise ValueError('В файле нет блока data')
+            chunk_id, size = struct.unpack('<4sI', chunk)
+            if chunk_id == b'data':
+                offset = f.tell()
+                break
+            body = f.read(size + size % 2)
+            if chunk_id == b'fmt ':
+                tag, channels, rate, _, _, bits = struct.unpack('<HHIIHH', body[:16])
+                if tag == WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                    tag = struct.unpack('<H', body[24:26])[0]
+                fmt = (tag, channels, rate, (bits + 7) // 8)
+
+    if fmt is None:
+        raise ValueError('В файле нет блока fmt')
+    tag, channels, rate, width = fmt
+    if tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_FLOAT) or (tag == WAVE_FORMAT_FLOAT and width != 4):
+        raise ValueError(f'Неподдерживаемый формат WAV: {tag}')
+    if width not in (1, 2, 3, 4):
+        raise ValueError(f'Неподдерживаемая разрядность WAV: {width * 8} bit')
+
+    # Прерванный arecord оставляет в заголовке 0 или максимум - верим размеру файла
+    available = os.path.getsize(path) - offset
+    if size == 0 or size > available:
+        size = available
+    frames = size // (width * channels)
+    return WavInfo(rate, channels, width, tag, offset, frames)
+
+
+def open_wav(path):
+    """(WavInfo, отсчёты в памяти-отображении формы (кадры, каналы[, 3]))"""
+    info = read_header(path)
+    if info.width == 3:
+        dtype, shape = np.uint8, (info.frames, info.channels, 3)
+    else:
+        dtype = {1: np.uint8, 2: '<i2', 4: '<f4' if info.format == WAVE_FORMAT_FLOAT else '<i4'}[info.width]
+        shape = (info.frames, info.channels)
+    if info.frames == 0:
+        return info, np.zeros(shape, dtype=dtype)
+    return info, np.memmap(path, dtype=dtype, mode='r', offset=info.offset, shape=shape)
+
+
+def to_float(samples, info):
+    """Отсчёты одного канала -> float32 в долях полной шкалы"""
+    if info.format == WAVE_FORMAT_FLOAT:
+        return np.asarray(samples, dtype=np.float32)
+    if info.width == 1:
+        return (samples.astype(np.float32) - 128.0) / 128.0
+    if info.width == 3:
+        b = samples.astype(np.uint32)
+        joined = ((b[:, 0] << 8) | (b[:, 1] << 16) | (b[:, 2] << 24)).view(np.int32)
+        return joined.astype(np.float32) / 2.0 ** 31
+    return samples.astype(np.float32) / float(2 ** (info.width * 8 - 1))
+
+
+def live_channel(data, info):
+    """Канал с наибольшим RMS (у I2S-микрофона второй канал - нули)"""
+    if info.channels == 1 or info.frames == 0:
+        return 0
+    step = max(1, info.frames // CHANNEL_PROBE)
+    levels = [float(np.mean(to_float(data[::step, ch], info) ** 2)) for ch in range(info.channels)]
+    return int(np.argmax(levels))
+
+
+def dbfs(level):
+    return round(float(20 * np.log10(level)), 2) if level > 0 else None
+
+
+def analyze(path, block_seconds=BLOCK_SECONDS, channel=None, blocks=True):
+    """
+    Сводка по файлу (словарь, сериализуемый в JSON).
+    channel=None - берётся живой канал; blocks - поблочные rms/peak.
+    """
+    info, data = open_wav(path)
+    result = {
+        'path': path,
+        'rate': info.rate,
+        'channels': info.channels,
+        'bits': info.width * 8,
+        'frames': info.frames,
+        'duration': round(info.frames / info.rate, 3) if info.rate else 0.0,
+    }
+    if info.frames == 0:
+        result['empty'] = True
+        return result
+
+    if channel is None:
+        channel = live_channel(data, info)
+    block = max(1, int(info.rate * block_seconds))
+    freqs = np.fft.rfftfreq(FRAME, 1.0 / info.rate)
+    power = np.zeros(len(freqs))
+    frame_rms = []
+    per_block = []
+    total = total_sq = 0.0
+    peak = 0.0
+    clipped = 0
+
+    for start in range(0, info.frames, block):
+        x = to_float(data[start:start + block, channel], info)
+        sq = float(np.dot(x, x))
+        block_peak = float(np.abs(x).max())
+        total += float(x.sum(dtype=np.float64))
+        total_sq += sq
+        peak = max(peak, block_peak)
+        clipped += int(np.count_nonzero(np.abs(x) >= CLIP_LEVEL))
+        if blocks:
+            per_block.append({'t': round(start / info.rate, 3),
+                              'rms': float(np.sqrt(sq / len(x))), 'peak': block_peak})
+
+        n = len(x) // FRAME
+        if n:
+            frames = x[:n * FRAME].reshape(n, FRAME)
+            frame_rms.append(np.sqrt(np.mean(frames * frames, axis=1)))
+            power += (np.abs(np.fft.rfft(frames * _WINDOW, axis=1)) ** 2).sum(axis=0)
+
+    rms = float(np.sqrt(total_sq / info.frames))
+    result.update({
+        'channel': channel,
+        'peak': peak,
+        'peak_dbfs': dbfs(peak),
+        'rms': rms,
+        'rms_dbfs': dbfs(rms),
+        'dc_offset': total / info.frames,
+        'clipped': clipped,
+        'clipped_ratio': clipped / info.frames,
+    })
+
+    if frame_rms:
+        frame_rms = np.concatenate(frame_rms)
+        noise = float(np.percentile(frame_rms, NOISE_PERCENTILE))
+        signal = float(np.percentile(frame_rms, SIGNAL_PERCENTILE))
+        result['noise_floor_dbfs'] = dbfs(noise)
+        result['snr_db'] = round(float(20 * np.log10(signal / noise)), 2) if noise > 0 and signal > 0 else None
+        result['spectrum'] = spectrum(freqs, power)
+    if blocks:
+        result['blocks'] = per_block
+    return result
+
+
+def spectrum(freqs, power):
+    """Доля энергии по октавам, dB относительно всей энергии"""
+    total = power.sum()
+    bands = []
+    for low, high in zip(OCTAVE_EDGES_HZ, OCTAVE_EDGES_HZ[1:]):
+        if low >= freqs[-1]:
+            break
+        share = float(power[(freqs >= low) & (freqs < high)].sum() / total) if total > 0 else 0.0
+        bands.append({'low': low, 'high': high,
+                      'db': round(float(10 * np.log10(share)), 2) if share > 0 else None})
+    return bands
+
+
+def _analyze_safe(path, blocks=False):
+    """Для пула процессов: ошибка одного файла не роняет весь разбор"""
+    try:
+        return analyze(path, blocks=blocks)
+    except Exception as e:
+        return {'path': path, 'error': str(e)}
+
+
+def find_wavs(directory, recursive=False):
+    pattern = os.path.join(directory, '**', '*.wav') if recursive else os.path.join(directory, '*.wav')
+    return sorted(glob.glob(pattern, recursive=recursive))
+
+
+def analyze_many(paths, workers=None, blocks=False):
+    """Разбирает файлы параллельно по ядрам; порядок результатов - как у paths"""
+    paths = list(paths)
+    if not paths:
+        return []
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers == 1:
+        return [_analyze_safe(p, blocks) for p in paths]
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_analyze_safe, paths, [blocks] * len(paths), chunksize=chunksize))
+
+
+def report(paths, workers=None, blocks=False):
+    """Сводный отчёт по файлам для JSON"""
+    start = time.perf_counter()
+    results = analyze_many(paths, workers, blocks)
+    return {
+        'files': len(results),
+        'errors': sum(1 for r in results if 'error' in r),
+        'seconds': round(time.perf_counter() - start, 3),
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Анализ WAV записей')
+    parser.add_argument('paths', nargs='+', help='WAV файлы или каталоги')
+    parser.add_argument('--recursive', action='store_true', help='искать WAV в подкаталогах')
+    parser.add_argument('--workers', type=int, default=None, help='процессов (по умолчанию - по числу ядер)')
+    parser.add_argument('--blocks', action='store_true', help='добавить поблочные rms/peak')
+    parser.add_argument('--out', help='записать JSON в файл, а не в stdout')
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.paths:
+        paths.extend(find_wavs(path, args.recursive) if os.path.isdir(path) else [path])
+    if not paths:
+        print('❌ WAV файлы не найдены', file=sys.stderr)
+        sys.exit(1)
+
+    text = json.dumps(report(paths, args.workers, args.blocks), ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f'✓ {len(paths)} файлов, отчёт: {args.out}', file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()